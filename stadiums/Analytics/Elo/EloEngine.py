@@ -0,0 +1,235 @@
+## built-ins ##
+import math
+from typing import Dict, List, Optional
+
+## external ##
+import pandas as pd
+import numpy
+
+
+class EloEngine:
+    '''
+    Array backed implementation of the EloModel game loop. Teams are
+    translated to integer indices, Elo state is held in float arrays, and
+    the game loop walks pre-extracted columns rather than dataframe rows.
+
+    The arithmetic mirrors EloModel.project and EloModel.process operation
+    for operation so that the emitted projections are identical
+    '''
+    def __init__(self, conf: Dict, teams: List[str], ratings: Optional[pd.DataFrame] = None):
+        self.conf = conf
+        self.teams = list(teams)
+        self.team_index = {team: i for i, team in enumerate(self.teams)}
+        ## elo state ##
+        self.elos = numpy.full(len(self.teams), float(conf['elo_init']), dtype=numpy.float64)
+        ## a season / week of -1 represents a team that has not played yet ##
+        self.last_game_seasons = numpy.full(len(self.teams), -1, dtype=numpy.int64)
+        self.last_game_weeks = numpy.full(len(self.teams), -1, dtype=numpy.int64)
+        ## pre season ratings ##
+        self.ratings_first_season, self.ratings = (
+            self.gen_ratings_array(ratings) if ratings is not None
+            else (0, numpy.full((0, len(self.teams)), numpy.nan))
+        )
+
+    def set_state(self, current_elos: Dict):
+        '''
+        Seed the engine state from an EloModel style current_elos dict, ie
+        when resuming from a checkpoint. Teams not in the engine are ignored
+        '''
+        for team, state in current_elos.items():
+            idx = self.team_index.get(team)
+            if idx is None:
+                continue
+            self.elos[idx] = state['elo']
+            if state['last_game_season'] is not None:
+                self.last_game_seasons[idx] = state['last_game_season']
+                self.last_game_weeks[idx] = state['last_game_week']
+
+    def gen_ratings_array(self, ratings: pd.DataFrame):
+        '''
+        Generate a season x team array of win total ratings so ratings can be
+        retrieved for every game with a single take. Missing team/season
+        combos are NaN, and default to elo_init when the engine runs
+        '''
+        ratings = ratings[ratings['team'].isin(self.team_index)]
+        if len(ratings) == 0:
+            return 0, numpy.full((0, len(self.teams)), numpy.nan)
+        seasons = ratings['season'].to_numpy(dtype=numpy.int64)
+        first_season = int(seasons.min())
+        arr = numpy.full(
+            (int(seasons.max()) - first_season + 1, len(self.teams)),
+            numpy.nan,
+            dtype=numpy.float64
+        )
+        ## later duplicates overwrite earlier ones, matching the dict lookup ##
+        arr[
+            seasons - first_season,
+            ratings['team'].map(self.team_index).to_numpy(dtype=numpy.int64)
+        ] = ratings['wt_rating_elo'].to_numpy(dtype=numpy.float64)
+        return first_season, arr
+
+    def lookup_wt_ratings(self, team_idx: numpy.ndarray, seasons: numpy.ndarray) -> numpy.ndarray:
+        '''
+        Vectorized win total rating lookup for arrays of team indices and seasons.
+        Missing ratings are NaN
+        '''
+        out = numpy.full(len(team_idx), numpy.nan, dtype=numpy.float64)
+        season_idx = seasons - self.ratings_first_season
+        in_range = (season_idx >= 0) & (season_idx < self.ratings.shape[0])
+        out[in_range] = self.ratings[season_idx[in_range], team_idx[in_range]]
+        return out
+
+    def team_indices(self, teams: pd.Series) -> numpy.ndarray:
+        '''
+        Translate a column of team abbreviations into engine indices
+        '''
+        idx = teams.map(self.team_index)
+        if idx.isnull().any():
+            raise ValueError('Games contain teams that are not in the engine: {0}'.format(
+                ', '.join(sorted(teams[idx.isnull()].astype(str).unique()))
+            ))
+        return idx.to_numpy(dtype=numpy.int64)
+
+    def game_arrays(self, games: pd.DataFrame) -> Dict[str, numpy.ndarray]:
+        '''
+        Extract the columns the game loop reads into arrays. The arrays do not
+        depend on the conf, so they can be reused across runs with different confs
+
+        Parameters:
+        * games: pd.DataFrame -- played games with home_team, away_team, season,
+        week, result, home_qb_adj, and away_qb_adj
+
+        Returns:
+        * arrays: Dict[str, numpy.ndarray] -- home_idx, away_idx, season, week,
+        result, home_qb, away_qb, home_wt, and away_wt, where missing win total
+        ratings are NaN
+        '''
+        home_idx = self.team_indices(games['home_team'])
+        away_idx = self.team_indices(games['away_team'])
+        seasons = games['season'].to_numpy(dtype=numpy.int64)
+        return {
+            'home_idx': home_idx,
+            'away_idx': away_idx,
+            'season': seasons,
+            'week': games['week'].to_numpy(dtype=numpy.int64),
+            'result': games['result'].to_numpy(dtype=numpy.float64),
+            'home_qb': games['home_qb_adj'].to_numpy(dtype=numpy.float64),
+            'away_qb': games['away_qb_adj'].to_numpy(dtype=numpy.float64),
+            'home_wt': self.lookup_wt_ratings(home_idx, seasons),
+            'away_wt': self.lookup_wt_ratings(away_idx, seasons)
+        }
+
+    def run(self, games: pd.DataFrame) -> Dict[str, numpy.ndarray]:
+        '''
+        Project and process every game in order, advancing the engine state
+
+        Parameters:
+        * games: pd.DataFrame -- played games with home_team, away_team, season,
+        week, result, home_qb_adj, and away_qb_adj
+
+        Returns:
+        * projections: Dict[str, numpy.ndarray] -- home_elo, away_elo, elo_dif,
+        home_wp, and home_expected_margin for each game
+        '''
+        return self.run_arrays(self.game_arrays(games))
+
+    def run_arrays(self, arrays: Dict[str, numpy.ndarray]) -> Dict[str, numpy.ndarray]:
+        '''
+        Project and process every game in a set of game_arrays, advancing the
+        engine state. Arrays are only read, so they can be shared across runs
+        '''
+        n = len(arrays['home_idx'])
+        elo_init = self.conf['elo_init']
+        ## pre-extract columns as python scalars for the loop ##
+        home_wt = numpy.where(numpy.isnan(arrays['home_wt']), float(elo_init), arrays['home_wt']).tolist()
+        away_wt = numpy.where(numpy.isnan(arrays['away_wt']), float(elo_init), arrays['away_wt']).tolist()
+        seasons = arrays['season'].tolist()
+        weeks = arrays['week'].tolist()
+        results = arrays['result'].tolist()
+        home_qb = arrays['home_qb'].tolist()
+        away_qb = arrays['away_qb'].tolist()
+        home_idx = arrays['home_idx'].tolist()
+        away_idx = arrays['away_idx'].tolist()
+        ## outputs ##
+        out_home_elo = numpy.empty(n, dtype=numpy.float64)
+        out_away_elo = numpy.empty(n, dtype=numpy.float64)
+        out_elo_dif = numpy.empty(n, dtype=numpy.float64)
+        out_wp = numpy.empty(n, dtype=numpy.float64)
+        out_margin = numpy.empty(n, dtype=numpy.float64)
+        ## conf as locals ##
+        k = self.conf['k']
+        z = self.conf['z']
+        b = self.conf['b']
+        ## normalized reversion weights, as in EloModel.off_season_reversion ##
+        wt_weight = self.conf['wt_weight']
+        league_weight = self.conf['reversion']
+        current_weight = 1 - (wt_weight + league_weight)
+        combined_weight = wt_weight + league_weight + current_weight
+        wt_weight = wt_weight / combined_weight
+        league_weight = league_weight / combined_weight
+        current_weight = current_weight / combined_weight
+        ## state as locals ##
+        elos = self.elos
+        last_seasons = self.last_game_seasons
+        last_weeks = self.last_game_weeks
+        for i in range(n):
+            h = home_idx[i]
+            a = away_idx[i]
+            season = seasons[i]
+            home_base = float(elos[h])
+            away_base = float(elos[a])
+            ## off season reversion ##
+            home_elo = home_base
+            if season != last_seasons[h]:
+                home_elo = (
+                    wt_weight * home_wt[i] +
+                    league_weight * elo_init +
+                    current_weight * home_base
+                )
+            away_elo = away_base
+            if season != last_seasons[a]:
+                away_elo = (
+                    wt_weight * away_wt[i] +
+                    league_weight * elo_init +
+                    current_weight * away_base
+                )
+            ## project ##
+            elo_dif = (
+                (home_elo + home_qb[i]) -
+                (away_elo + away_qb[i])
+            )
+            wp = 1 / (1 + math.pow(10, -elo_dif / z))
+            ## process ##
+            result = results[i]
+            home_result = 1.0 if result > 0 else 0 if result < 0 else 0.5
+            mult = (
+                math.log(max(abs(result), 1) + 1.0) *
+                (b / (
+                    1.0 if home_result == 0.5
+                    else (
+                        (elo_dif if home_result == 1.0 else -elo_dif) *
+                        0.001 +
+                        b
+                    )
+                ))
+            )
+            home_shift = (k * mult) * (home_result - wp)
+            elos[h] = home_base + home_shift
+            elos[a] = away_base + -1 * home_shift
+            last_seasons[h] = season
+            last_seasons[a] = season
+            last_weeks[h] = weeks[i]
+            last_weeks[a] = weeks[i]
+            ## write projections ##
+            out_home_elo[i] = home_elo
+            out_away_elo[i] = away_elo
+            out_elo_dif[i] = elo_dif
+            out_wp[i] = wp
+            out_margin[i] = elo_dif / 25
+        return {
+            'home_elo': out_home_elo,
+            'away_elo': out_away_elo,
+            'elo_dif': out_elo_dif,
+            'home_wp': out_wp,
+            'home_expected_margin': out_margin
+        }
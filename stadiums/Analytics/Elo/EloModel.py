@@ -1,32 +1,65 @@
 ## built-ins ##
+import os
 import json
 import pathlib
 import math
+import hashlib
+from typing import Dict, List, Optional
 
 ## external ##
 import pandas as pd
 
 ## internal ##
 from ...DataLoader import data
+from ...Instrumentation import instrument
+from .EloEngine import EloEngine
+from .EloBatchEngine import EloBatchEngine
+
+## bump when the model logic changes so existing checkpoints are replayed ##
+CHECKPOINT_VERSION = 2
+## game columns that feed the model. Changes to any of these in already
+## processed games invalidate the checkpoint
+CHECKPOINT_COLUMNS = [
+    'game_id', 'season', 'week', 'game_type', 'location',
+    'home_team', 'away_team', 'stadium_id', 'result',
+    'home_qb_adj', 'away_qb_adj'
+]
 
 class EloModel:
     '''
     Simple Elo model to calculate expected team values for an opponent
     adjusted home field advantage
+
+    By default, the end state of each run is saved to a checkpoint, and later
+    runs resume from it, only processing games played since. The model falls
+    back to a full replay if the conf, the model version, or any already
+    processed game or pre-season rating has changed
+
+    The checkpoint is a folder with a small state.json and one recs file per
+    season, written one rec per line. Files are only rewritten when their
+    content changes, so a weekly run only touches state.json and the current
+    season's recs
     '''
-    def __init__(self):
+    def __init__(self, use_checkpoint: bool = True):
         self.loc = pathlib.Path(__file__).parent.resolve()
+        self.use_checkpoint = use_checkpoint
+        self.checkpoint_loc = '{0}/checkpoint'.format(self.loc)
         ## load conf ##
         self.conf = {}
         with open('{0}/conf.json'.format(self.loc), 'r') as f:
             self.conf = json.load(f)
+        self.conf_hash = hashlib.sha256(
+            json.dumps(self.conf, sort_keys=True).encode('utf-8')
+        ).hexdigest()
         self.games = data.db['games'][
             ## played games with a stadium id only ##
             (~pd.isnull(data.db['games']['result'])) &
             (~pd.isnull(data.db['games']['stadium_id']))
-        ].copy()
+        ]
         self.pre_season_ratings = self.gen_ratings_dict(data.db['wt_ratings'].copy())
-        self.teams = self.games['home_team'].unique().tolist()
+        self.teams = pd.unique(pd.concat([
+            self.games['home_team'], self.games['away_team']
+        ])).tolist()
         self.current_elos = self.init_elos()
         self.recs = []
 
@@ -178,14 +211,223 @@ class EloModel:
         self.current_elos[row['away_team']]['last_game_season'] = row['season']
         self.current_elos[row['away_team']]['last_game_week'] = row['week']
     
+    def gen_recs(self, games: pd.DataFrame, projections: dict):
+        '''
+        Generate recs from the engine projections for all non-neutral regular
+        season games
+        '''
+        mask = (
+            (games['location'] == 'Home') &
+            (games['game_type'] == 'REG')
+        ).to_numpy()
+        ## python scalars so rounding matches the row based model ##
+        seasons = games['season'].to_numpy()[mask].tolist()
+        weeks = games['week'].to_numpy()[mask].tolist()
+        teams = games['home_team'].to_numpy()[mask].tolist()
+        stadiums = games['stadium_id'].to_numpy()[mask].tolist()
+        results = games['result'].to_numpy(dtype='float64')[mask].tolist()
+        margins = projections['home_expected_margin'][mask].tolist()
+        for season, week, team, stadium, result, margin in zip(
+            seasons, weeks, teams, stadiums, results, margins
+        ):
+            self.recs.append({
+                'season' : season,
+                'week' : week,
+                'team' : team,
+                'stadium' : stadium,
+                'mov' : result,
+                'expected_mov' : round(margin, 3),
+                'error' : round(result - margin, 3)
+            })
+
+    def sync_current_elos(self, engine: EloEngine):
+        '''
+        Copy the end state of the engine back to current_elos
+        '''
+        for team, idx in engine.team_index.items():
+            played = engine.last_game_seasons[idx] >= 0
+            self.current_elos[team] = {
+                'elo' : float(engine.elos[idx]),
+                'last_game_season' : int(engine.last_game_seasons[idx]) if played else None,
+                'last_game_week' : int(engine.last_game_weeks[idx]) if played else None
+            }
+
+    ###################
+    ## CHECKPOINTING ##
+    ###################
+    def week_keys(self, df: pd.DataFrame):
+        '''
+        Sortable season/week key for each row of a dataframe
+        '''
+        return df['season'].astype('int64') * 100 + df['week'].astype('int64')
+
+    def history_hash(self, last_season: int, last_week: int) -> str:
+        '''
+        Hash of the model inputs through a season and week, ie the games
+        and pre-season ratings a checkpoint at that season and week has consumed
+        '''
+        games = self.games[
+            self.week_keys(self.games) <= last_season * 100 + last_week
+        ][CHECKPOINT_COLUMNS]
+        ratings = data.db['wt_ratings']
+        ratings = ratings[ratings['season'] <= last_season][[
+            'team', 'season', 'wt_rating_elo'
+        ]]
+        hasher = hashlib.sha256()
+        hasher.update(pd.util.hash_pandas_object(games, index=False).to_numpy().tobytes())
+        hasher.update(pd.util.hash_pandas_object(ratings, index=False).to_numpy().tobytes())
+        return hasher.hexdigest()
+
+    def write_file(self, path: str, content: str):
+        '''
+        Write a checkpoint file atomically, only if its content changed
+        '''
+        try:
+            with open(path, 'r') as f:
+                if f.read() == content:
+                    return
+        except OSError:
+            pass
+        tmp_path = '{0}.tmp'.format(path)
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def recs_content(self, recs: List[Dict]) -> str:
+        '''
+        A season's recs as a json list with one rec per line
+        '''
+        return '[\n{0}\n]\n'.format(',\n'.join(json.dumps(rec) for rec in recs))
+
+    def load_checkpoint(self) -> Optional[dict]:
+        '''
+        Load the checkpoint if one exists and is still valid for the current
+        conf and games. Returns None if a full replay is needed
+        '''
+        state_loc = '{0}/state.json'.format(self.checkpoint_loc)
+        if not pathlib.Path(state_loc).exists():
+            return None
+        try:
+            with open(state_loc, 'r') as f:
+                checkpoint = json.load(f)
+            ## conf or model changes invalidate everything ##
+            if (
+                checkpoint.get('version') != CHECKPOINT_VERSION or
+                checkpoint.get('conf_hash') != self.conf_hash
+            ):
+                return None
+            ## recs files must be the ones the state was saved with ##
+            recs = []
+            for season, recs_hash in checkpoint['recs_hashes'].items():
+                with open('{0}/recs/{1}.json'.format(self.checkpoint_loc, season), 'r') as f:
+                    content = f.read()
+                if hashlib.sha256(content.encode('utf-8')).hexdigest() != recs_hash:
+                    return None
+                recs.extend(json.loads(content))
+        except Exception as e:
+            print('Elo checkpoint read error: {0}'.format(e))
+            return None
+        ## processed games must be an unchanged prefix of the current games ##
+        processed = (
+            self.week_keys(self.games) <=
+            checkpoint['last_season'] * 100 + checkpoint['last_week']
+        ).to_numpy()
+        if processed.sum() != checkpoint['games_processed'] or not processed[:processed.sum()].all():
+            return None
+        if self.history_hash(checkpoint['last_season'], checkpoint['last_week']) != checkpoint['history_hash']:
+            return None
+        checkpoint['recs'] = recs
+        return checkpoint
+
+    def save_checkpoint(self):
+        '''
+        Save the end state of the model so later runs can resume from it. The
+        recs files are written before state.json, which holds their hashes, so
+        an interrupted save is caught on the next load
+        '''
+        if len(self.games) == 0:
+            return
+        last = self.games.iloc[int(self.week_keys(self.games).to_numpy().argmax())]
+        last_season = int(last['season'])
+        last_week = int(last['week'])
+        ## recs are in game order, so each season is a contiguous run ##
+        seasons = {}
+        for rec in self.recs:
+            seasons.setdefault(int(rec['season']), []).append(rec)
+        pathlib.Path('{0}/recs'.format(self.checkpoint_loc)).mkdir(parents=True, exist_ok=True)
+        recs_hashes = {}
+        for season, recs in seasons.items():
+            content = self.recs_content(recs)
+            self.write_file('{0}/recs/{1}.json'.format(self.checkpoint_loc, season), content)
+            recs_hashes[str(season)] = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        checkpoint = {
+            'version': CHECKPOINT_VERSION,
+            'conf_hash': self.conf_hash,
+            'last_season': last_season,
+            'last_week': last_week,
+            'games_processed': len(self.games),
+            'history_hash': self.history_hash(last_season, last_week),
+            'current_elos': self.current_elos,
+            'recs_hashes': recs_hashes
+        }
+        self.write_file(
+            '{0}/state.json'.format(self.checkpoint_loc),
+            json.dumps(checkpoint, indent=2, sort_keys=True)
+        )
+
     def run(self):
         '''
-        Run the model
+        Run the model with the array backed engine, resuming from the
+        checkpoint when possible
+        '''
+        with instrument.stage('load_checkpoint'):
+            checkpoint = self.load_checkpoint() if self.use_checkpoint else None
+        games = self.games
+        if checkpoint is not None:
+            ## restore state and only process games after the checkpoint ##
+            self.recs = checkpoint['recs']
+            self.current_elos.update(checkpoint['current_elos'])
+            games = self.games.iloc[checkpoint['games_processed']:]
+        with instrument.stage('engine') as stage:
+            stage.rows = len(games)
+            engine = EloEngine(
+                self.conf,
+                list(self.current_elos.keys()),
+                data.db['wt_ratings']
+            )
+            engine.set_state(self.current_elos)
+            projections = engine.run(games)
+        with instrument.stage('gen_recs') as stage:
+            self.gen_recs(games, projections)
+            self.sync_current_elos(engine)
+            stage.rows = len(self.recs)
+        if self.use_checkpoint:
+            with instrument.stage('save_checkpoint'):
+                self.save_checkpoint()
+
+    def run_batch(self, confs: List[Dict]) -> Dict:
+        '''
+        Run every game for many confs in a single vectorized pass. This does
+        not change the model state, recs, or checkpoint
+
+        Parameters:
+        * confs: List[Dict] - full confs, ie conf.json with some values changed
+
+        Returns:
+        * projections: Dict - elo_dif, home_wp, and home_expected_margin as
+        games x confs arrays, in the order of self.games
+        '''
+        engine = EloBatchEngine(confs, self.teams, data.db['wt_ratings'])
+        return engine.run(self.games)
+
+    def run_rows(self):
+        '''
+        Run the model row by row with project and process. This is the
+        reference implementation for the engine and is only used for
+        validation and benchmarking
         '''
         for index, row in self.games.iterrows():
             ## project the game ##
-            row = self.project(row) 
+            row = self.project(row)
             ## process the game ##
             self.process(row)
-        
-    
\ No newline at end of file
@@ -0,0 +1,332 @@
+## built-ins ##
+import os
+import itertools
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+## external ##
+import pandas as pd
+import numpy
+
+## internal ##
+from ...DataLoader import data
+from .EloModel import EloModel
+from .EloEngine import EloEngine
+from .EloBatchEngine import EloBatchEngine
+
+## conf keys that can be swept ##
+SWEEP_PARAMS = ['k', 'z', 'b', 'reversion', 'wt_weight', 'elo_init']
+## metrics reported for each conf. All are lower is better except bias ##
+SWEEP_METRICS = ['mae', 'rmse', 'bias', 'rmse_debiased', 'brier', 'log_loss']
+
+def score_projections(
+    projections: Dict[str, numpy.ndarray],
+    result: numpy.ndarray,
+    scored: numpy.ndarray
+) -> List[Dict[str, float]]:
+    '''
+    Score engine projections against results for the scored games
+
+    The model has no home field term, so the mean margin error (bias) is the
+    HFA the analytics measure. rmse_debiased is the error net of that bias
+
+    Parameters:
+    * projections: Dict[str, numpy.ndarray] - output of EloEngine.run_arrays, or
+    games x confs output of EloBatchEngine.run_arrays
+    * result: numpy.ndarray - home margin of each game
+    * scored: numpy.ndarray - bool mask of games to score
+
+    Returns:
+    * metrics: List[Dict[str, float]] - metrics for each conf
+    '''
+    res = result[scored][:, None]
+    margin = projections['home_expected_margin'][scored]
+    wp = projections['home_wp'][scored]
+    if margin.ndim == 1:
+        margin = margin[:, None]
+        wp = wp[:, None]
+    error = res - margin
+    outcome = numpy.where(res > 0, 1.0, numpy.where(res < 0, 0.0, 0.5))
+    wp_clipped = numpy.clip(wp, 1e-12, 1 - 1e-12)
+    metrics = {
+        'mae': numpy.mean(numpy.abs(error), axis=0),
+        'rmse': numpy.sqrt(numpy.mean(error ** 2, axis=0)),
+        'bias': numpy.mean(error, axis=0),
+        'rmse_debiased': numpy.std(error, axis=0),
+        'brier': numpy.mean((wp - outcome) ** 2, axis=0),
+        'log_loss': -numpy.mean(
+            outcome * numpy.log(wp_clipped) + (1 - outcome) * numpy.log(1 - wp_clipped),
+            axis=0
+        )
+    }
+    return [
+        {'games': int(scored.sum()), **{key: float(values[j]) for key, values in metrics.items()}}
+        for j in range(margin.shape[1])
+    ]
+
+###################
+## SHARED MEMORY ##
+###################
+def pack_arrays(arrays: Dict[str, numpy.ndarray]) -> Tuple[shared_memory.SharedMemory, Dict]:
+    '''
+    Copy a dict of arrays into a single shared memory block
+
+    Returns:
+    * shm: SharedMemory - the block, which the caller must close and unlink
+    * layout: Dict - name to (offset, dtype, shape), used to attach the arrays
+    '''
+    layout = {}
+    offset = 0
+    for name, arr in arrays.items():
+        ## align each array to 64 bytes ##
+        offset = (offset + 63) // 64 * 64
+        layout[name] = (offset, arr.dtype.str, arr.shape)
+        offset += arr.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, arr in arrays.items():
+        view = numpy.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, offset=layout[name][0])
+        view[...] = arr
+    return shm, layout
+
+def attach_arrays(shm: shared_memory.SharedMemory, layout: Dict) -> Dict[str, numpy.ndarray]:
+    '''
+    Read only array views over a block created by pack_arrays
+    '''
+    arrays = {}
+    for name, (offset, dtype, shape) in layout.items():
+        arr = numpy.ndarray(shape, dtype=numpy.dtype(dtype), buffer=shm.buf, offset=offset)
+        arr.flags.writeable = False
+        arrays[name] = arr
+    return arrays
+
+## per process state of pool workers ##
+WORKER_STATE = {}
+
+def init_worker(shm_name: str, layout: Dict, teams: List[str]):
+    '''
+    Attach a pool worker to the shared game arrays
+    '''
+    ## workers share the parent's resource tracker, and the parent unlinks the block ##
+    shm = shared_memory.SharedMemory(name=shm_name, create=False)
+    WORKER_STATE['shm'] = shm
+    WORKER_STATE['arrays'] = attach_arrays(shm, layout)
+    WORKER_STATE['teams'] = teams
+
+def run_confs(
+    confs: List[Dict],
+    arrays: Optional[Dict[str, numpy.ndarray]] = None,
+    teams: Optional[List[str]] = None
+) -> List[Dict]:
+    '''
+    Run a batch of confs through the engine in a single pass and score each.
+    In a pool worker, arrays and teams come from the shared state
+    '''
+    arrays = arrays if arrays is not None else WORKER_STATE['arrays']
+    teams = teams if teams is not None else WORKER_STATE['teams']
+    engine = EloBatchEngine(confs, teams)
+    projections = engine.run_arrays(arrays)
+    return score_projections(projections, arrays['result'], arrays['scored'])
+
+class EloSweep:
+    '''
+    Runs the Elo model over many confs to compare parameter choices without
+    editing conf.json
+
+    Game arrays are extracted once. Confs are split into batches that each
+    run in a single vectorized pass of the EloBatchEngine. With more than one
+    worker the arrays are placed in a shared memory block that every worker
+    process attaches to, so only the confs are sent to each task
+
+    Parameters:
+    * min_season: Optional[int] - only score games from this season on, ie to
+    exclude the burn in of the first seasons. All games are still processed
+    '''
+    def __init__(self, min_season: Optional[int] = None):
+        model = EloModel(use_checkpoint=False)
+        self.base_conf = model.conf
+        self.teams = model.teams
+        engine = EloEngine(model.conf, model.teams, data.db['wt_ratings'])
+        self.arrays = engine.game_arrays(model.games)
+        ## score the same games as the analytics recs ##
+        scored = (
+            (model.games['location'] == 'Home') &
+            (model.games['game_type'] == 'REG')
+        ).to_numpy()
+        if min_season is not None:
+            scored = scored & (self.arrays['season'] >= min_season)
+        self.arrays['scored'] = scored
+
+    ###########
+    ## CONFS ##
+    ###########
+    def validate_params(self, params: Dict):
+        '''
+        Raise if params contains keys that are not sweepable
+        '''
+        unknown = [key for key in params if key not in SWEEP_PARAMS]
+        if len(unknown) > 0:
+            raise ValueError('Unknown Elo params: {0}. Use any of {1}'.format(
+                ', '.join(unknown), ', '.join(SWEEP_PARAMS)
+            ))
+
+    def gen_grid(self, grid: Dict[str, List[float]]) -> List[Dict]:
+        '''
+        Every combination of the grid values, with other params from conf.json
+
+        Parameters:
+        * grid: Dict[str, List[float]] - values to try for each param
+
+        Returns:
+        * confs: List[Dict]
+        '''
+        self.validate_params(grid)
+        keys = list(grid.keys())
+        return [
+            {**self.base_conf, **dict(zip(keys, values))}
+            for values in itertools.product(*[grid[key] for key in keys])
+        ]
+
+    def gen_random(self,
+        space: Dict[str, Union[Tuple[float, float], List[float]]],
+        n: int,
+        seed: int = 1
+    ) -> List[Dict]:
+        '''
+        Random sample of confs, with other params from conf.json
+
+        Parameters:
+        * space: Dict - a (low, high) tuple to sample a param uniformly, or a
+        list of values to sample from
+        * n: int - number of confs
+        * seed: int - random seed
+
+        Returns:
+        * confs: List[Dict]
+        '''
+        self.validate_params(space)
+        rng = numpy.random.default_rng(seed)
+        confs = []
+        for _ in range(n):
+            conf = dict(self.base_conf)
+            for key, values in space.items():
+                if isinstance(values, tuple):
+                    conf[key] = float(rng.uniform(values[0], values[1]))
+                else:
+                    conf[key] = values[int(rng.integers(0, len(values)))]
+            confs.append(conf)
+        return confs
+
+    #########
+    ## RUN ##
+    #########
+    def run(self,
+        confs: List[Dict],
+        max_workers: Optional[int] = None,
+        sort_by: str = 'rmse',
+        batch_size: int = 256
+    ) -> pd.DataFrame:
+        '''
+        Run and score every conf, fanning batches out across processes
+
+        Parameters:
+        * confs: List[Dict] - full confs, ie from gen_grid or gen_random
+        * max_workers: Optional[int] - worker processes, defaults to the cpu
+        count. 1 runs in this process
+        * sort_by: str - metric to rank by, lower is better. For bias, the
+        absolute value is ranked
+        * batch_size: int - max confs per engine pass, which bounds memory at
+        about games x batch_size x 24 bytes per batch
+
+        Returns:
+        * results: pd.DataFrame - one row per conf with its params and metrics,
+        ranked by sort_by
+        '''
+        if sort_by not in SWEEP_METRICS:
+            raise ValueError('sort_by must be one of {0}'.format(', '.join(SWEEP_METRICS)))
+        max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        ## one batch per worker, unless that exceeds the batch size ##
+        size = max(1, min(batch_size, -(-len(confs) // max(1, max_workers))))
+        batches = [confs[i:i + size] for i in range(0, len(confs), size)]
+        max_workers = max(1, min(max_workers, len(batches)))
+        if max_workers == 1:
+            scores = [run_confs(batch, self.arrays, self.teams) for batch in batches]
+        else:
+            shm, layout = pack_arrays(self.arrays)
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=init_worker,
+                    initargs=(shm.name, layout, self.teams)
+                ) as executor:
+                    scores = list(executor.map(run_confs, batches))
+            finally:
+                shm.close()
+                shm.unlink()
+        results = pd.DataFrame([
+            {**{key: conf[key] for key in SWEEP_PARAMS}, **score}
+            for conf, score in zip(confs, [score for batch in scores for score in batch])
+        ])
+        results = results.iloc[
+            numpy.argsort(
+                (results[sort_by].abs() if sort_by == 'bias' else results[sort_by]).to_numpy(),
+                kind='stable'
+            )
+        ].reset_index(drop=True)
+        results.insert(0, 'rank', numpy.arange(1, len(results) + 1))
+        return results
+
+def parse_sweep_args(args: List[str]) -> Tuple[Dict, Optional[int], Optional[int], Optional[str], str]:
+    '''
+    Parse sweep cli args, ie k=10,20,30 b=2.0:2.4 --random 50 --workers 4
+    --output sweep.csv --sort brier. Comma separated values are tried as a grid,
+    and low:high ranges are sampled uniformly with --random
+    '''
+    space = {}
+    n_random = None
+    workers = None
+    output = None
+    sort_by = 'rmse'
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ['--random', '--workers', '--output', '--sort']:
+            value = args[i + 1]
+            if arg == '--random':
+                n_random = int(value)
+            elif arg == '--workers':
+                workers = int(value)
+            elif arg == '--output':
+                output = value
+            else:
+                sort_by = value
+            i += 2
+            continue
+        key, values = arg.split('=', 1)
+        if ':' in values:
+            low, high = values.split(':', 1)
+            space[key] = (float(low), float(high))
+        else:
+            space[key] = [float(value) for value in values.split(',')]
+        i += 1
+    return space, n_random, workers, output, sort_by
+
+def sweep_cli(args: List[str]) -> pd.DataFrame:
+    '''
+    Run a sweep from cli args (see parse_sweep_args), print the top confs, and
+    optionally save the full table
+    '''
+    space, n_random, workers, output, sort_by = parse_sweep_args(args)
+    sweep = EloSweep()
+    if n_random is not None:
+        confs = sweep.gen_random(space, n_random)
+    else:
+        ranges = [key for key, values in space.items() if isinstance(values, tuple)]
+        if len(ranges) > 0:
+            raise ValueError('Ranges ({0}) require --random'.format(', '.join(ranges)))
+        confs = sweep.gen_grid(space)
+    results = sweep.run(confs, max_workers=workers, sort_by=sort_by)
+    print(results.head(20).to_string(index=False))
+    if output is not None:
+        results.to_csv(output, index=False)
+    return results
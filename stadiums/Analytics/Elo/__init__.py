@@ -1 +1,2 @@
-from .EloModel import EloModel
\ No newline at end of file
+from .EloModel import EloModel
+from .EloSweep import EloSweep, sweep_cli
@@ -1,2 +1,4 @@
 from .calc_analytics import calc_analytics
-from .gen_team_stadiums import gen_team_stadiums
\ No newline at end of file
+from .gen_team_stadiums import gen_team_stadiums
+from .gen_game_travel import gen_game_travel
+from .join_fastr import join_hfa, stream_join_hfa
@@ -1,5 +1,7 @@
 ## built-in ##
+import hashlib
 import pathlib
+from typing import List, Tuple, Union
 
 ## external ##
 import pandas as pd
@@ -7,16 +9,180 @@ import numpy
 
 ## internal ##
 ## from ..DataLoader import data
+from ..Instrumentation import instrument
+from ..Outputs import SeasonStore
+from ..Pipeline import hash_source, hash_file
 from .Elo import EloModel
+from .Elo.EloEngine import EloEngine
 
-def gen_hfa():
+## bump when the model changes in a way the fingerprinted source does not
+## show, ie a change to a helper those functions call ##
+MODEL_VERSION = 1
+
+def group_bounds(
+    df: pd.DataFrame,
+    group_cols: List[str]
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    '''
+    Returns the start row and length of each group in a frame where groups
+    are contiguous
+    '''
+    codes = df.groupby(group_cols, sort=False).ngroup().to_numpy()
+    starts = numpy.flatnonzero(numpy.r_[True, codes[1:] != codes[:-1]])
+    lengths = numpy.diff(numpy.r_[starts, len(df)])
+    return starts, lengths
+
+def pad_weeks(df: pd.DataFrame, group_cols: List[str]) -> pd.DataFrame:
+    '''
+    Pads a frame sorted by group_cols, season, and week so that each group has
+    a row for every league week (any season/week in the frame) between its first
+    and last record. Padded rows are NaN for all non-key columns
+
+    The range for each group is generated from an index of league weeks,
+    so only rows that are kept are ever built
+    '''
+    if len(df) == 0:
+        return df
+    ## index of league weeks ##
+    week_keys = df['season'].to_numpy(dtype=numpy.int64) * 100 + df['week'].to_numpy(dtype=numpy.int64)
+    league_weeks = numpy.unique(week_keys)
+    week_idx = numpy.searchsorted(league_weeks, week_keys)
+    ## span of each group ##
+    starts, lengths = group_bounds(df, group_cols)
+    first = week_idx[starts]
+    span = week_idx[starts + lengths - 1] - first + 1
+    offsets = numpy.r_[0, numpy.cumsum(span)[:-1]]
+    ## padded rows ##
+    padded_group = numpy.repeat(numpy.arange(len(starts)), span)
+    padded_week = (
+        numpy.arange(span.sum()) -
+        numpy.repeat(offsets, span) +
+        numpy.repeat(first, span)
+    )
+    padded = pd.DataFrame({
+        'season': league_weeks[padded_week] // 100,
+        'week': league_weeks[padded_week] % 100
+    })
+    for col in group_cols:
+        padded[col] = df[col].to_numpy()[starts][padded_group]
+    ## place the records ##
+    rec_group = numpy.repeat(numpy.arange(len(starts)), lengths)
+    rows = offsets[rec_group] + week_idx - first[rec_group]
+    for col in df.columns:
+        if col in padded.columns:
+            continue
+        values = numpy.full(len(padded), numpy.nan)
+        values[rows] = df[col].to_numpy(dtype=numpy.float64)
+        padded[col] = values
+    return padded
+
+def grouped_rolling(
+    df: pd.DataFrame,
+    group_cols: List[str],
+    value_cols: List[str],
+    windows: List[Union[int, str]]
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    '''
+    Calculates rolling sums and means (min_periods=1) of several columns
+    over several windows for every group in a single pass. The df must be
+    sorted so that each group is contiguous and in time order. A window of
+    'all' is an expanding window. NaNs are skipped like in pandas rolling
+
+    Rather than differencing cumulative sums, each group keeps compensated
+    running sums that are stepped through the groups' positions in lock step,
+    mirroring the add/remove order of pandas rolling aggregations. This makes
+    the results identical to pandas, including means that sit on a rounding
+    boundary, where a plain cumsum difference can land on the other side
+
+    Parameters:
+    * df: pd.DataFrame - sorted frame
+    * group_cols: List[str] - columns that define the groups
+    * value_cols: List[str] - columns to aggregate
+    * windows: List[Union[int, str]] - window lengths in rows, or 'all'
+
+    Returns:
+    * sums: numpy.ndarray - rows x windows x value_cols
+    * means: numpy.ndarray - rows x windows x value_cols
+    '''
+    n = len(df)
+    values = df[value_cols].to_numpy(dtype=numpy.float64)
+    starts, lengths = group_bounds(df, group_cols)
+    ## pad groups into a groups x positions x values array ##
+    padded = numpy.full((len(starts), lengths.max() + 1 if n else 1, len(value_cols)), numpy.nan)
+    positions = numpy.arange(n) - numpy.repeat(starts, lengths)
+    padded[numpy.repeat(numpy.arange(len(starts)), lengths), positions] = values
+    ## state is groups x windows x values ##
+    shape = (len(starts), len(windows), len(value_cols))
+    total = numpy.zeros(shape)
+    comp_add = numpy.zeros(shape)
+    comp_remove = numpy.zeros(shape)
+    nobs = numpy.zeros(shape, dtype=numpy.int64)
+    neg_ct = numpy.zeros(shape, dtype=numpy.int64)
+    consecutive = numpy.zeros(shape, dtype=numpy.int64)
+    prev = numpy.full(shape, numpy.nan)
+    sums = numpy.full((n, len(windows), len(value_cols)), numpy.nan)
+    means = numpy.full((n, len(windows), len(value_cols)), numpy.nan)
+    for t in range(padded.shape[1] - 1):
+        ## values leaving each window, NaN if nothing leaves ##
+        removed = numpy.stack([
+            padded[:, t - window, :] if window != 'all' and t >= window
+            else padded[:, -1, :]
+            for window in windows
+        ], axis=1)
+        valid = ~numpy.isnan(removed)
+        y = numpy.where(valid, -removed - comp_remove, 0)
+        new_total = total + y
+        comp_remove = numpy.where(valid, new_total - total - y, comp_remove)
+        total = numpy.where(valid, new_total, total)
+        nobs -= valid
+        neg_ct -= valid & numpy.signbit(removed)
+        ## value entering every window ##
+        added = numpy.broadcast_to(padded[:, t, None, :], shape)
+        valid = ~numpy.isnan(added)
+        y = numpy.where(valid, added - comp_add, 0)
+        new_total = total + y
+        comp_add = numpy.where(valid, new_total - total - y, comp_add)
+        total = numpy.where(valid, new_total, total)
+        nobs += valid
+        neg_ct += valid & numpy.signbit(added)
+        consecutive = numpy.where(
+            valid,
+            numpy.where(added == prev, consecutive + 1, 1),
+            consecutive
+        )
+        prev = numpy.where(valid, added, prev)
+        ## write outputs for groups still active at this position ##
+        active = numpy.flatnonzero(lengths > t)
+        rows = starts[active] + t
+        a_nobs = nobs[active]
+        a_total = total[active]
+        a_prev = prev[active]
+        a_same = consecutive[active] >= a_nobs
+        has_obs = a_nobs > 0
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            mean = a_total / a_nobs
+        mean = numpy.where(a_same, a_prev, mean)
+        mean = numpy.where(~a_same & (neg_ct[active] == 0) & (mean < 0), 0, mean)
+        mean = numpy.where(~a_same & (neg_ct[active] == a_nobs) & (mean > 0), 0, mean)
+        sums[rows] = numpy.where(
+            has_obs, numpy.where(a_same, a_prev * a_nobs, a_total), numpy.nan
+        )
+        means[rows] = numpy.where(has_obs, mean, numpy.nan)
+    return sums, means
+
+def gen_hfa(use_checkpoint: bool = True):
     '''
     Generates rolling HFA metrics for each team and stadium using a
     simple elo model
+
+    Parameters:
+    * use_checkpoint: bool - if True, the elo model resumes from and updates its checkpoint
     '''
     ## generate records ##
-    elo = EloModel()
-    elo.run()
+    with instrument.stage('elo') as stage:
+        elo = EloModel(use_checkpoint=use_checkpoint)
+        elo.run()
+        stage.rows = len(elo.recs)
     ## create a df from the records ##
     df = pd.DataFrame(elo.recs)
     df = df.sort_values(
@@ -32,100 +198,119 @@ def gen_hfa():
     ## create rolling metrics ##
     windows = [16,80,'all']
     ## for windows, calc across all weeks, not just the home games ##
-    ## to do this, each stadium needs a row for each possible week ##
-    ## get all possible weeks ##
-    weeks = df[['season', 'week']].drop_duplicates().reset_index(drop=True)
-    ## add unique team/stadium pairs ##
-    weeks = weeks.merge(
-        df[['team', 'stadium']].drop_duplicates().reset_index(drop=True),
-        how='cross'
-    )
-    ## add week and season to df ##
-    df = weeks.merge(
-        df,
-        on=['season', 'week', 'team', 'stadium'],
-        how='left'
-    )
-    ## re-sort ##
-    df = df.sort_values(
-        by=['team', 'stadium', 'season', 'week' ],
-        ascending=[True, True, True, True]
-    ).reset_index(drop=True)
-    ## remove records played between the first and last home game of the stadium ##
-    ## by finding the row number of the first and last home game of the stadium ##
-    ## and keep all rows between them ##
-    ## create temp row number for each rec ##
-    df['row_num'] = range(len(df))
-    df['row_num_played'] = numpy.where(~pd.isna(df['mov']), df['row_num'], numpy.nan)
-    ## filter ##
-    df = df[
-        (df['row_num'] >= df.groupby(['team', 'stadium'])['row_num_played'].transform(lambda x: x.min())) &
-        (df['row_num'] <= df.groupby(['team', 'stadium'])['row_num_played'].transform(lambda x: x.max()))
-    ].copy()
-    ## remove temp row number ##
-    df = df.drop(columns=['row_num', 'row_num_played'])
-    for window in windows:
-        ## handle all case ##
-        if window == 'all':
-            df['wins_all_time'] = df.groupby(['team', 'stadium'])['win'].transform(lambda x: x.expanding().sum())
-            df['losses_all_time'] = df.groupby(['team', 'stadium'])['loss'].transform(lambda x: x.expanding().sum())
-            df['ties_all_time'] = df.groupby(['team', 'stadium'])['tie'].transform(lambda x: x.expanding().sum())
-            df['mov_all_time'] = numpy.round(df.groupby(['team', 'stadium'])['mov'].transform(lambda x: x.expanding().mean()), 3)
-            df['hfa_all_time'] = numpy.round(df.groupby(['team', 'stadium'])['error'].transform(lambda x: x.expanding().mean()), 3)
-        else:
-            df['wins_l{0}'.format(window)] = df.groupby(['team', 'stadium'])['win'].transform(lambda x: x.rolling(window, min_periods=1).sum())
-            df['losses_l{0}'.format(window)] = df.groupby(['team', 'stadium'])['loss'].transform(lambda x: x.rolling(window, min_periods=1).sum())
-            df['ties_l{0}'.format(window)] = df.groupby(['team', 'stadium'])['tie'].transform(lambda x: x.rolling(window, min_periods=1).sum())
-            df['mov_l{0}'.format(window)] = numpy.round(df.groupby(['team', 'stadium'])['mov'].transform(lambda x: x.rolling(window, min_periods=1).mean()), 3)
-            df['hfa_l{0}'.format(window)] = numpy.round(df.groupby(['team', 'stadium'])['error'].transform(lambda x: x.rolling(window, min_periods=1).mean()), 3)
+    ## to do this, each stadium needs a row for each week between the first and
+    ## last home game of the team at the stadium ##
+    with instrument.stage('pad_weeks') as stage:
+        df = pad_weeks(df, ['team', 'stadium'])
+        stage.rows = len(df)
+    ## rolling metrics for all windows in a single grouped pass ##
+    with instrument.stage('rolling') as stage:
+        sums, means = grouped_rolling(
+            df, ['team', 'stadium'],
+            ['win', 'loss', 'tie', 'mov', 'error'],
+            windows
+        )
+        stage.rows = len(df)
+    for i, window in enumerate(windows):
+        suffix = 'all_time' if window == 'all' else 'l{0}'.format(window)
+        df['wins_{0}'.format(suffix)] = sums[:, i, 0]
+        df['losses_{0}'.format(suffix)] = sums[:, i, 1]
+        df['ties_{0}'.format(suffix)] = sums[:, i, 2]
+        df['mov_{0}'.format(suffix)] = numpy.round(means[:, i, 3], 3)
+        df['hfa_{0}'.format(suffix)] = numpy.round(means[:, i, 4], 3)
     ## calculate for league ##
-    league = pd.DataFrame(elo.recs)
-    league = league.sort_values(
-        by=['season', 'week'],
-        ascending=[True, True]
-    ).reset_index(drop=True)
-    league['win'] = numpy.where(league['mov'] > 0, 1, 0)
-    league['loss'] = numpy.where(league['mov'] < 0, 1, 0)
-    league['tie'] = numpy.where(league['mov'] == 0, 1, 0)
-    ## translate league df in a unique on week and season ##
-    ## so it can be joined and compared on an apples to apples basis ##
-    league = league.groupby(['season', 'week']).agg(
-        win = ('win', 'sum'),
-        loss = ('loss', 'sum'),
-        tie = ('tie', 'sum'),
-        mov = ('mov', 'mean'),
-        error = ('error', 'mean')
-    ).reset_index()
-    league['mov'] = numpy.round(league['mov'], 3)
-    league['error'] = numpy.round(league['error'], 3)
-    ## calculate rolling metrics ##
-    for window in windows:
-        if window == 'all':
-            league['wins_all_time'] = league['win'].expanding().sum()
-            league['losses_all_time'] = league['loss'].expanding().sum()
-            league['ties_all_time'] = league['tie'].expanding().sum()
-            league['mov_all_time'] = numpy.round(league['mov'].expanding().mean(), 3)
-            league['hfa_all_time'] = numpy.round(league['error'].expanding().mean(), 3)
-        else:
-            league['wins_l{0}'.format(window)] = league['win'].rolling(window).sum()
-            league['losses_l{0}'.format(window)] = league['loss'].rolling(window).sum()
-            league['ties_l{0}'.format(window)] = league['tie'].rolling(window).sum()
-            league['mov_l{0}'.format(window)] = numpy.round(league['mov'].rolling(window).mean(), 3)
-            league['hfa_l{0}'.format(window)] = numpy.round(league['error'].rolling(window).mean(), 3)
+    with instrument.stage('league') as stage:
+        league = pd.DataFrame(elo.recs)
+        league = league.sort_values(
+            by=['season', 'week'],
+            ascending=[True, True]
+        ).reset_index(drop=True)
+        league['win'] = numpy.where(league['mov'] > 0, 1, 0)
+        league['loss'] = numpy.where(league['mov'] < 0, 1, 0)
+        league['tie'] = numpy.where(league['mov'] == 0, 1, 0)
+        ## translate league df in a unique on week and season ##
+        ## so it can be joined and compared on an apples to apples basis ##
+        league = league.groupby(['season', 'week']).agg(
+            win = ('win', 'sum'),
+            loss = ('loss', 'sum'),
+            tie = ('tie', 'sum'),
+            mov = ('mov', 'mean'),
+            error = ('error', 'mean')
+        ).reset_index()
+        league['mov'] = numpy.round(league['mov'], 3)
+        league['error'] = numpy.round(league['error'], 3)
+        ## calculate rolling metrics ##
+        for window in windows:
+            if window == 'all':
+                league['wins_all_time'] = league['win'].expanding().sum()
+                league['losses_all_time'] = league['loss'].expanding().sum()
+                league['ties_all_time'] = league['tie'].expanding().sum()
+                league['mov_all_time'] = numpy.round(league['mov'].expanding().mean(), 3)
+                league['hfa_all_time'] = numpy.round(league['error'].expanding().mean(), 3)
+            else:
+                league['wins_l{0}'.format(window)] = league['win'].rolling(window).sum()
+                league['losses_l{0}'.format(window)] = league['loss'].rolling(window).sum()
+                league['ties_l{0}'.format(window)] = league['tie'].rolling(window).sum()
+                league['mov_l{0}'.format(window)] = numpy.round(league['mov'].rolling(window).mean(), 3)
+                league['hfa_l{0}'.format(window)] = numpy.round(league['error'].rolling(window).mean(), 3)
+        stage.rows = len(league)
     ## return df and league, but league is 
     return df, league
 
-def calc_analytics():
+def model_fingerprint() -> str:
+    '''
+    Hash of the Elo conf, MODEL_VERSION, and the source of the functions that
+    compute the rolling outputs. The persisted history is only rewritten when
+    this changes, so edits to io, checkpointing, or other code in the same
+    files do not touch it
+    '''
+    return hashlib.sha256('|'.join([
+        str(MODEL_VERSION),
+        hash_source(
+            gen_hfa, pad_weeks, grouped_rolling, EloModel.gen_recs,
+            EloEngine.game_arrays, EloEngine.lookup_wt_ratings, EloEngine.run_arrays
+        ),
+        hash_file('{0}/Elo/conf.json'.format(pathlib.Path(__file__).parent.resolve()))
+    ]).encode('utf-8')).hexdigest()
+
+def calc_analytics(parquet: bool = False):
     '''
     Generates analytics files for the stadiums project
+
+    The rolling outputs are stored as one file per season in the rolling_team_hfa
+    and rolling_league_hfa directories. Past weeks do not change unless the model
+    does, so each run only appends the new rows (see SeasonStore). The combined
+    rolling_team_hfa.csv and rolling_league_hfa.csv are also written
+
+    Parameters:
+    * parquet: bool - if True, also write typed parquet seasons to the
+    rolling_team_hfa_parquet and rolling_league_hfa_parquet directories
     '''
     ## output loc ##
     output_loc = '{0}/data'.format(
         pathlib.Path(__file__).parent.parent.parent.resolve()
     )
-    team_hfa, league_hfa = gen_hfa()
+    with instrument.stage('gen_hfa') as stage:
+        team_hfa, league_hfa = gen_hfa()
+        stage.rows = len(team_hfa)
+    fingerprint = model_fingerprint()
     ## save ##
-    team_hfa.to_csv('{0}/rolling_team_hfa.csv'.format(output_loc), index=False)
-    league_hfa.to_csv('{0}/rolling_league_hfa.csv'.format(output_loc), index=False)
+    with instrument.stage('save_csv'):
+        SeasonStore(
+            '{0}/rolling_team_hfa'.format(output_loc), group_cols=['team', 'stadium']
+        ).write(team_hfa, fingerprint)
+        SeasonStore('{0}/rolling_league_hfa'.format(output_loc)).write(league_hfa, fingerprint)
+        ## combined files, which downstream users read by url ##
+        team_hfa.to_csv('{0}/rolling_team_hfa.csv'.format(output_loc), index=False)
+        league_hfa.to_csv('{0}/rolling_league_hfa.csv'.format(output_loc), index=False)
+    if parquet:
+        with instrument.stage('save_parquet'):
+            SeasonStore(
+                '{0}/rolling_team_hfa_parquet'.format(output_loc),
+                group_cols=['team', 'stadium'], fmt='parquet'
+            ).write(team_hfa, fingerprint)
+            SeasonStore(
+                '{0}/rolling_league_hfa_parquet'.format(output_loc), fmt='parquet'
+            ).write(league_hfa, fingerprint)
     ## return ##
     return team_hfa, league_hfa
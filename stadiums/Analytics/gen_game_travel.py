@@ -0,0 +1,128 @@
+## built-ins ##
+import pathlib
+from typing import Optional
+
+## external ##
+import pandas as pd
+import numpy
+
+## internal ##
+from ..Models import StadiumCollection
+from ..DataLoader import data
+from ..Outputs import write_parquet
+
+
+def rest_days(games: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Days since each team's previous game, for the home and away team of every
+    game. The schedule is stacked into one row per team and game, sorted, and
+    differenced with a grouped shift. A team's first game of a season has no
+    rest value, since the gap is the off season
+
+    Parameters:
+    * games: pd.DataFrame - games with season, gameday, home_team, and away_team
+
+    Returns:
+    * rest: pd.DataFrame - home_rest_days and away_rest_days, indexed like games
+    '''
+    n = len(games)
+    gamedays = pd.to_datetime(games['gameday']).to_numpy()
+    schedule = pd.DataFrame({
+        'team': numpy.concatenate([
+            games['home_team'].to_numpy(dtype=object),
+            games['away_team'].to_numpy(dtype=object)
+        ]),
+        'season': numpy.tile(games['season'].to_numpy(), 2),
+        'gameday': numpy.tile(gamedays, 2),
+        ## position of the game, and 0 for home or 1 for away ##
+        'row': numpy.tile(numpy.arange(n), 2),
+        'side': numpy.repeat([0, 1], n)
+    }).sort_values(by=['team', 'gameday', 'row'], kind='stable')
+    grouped = schedule.groupby(['team', 'season'], sort=False)
+    rest = (schedule['gameday'] - grouped['gameday'].shift(1)).dt.days.to_numpy(dtype=numpy.float64)
+    out = numpy.full((2, n), numpy.nan)
+    out[schedule['side'].to_numpy(), schedule['row'].to_numpy()] = rest
+    return pd.DataFrame({
+        'home_rest_days': out[0],
+        'away_rest_days': out[1]
+    }, index=games.index)
+
+def gen_game_travel(
+    stadium_collection: StadiumCollection,
+    games: Optional[pd.DataFrame] = None,
+    output_loc: Optional[str] = None,
+    parquet: bool = False
+) -> pd.DataFrame:
+    '''
+    Creates a travel and rest feature table with a row for every game
+
+    Each team travels from its home stadium for the season (see
+    StadiumCollection.travel_origins) to the game stadium. For both teams,
+    the table has travel miles from StadiumCollection.travel_distances, the
+    timezone shift (game stadium offset less home stadium offset, so flying
+    east is positive), the altitude delta in feet, and days of rest. Home
+    teams at their own stadium have no travel, shift, or delta. Values are
+    NaN where a stadium is missing its location, offset, or altitude. The
+    shift only needs offsets, so it is set for stadiums with no location
+
+    All features are computed column wise over the full schedule, so the cost
+    grows linearly with the games history
+
+    The result is saved to game_travel.csv in output_loc, which defaults to
+    the package data folder, and to game_travel.parquet if parquet is True
+
+    Parameters:
+    * stadium_collection: StadiumCollection - stadiums with location data
+    * games: Optional[pd.DataFrame] - defaults to data.db['games']
+    * output_loc: Optional[str] - folder to save to
+    * parquet: bool - if True, also save a typed parquet copy
+
+    Returns:
+    * travel: pd.DataFrame
+    '''
+    if games is None:
+        games = data.db['games']
+    geo = stadium_collection.geo_index()
+    ## home stadium of each team for the season of each game, and the miles from it ##
+    origins = stadium_collection.travel_origins(games)
+    distances = stadium_collection.travel_distances(games, origins)
+    stadium_ids = games['stadium_id'].to_numpy(dtype=object)
+    ## per stadium timezone offsets, for every stadium rather than only the
+    ## located ones in the geo index ##
+    tz_offsets = pd.to_numeric(
+        stadium_collection.stadium_df.set_index('stadium_id')['tz_offset'],
+        errors='coerce'
+    )
+    game_offsets = tz_offsets.reindex(stadium_ids).to_numpy(dtype=numpy.float64)
+    travel = pd.DataFrame({
+        'game_id': games['game_id'].to_numpy(dtype=object),
+        'season': games['season'].to_numpy(),
+        'week': games['week'].to_numpy(),
+        'home_team': games['home_team'].to_numpy(dtype=object),
+        'away_team': games['away_team'].to_numpy(dtype=object),
+        'stadium_id': stadium_ids
+    })
+    for side in ['home', 'away']:
+        side_origins = origins['{0}_origin'.format(side)].to_numpy(dtype=object)
+        travel['{0}_home_stadium'.format(side)] = side_origins
+        travel['{0}_travel_miles'.format(side)] = numpy.round(
+            distances['{0}_travel_miles'.format(side)].to_numpy(), 1
+        )
+        travel['{0}_tz_shift'.format(side)] = (
+            game_offsets - tz_offsets.reindex(side_origins).to_numpy(dtype=numpy.float64)
+        )
+        travel['{0}_altitude_delta'.format(side)] = numpy.round(
+            geo.altitudes(stadium_ids) - geo.altitudes(side_origins), 1
+        )
+    rest = rest_days(games)
+    travel['home_rest_days'] = rest['home_rest_days'].to_numpy()
+    travel['away_rest_days'] = rest['away_rest_days'].to_numpy()
+    ## save ##
+    if output_loc is None:
+        output_loc = '{0}/data'.format(
+            pathlib.Path(__file__).parent.parent.parent.resolve()
+        )
+    travel.to_csv('{0}/game_travel.csv'.format(output_loc), index=False)
+    if parquet:
+        write_parquet(travel, '{0}/game_travel.parquet'.format(output_loc))
+    return travel
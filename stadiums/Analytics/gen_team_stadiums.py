@@ -1,86 +1,68 @@
 ## built-ins ##
 import pathlib
+from typing import Optional
 
 ## external ##
 import pandas as pd
-import numpy
 
 ## internal ##
 from ..Models import StadiumCollection
-from ..DataLoader import data
+from ..DataLoader import data, team_translator
+from ..Outputs import write_parquet
 
 
 def fastr_team(df: pd.DataFrame, team_col: str):
     '''
-    Utility to change team abbreviations back to the fastr style
+    Utility to change team abbreviations back to the fastr style for the
+    season of each row. Returns a new categorical series and leaves df unchanged
     '''
-    ## create a base mapping of fastr names that need to change based on ##
-    ## current team name used by nfelo ##
-    current_map = {
-        'OAK': 'LV',
-        'LAR': 'LA',
-    }
-    ## creates maps for each season where there is a different change ##
-    ## 2019 was the last year for Oakland, so remove from the map ##
-    map_2019 = current_map.copy()
-    map_2019.pop('OAK')
-    ## 2016 was the last year for SD, so change LAC to SD ##
-    map_2016 = map_2019.copy()
-    map_2016['LAC'] = 'SD'
-    ## 2015 was the last year for STL, so change LAR to STL ##
-    map_2015 = map_2016.copy()
-    map_2015['LAR'] = 'STL'
-    ## apply ##
-    df['{0}_fastr'.format(team_col)] = numpy.where(
-        df['season'] <= 2015,
-        df[team_col].replace(map_2015),
-        numpy.where(
-            df['season'] <= 2016,
-            df[team_col].replace(map_2016),
-            numpy.where(
-                df['season'] <= 2019,
-                df[team_col].replace(map_2019),
-                df[team_col].replace(current_map)
-            )
-        )
+    return team_translator.to_fastr(
+        df[team_col], df['season'],
+        name='{0}_fastr'.format(team_col)
     )
-    return df['{0}_fastr'.format(team_col)]
 
 def gen_team_stadiums(
     stadium_collection: StadiumCollection,
-    analytics: pd.DataFrame
+    analytics: pd.DataFrame,
+    output_loc: Optional[str] = None,
+    parquet: bool = False
 ):
     '''
     Creates an aggregated dataframe for each teams home stadium. This is a
     stadium collection with team<>stadium as a composite key vs just stadium.
 
     Additionally, it adds analytics to the dataframe for record and HFA.
+
+    The result is saved to team_stadiums.csv in output_loc, which defaults to
+    the package data folder, and to team_stadiums.parquet if parquet is True
     '''
     ## get unique stadiums ##
     stadium_collection.update_df()
     stadiums = stadium_collection.stadium_df.copy()
     ## get unique team <> game combinations ##
-    games = data.db['games'].copy()
-    ## add a fastr team column ##
-    games['team_fastr'] = fastr_team(games, 'home_team')
-    combos = games[
+    games = data.db['games']
+    home_games = games[
         (games['location'] == 'Home')
-    ][[
+    ]
+    combos = home_games[[
+        'home_team', 'stadium_id'
+    ]].assign(
+        ## add a fastr team column ##
+        team_fastr=fastr_team(home_games, 'home_team')
+    )[[
         'home_team', 'team_fastr', 'stadium_id'
-    ]].copy().rename(columns={
+    ]].rename(columns={
         'home_team': 'team',
     }).drop_duplicates()
     ## determine if stadium is current for the team ##
     ## the current stadium is the one where the team has played,
     ## or is scheduled to play the most games in the most recent season
-    currents = games[
-        (games['location'] == 'Home')
-    ].groupby(['season', 'home_team', 'stadium_id']).agg(
+    currents = home_games.groupby(['season', 'home_team', 'stadium_id'], observed=True).agg(
         games=('game_id', 'nunique')
     ).reset_index().sort_values(
         by=['season', 'home_team', 'games'],
         ascending=[False, True, False]
-    ).groupby(['home_team']).head(1)[[
+    ).groupby(['home_team'], observed=True).head(1)[[
         'home_team', 'stadium_id'
     ]].copy().rename(columns={
         'home_team': 'team',
@@ -123,7 +105,11 @@ def gen_team_stadiums(
         by=['is_current', 'team'],
         ascending=[False, True]
     ).reset_index(drop=True)
-    combos.to_csv('{0}/data/team_stadiums.csv'.format(
-        pathlib.Path(__file__).parent.parent.parent.resolve()
-    ), index=False)
+    if output_loc is None:
+        output_loc = '{0}/data'.format(
+            pathlib.Path(__file__).parent.parent.parent.resolve()
+        )
+    combos.to_csv('{0}/team_stadiums.csv'.format(output_loc), index=False)
+    if parquet:
+        write_parquet(combos, '{0}/team_stadiums.parquet'.format(output_loc))
     return combos
@@ -0,0 +1,165 @@
+## built-ins ##
+import pathlib
+from typing import Iterable, Iterator, List, Optional, Union
+
+## external ##
+import pandas as pd
+import numpy
+
+## internal ##
+from ..Models import HFAIndex
+from ..DataLoader import team_translator
+
+DATA_LOC = '{0}/data'.format(pathlib.Path(__file__).parent.parent.parent.resolve())
+## rolling hfa columns attached by default. The per game columns (mov, error,
+## etc) describe the matched week's game rather than the history before it ##
+HFA_COLS = [
+    '{0}_{1}'.format(metric, window)
+    for window in ['l16', 'l80', 'all_time']
+    for metric in ['wins', 'losses', 'ties', 'mov', 'hfa']
+]
+## team_stadiums columns attached by default ##
+META_COLS = [
+    'stadium_name', 'lat', 'lon', 'altitude', 'surface_type',
+    'roof_type', 'tz', 'tz_offset', 'capacity'
+]
+
+def load_team_stadiums(team_stadiums: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    '''
+    team_stadiums with a single row per team and stadium
+    '''
+    if team_stadiums is None:
+        team_stadiums = pd.read_csv('{0}/team_stadiums.csv'.format(DATA_LOC))
+    return team_stadiums.drop_duplicates(['team', 'stadium']).reset_index(drop=True)
+
+def join_hfa(
+    df: pd.DataFrame,
+    index: Optional[HFAIndex] = None,
+    team_stadiums: Optional[pd.DataFrame] = None,
+    team_col: str = 'home_team',
+    stadium_col: str = 'stadium_id',
+    hfa_cols: List[str] = HFA_COLS,
+    meta_cols: List[str] = META_COLS,
+    strict: bool = True
+) -> pd.DataFrame:
+    '''
+    Attach rolling HFA and team_stadiums metadata to an nflfastR games or play
+    by play frame
+
+    Team abbreviations in team_col are translated from fastr to nfelo style
+    for the season of each row (see TeamTranslator), and each row is matched
+    to the rolling hfa of that team at the stadium in stadium_col. The match
+    is an as of join on season and week through HFAIndex.rows, which
+    resolves every (team, stadium) pair at once. With strict, the default, a
+    row gets the latest week before its own, so a game never sees its own
+    result. Bye weeks and the padded weeks in the hfa output resolve to the
+    latest row before them, and rows with no hfa history before them are NaN
+
+    If df has a game_id, the join is done once per game and spread back to
+    its rows, so play by play costs about the same as the games
+
+    Parameters:
+    * df: pd.DataFrame - frame with season, week, team_col, and stadium_col
+    * index: Optional[HFAIndex] - defaults to HFAIndex.from_store()
+    * team_stadiums: Optional[pd.DataFrame] - defaults to data/team_stadiums.csv
+    * team_col: str - fastr style team column
+    * stadium_col: str - stadium id column
+    * hfa_cols: List[str] - rolling hfa columns to attach
+    * meta_cols: List[str] - team_stadiums columns to attach
+    * strict: bool - if False, also match the row's own week
+
+    Returns:
+    * joined: pd.DataFrame - df with the hfa and metadata columns
+    '''
+    if index is None:
+        index = HFAIndex.from_store()
+    team_stadiums = load_team_stadiums(team_stadiums)
+    ## join on one row per game ##
+    if 'game_id' in df.columns:
+        game_codes = pd.factorize(df['game_id'])[0]
+        ## first row of each game, in code order ##
+        codes, first = numpy.unique(game_codes, return_index=True)
+        keys = df.iloc[first[codes >= 0]]
+    else:
+        game_codes = None
+        keys = df
+    teams = team_translator.to_nfelo(
+        keys[team_col].to_numpy(dtype=object), keys['season'].to_numpy()
+    ).to_numpy(dtype=object)
+    stadiums = keys[stadium_col].to_numpy(dtype=object)
+    pos = index.rows(
+        teams, stadiums,
+        keys['season'].to_numpy(), keys['week'].to_numpy(),
+        strict=strict
+    )
+    meta_pos = pd.MultiIndex.from_frame(team_stadiums[['team', 'stadium']]).get_indexer(
+        pd.MultiIndex.from_arrays([teams, stadiums])
+    )
+    ## spread back to every row. Rows without a game_id get no match ##
+    if game_codes is not None:
+        pos = numpy.where(game_codes >= 0, pos[numpy.maximum(game_codes, 0)], -1)
+        meta_pos = numpy.where(game_codes >= 0, meta_pos[numpy.maximum(game_codes, 0)], -1)
+    hfa = pd.DataFrame({
+        col: numpy.where(pos >= 0, index.values[col][numpy.maximum(pos, 0)], numpy.nan)
+        for col in hfa_cols
+    }, index=df.index)
+    ## take from team_stadiums so string columns keep their dtype. A trailing
+    ## empty row fills the rows with no match ##
+    meta = team_stadiums[meta_cols].reindex(numpy.arange(len(team_stadiums) + 1)).take(
+        numpy.where(meta_pos >= 0, meta_pos, len(team_stadiums))
+    ).set_axis(df.index)
+    return pd.concat([
+        df.drop(columns=[col for col in hfa_cols + meta_cols if col in df.columns]),
+        hfa,
+        meta
+    ], axis=1)
+
+def iter_seasons(
+    sources: Union[pd.DataFrame, Iterable[Union[str, pd.DataFrame]]],
+    columns: Optional[List[str]] = None
+) -> Iterator[pd.DataFrame]:
+    '''
+    Yields one frame at a time from a frame, which is split by season, or from
+    season files (parquet or csv) and frames, which are read one by one
+    '''
+    if isinstance(sources, pd.DataFrame):
+        for _, frame in sources.groupby('season', sort=True):
+            yield frame
+        return
+    for source in sources:
+        if isinstance(source, pd.DataFrame):
+            yield source
+        elif str(source).endswith('.parquet'):
+            yield pd.read_parquet(source, columns=columns)
+        else:
+            yield pd.read_csv(source, usecols=columns, low_memory=False)
+
+def stream_join_hfa(
+    sources: Union[pd.DataFrame, Iterable[Union[str, pd.DataFrame]]],
+    columns: Optional[List[str]] = None,
+    index: Optional[HFAIndex] = None,
+    team_stadiums: Optional[pd.DataFrame] = None,
+    **kwargs
+) -> Iterator[pd.DataFrame]:
+    '''
+    join_hfa over play by play one season at a time, so only a single season
+    is in memory. The index and team_stadiums are loaded once and shared
+
+    > for pbp in stream_join_hfa(['play_by_play_2023.parquet', 'play_by_play_2024.parquet']):
+    >     pbp.to_parquet('pbp_hfa_{0}.parquet'.format(pbp['season'].iloc[0]))
+
+    Parameters:
+    * sources: a frame, which is split by season, or an iterable of season
+    files (parquet or csv) and frames
+    * columns: Optional[List[str]] - columns to read from files. Must include
+    the join keys
+    * index, team_stadiums, and kwargs are passed to join_hfa
+
+    Returns:
+    * joined: Iterator[pd.DataFrame] - a joined frame per season or source
+    '''
+    if index is None:
+        index = HFAIndex.from_store()
+    team_stadiums = load_team_stadiums(team_stadiums)
+    for frame in iter_seasons(sources, columns):
+        yield join_hfa(frame, index=index, team_stadiums=team_stadiums, **kwargs)
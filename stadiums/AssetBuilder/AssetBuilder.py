@@ -0,0 +1,257 @@
+## built-ins ##
+import io
+import os
+import json
+import hashlib
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+## external ##
+import numpy
+
+## image variants require Pillow, which is optional ##
+try:
+    from PIL import Image
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+## bump when the manifest layout changes ##
+MANIFEST_VERSION = 1
+ASSETS_LOC = '{0}/Assets'.format(pathlib.Path(__file__).parent.parent.resolve())
+MANIFEST_LOC = '{0}/manifest.json'.format(ASSETS_LOC)
+## assets are served from the repo ##
+ASSET_URL_BASE = 'https://raw.githubusercontent.com/greerrenfl/Stadiums/main/stadiums/Assets'
+## source images, and the variants built from them. Changing a variant's
+## settings rebuilds it for every stadium ##
+SOURCE_DIR = 'SatelliteImg'
+VARIANTS = {
+    'webp': {'dir': 'SatelliteImgWebp', 'format': 'WEBP', 'quality': 80, 'max_size': None},
+    'thumb': {'dir': 'SatelliteImgThumb', 'format': 'WEBP', 'quality': 75, 'max_size': 480}
+}
+
+def file_record(path: str, rel_path: str) -> Dict:
+    '''
+    Manifest record of an image file
+    '''
+    with open(path, 'rb') as f:
+        content = f.read()
+    with Image.open(io.BytesIO(content)) as img:
+        width, height = img.size
+    return {
+        'path': rel_path,
+        'width': width,
+        'height': height,
+        'bytes': len(content),
+        'sha256': hashlib.sha256(content).hexdigest()
+    }
+
+def optimize_png(path: str) -> bool:
+    '''
+    Losslessly recompress a png in place. An alpha channel that is fully
+    opaque is dropped and metadata other than the color profile is stripped.
+    The file is only replaced if it is smaller and decodes to the same pixels
+
+    Returns:
+    * replaced: bool
+    '''
+    with Image.open(path) as img:
+        img.load()
+        icc_profile = img.info.get('icc_profile')
+        pixels = numpy.asarray(img.convert('RGBA'))
+        if img.mode == 'RGBA' and img.getchannel('A').getextrema() == (255, 255):
+            img = img.convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, 'PNG', optimize=True, icc_profile=icc_profile)
+    content = buffer.getvalue()
+    if len(content) >= os.path.getsize(path):
+        return False
+    with Image.open(io.BytesIO(content)) as optimized:
+        if not numpy.array_equal(numpy.asarray(optimized.convert('RGBA')), pixels):
+            return False
+    tmp_path = '{0}.tmp'.format(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+def build_stadium(
+    stadium_id: str,
+    assets_loc: str,
+    optimize_source: bool = False
+) -> Dict:
+    '''
+    Build every variant of a stadium's source image and return its manifest
+    entry. Runs in pool workers, so it only takes plain arguments
+    '''
+    source_rel = '{0}/{1}.png'.format(SOURCE_DIR, stadium_id)
+    source_path = '{0}/{1}'.format(assets_loc, source_rel)
+    if optimize_source:
+        optimize_png(source_path)
+    entry = {'png': file_record(source_path, source_rel)}
+    with Image.open(source_path) as img:
+        img = img.convert('RGB')
+        for name, variant in VARIANTS.items():
+            variant_img = img
+            if variant['max_size'] is not None:
+                variant_img = img.copy()
+                variant_img.thumbnail(
+                    (variant['max_size'], variant['max_size']),
+                    Image.Resampling.LANCZOS
+                )
+            rel_path = '{0}/{1}.webp'.format(variant['dir'], stadium_id)
+            path = '{0}/{1}'.format(assets_loc, rel_path)
+            pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+            variant_img.save(
+                '{0}.tmp'.format(path), variant['format'],
+                quality=variant['quality'], method=6
+            )
+            os.replace('{0}.tmp'.format(path), path)
+            entry[name] = file_record(path, rel_path)
+    return entry
+
+def load_asset_manifest(manifest_loc: str = MANIFEST_LOC) -> Dict[str, Dict]:
+    '''
+    Manifest entries by stadium id, or an empty dict if no manifest has been
+    built. Does not require Pillow
+    '''
+    try:
+        with open(manifest_loc, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest['stadiums']
+
+def asset_url(entry: Dict, variant: str) -> Optional[str]:
+    '''
+    URL of a variant from a stadium's manifest entry
+    '''
+    if variant not in entry:
+        return None
+    return '{0}/{1}'.format(ASSET_URL_BASE, entry[variant]['path'])
+
+class AssetBuilder:
+    '''
+    Builds web variants of the stadium satellite images and a manifest of
+    them, which Stadium uses for its image urls
+
+    For every png in Assets/SatelliteImg, a full size WebP and a WebP
+    thumbnail are written to their own folders. The manifest records the
+    path, dimensions, byte size, and sha256 of the source and each variant.
+    Stadiums whose source hash and variant files match the manifest are
+    skipped, so a build only processes new or changed images
+
+    The manifest holds no timestamps, so an unchanged build leaves it as is
+
+    Parameters:
+    * assets_loc: str - assets folder, defaults to the package assets
+    '''
+    def __init__(self, assets_loc: str = ASSETS_LOC):
+        self.assets_loc = assets_loc
+        self.manifest_loc = '{0}/manifest.json'.format(assets_loc)
+
+    def source_ids(self) -> List[str]:
+        '''
+        Ids of the stadiums with a source image
+        '''
+        source_loc = '{0}/{1}'.format(self.assets_loc, SOURCE_DIR)
+        if not os.path.isdir(source_loc):
+            return []
+        return sorted(
+            file_name[:-4] for file_name in os.listdir(source_loc)
+            if file_name.endswith('.png')
+        )
+
+    def is_current(self, stadium_id: str, entry: Optional[Dict]) -> bool:
+        '''
+        Returns True if the stadium's source and variants match its entry
+        '''
+        if entry is None or any(name not in entry for name in ['png'] + list(VARIANTS.keys())):
+            return False
+        for name in ['png'] + list(VARIANTS.keys()):
+            path = '{0}/{1}'.format(self.assets_loc, entry[name]['path'])
+            if not os.path.exists(path):
+                return False
+            with open(path, 'rb') as f:
+                if hashlib.sha256(f.read()).hexdigest() != entry[name]['sha256']:
+                    return False
+        return True
+
+    def build(self,
+        force: bool = False,
+        optimize_sources: bool = False,
+        max_workers: Optional[int] = None
+    ) -> Dict:
+        '''
+        Build the variants and manifest
+
+        Parameters:
+        * force: bool - if True, rebuild every stadium
+        * optimize_sources: bool - if True, losslessly recompress the source
+        pngs in place (see optimize_png). This rewrites the committed images
+        * max_workers: Optional[int] - worker processes, defaults to the cpu
+        count. 1 builds in this process
+
+        Returns:
+        * summary: Dict - built and skipped ids, and total bytes by variant
+        '''
+        if not PILLOW_AVAILABLE:
+            print('Building image assets requires Pillow. Skipping')
+            return {'built': [], 'skipped': [], 'bytes': {}}
+        try:
+            with open(self.manifest_loc, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        ## settings changes invalidate every entry ##
+        entries = {}
+        if manifest.get('version') == MANIFEST_VERSION and manifest.get('variants') == VARIANTS:
+            entries = manifest['stadiums']
+        stadium_ids = self.source_ids()
+        to_build = [
+            stadium_id for stadium_id in stadium_ids
+            if force or optimize_sources or not self.is_current(stadium_id, entries.get(stadium_id))
+        ]
+        max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        max_workers = max(1, min(max_workers, len(to_build)))
+        args = [(stadium_id, self.assets_loc, optimize_sources) for stadium_id in to_build]
+        if max_workers == 1:
+            built = [build_stadium(*arg) for arg in args]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                built = list(executor.map(build_stadium, *zip(*args)))
+        ## drop stadiums whose source was removed ##
+        stadiums = {
+            stadium_id: entries[stadium_id] for stadium_id in stadium_ids
+            if stadium_id in entries
+        }
+        stadiums.update(dict(zip(to_build, built)))
+        content = json.dumps({
+            'version': MANIFEST_VERSION,
+            'variants': VARIANTS,
+            'stadiums': stadiums
+        }, indent=2, sort_keys=True)
+        try:
+            with open(self.manifest_loc, 'r') as f:
+                unchanged = f.read() == content
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            with open(self.manifest_loc, 'w') as f:
+                f.write(content)
+        summary = {
+            'built': to_build,
+            'skipped': [stadium_id for stadium_id in stadium_ids if stadium_id not in to_build],
+            'bytes': {
+                name: sum(entry[name]['bytes'] for entry in stadiums.values())
+                for name in ['png'] + list(VARIANTS.keys())
+            }
+        }
+        print('Built {0} stadiums, skipped {1}. Total bytes: {2}'.format(
+            len(summary['built']), len(summary['skipped']),
+            ', '.join('{0} {1:,}'.format(name, size) for name, size in summary['bytes'].items())
+        ))
+        return summary
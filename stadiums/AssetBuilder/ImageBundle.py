@@ -0,0 +1,180 @@
+## built-ins ##
+import os
+import mmap
+import json
+import struct
+import pathlib
+from typing import Dict, List, Optional
+
+## internal ##
+from .AssetBuilder import ASSETS_LOC, MANIFEST_LOC, load_asset_manifest
+
+## file layout ##
+BUNDLE_MAGIC = b'STADBNDL'
+BUNDLE_VERSION = 1
+## magic, version, and header length ##
+PREAMBLE = struct.Struct('<8sII')
+## blobs start on a page boundary and are aligned within it ##
+DATA_ALIGN = 4096
+BLOB_ALIGN = 64
+BUNDLES_LOC = '{0}/Bundles'.format(ASSETS_LOC)
+
+def bundle_path(variant: str, bundles_loc: str = BUNDLES_LOC) -> str:
+    return '{0}/{1}.bundle'.format(bundles_loc, variant)
+
+def aligned(offset: int, alignment: int) -> int:
+    return -(-offset // alignment) * alignment
+
+def write_bundle(
+    variant: str = 'webp',
+    path: Optional[str] = None,
+    assets_loc: str = ASSETS_LOC,
+    manifest_loc: Optional[str] = None
+) -> str:
+    '''
+    Pack every image of a variant in the asset manifest into a single bundle
+    file. The file is a fixed preamble, a json header index of
+    stadium_id -> [offset, length, format], and the image bytes. Offsets are
+    from the start of the file, so a reader can slice blobs straight out of a
+    memory map
+
+    Stadiums are packed in id order and the header holds no timestamps, so
+    the same manifest always packs to the same bytes
+
+    Parameters:
+    * variant: str - png, or a variant in the manifest, ie webp or thumb
+    * path: Optional[str] - bundle file, defaults to Bundles/<variant>.bundle in assets_loc
+    * assets_loc: str - assets folder the manifest paths are relative to
+    * manifest_loc: Optional[str] - defaults to the manifest in assets_loc
+
+    Returns:
+    * path: str - the bundle written
+    '''
+    if manifest_loc is None:
+        manifest_loc = MANIFEST_LOC if assets_loc == ASSETS_LOC else '{0}/manifest.json'.format(assets_loc)
+    if path is None:
+        path = bundle_path(variant, '{0}/Bundles'.format(assets_loc))
+    entries = load_asset_manifest(manifest_loc)
+    records = [
+        (stadium_id, entries[stadium_id][variant])
+        for stadium_id in sorted(entries.keys())
+        if variant in entries[stadium_id]
+    ]
+    if len(records) == 0:
+        raise ValueError('No {0} images in the asset manifest at {1}'.format(variant, manifest_loc))
+    ## the header size depends on the offsets, which depend on the header
+    ## size, so lay out the blobs after a header padded to the page size ##
+    header = b''
+    data_start = -1
+    while aligned(PREAMBLE.size + len(header), DATA_ALIGN) != data_start:
+        data_start = aligned(PREAMBLE.size + len(header), DATA_ALIGN)
+        offset = data_start
+        index = {}
+        for stadium_id, record in records:
+            index[stadium_id] = [offset, record['bytes'], record['path'].rsplit('.', 1)[-1]]
+            offset = aligned(offset + record['bytes'], BLOB_ALIGN)
+        header = json.dumps(
+            {'variant': variant, 'images': index},
+            sort_keys=True, separators=(',', ':')
+        ).encode('utf-8')
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = '{0}.tmp'.format(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(header)))
+        f.write(header)
+        for stadium_id, record in records:
+            with open('{0}/{1}'.format(assets_loc, record['path']), 'rb') as img:
+                content = img.read()
+            if len(content) != record['bytes']:
+                raise ValueError('{0} does not match the asset manifest. Rebuild the assets'.format(record['path']))
+            f.write(b'\x00' * (index[stadium_id][0] - f.tell()))
+            f.write(content)
+    os.replace(tmp_path, path)
+    return path
+
+class ImageBundle:
+    '''
+    Read only, memory mapped view of a bundle from write_bundle
+
+    Opening a bundle maps the file and parses the header once. Images are
+    returned as memoryview slices of the map, so serving one is a dict lookup
+    with no file open, stat, or copy. Workers that open the same bundle share
+    its pages through the os page cache
+
+    Slices from get hold the map open, so they must be released (ie deleted,
+    or released with view.release()) before the bundle is closed or the with
+    block ends, otherwise close raises BufferError. Use bytes(view) to keep a
+    copy instead
+
+    > with ImageBundle(bundle_path('thumb')) as bundle:
+    >     img = bytes(bundle.get('KAN00'))
+
+    Parameters:
+    * path: str - bundle file
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_len = PREAMBLE.unpack_from(self.mm, 0)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            self.mm.close()
+            raise ValueError('{0} is not a version {1} image bundle'.format(path, BUNDLE_VERSION))
+        header = json.loads(self.mm[PREAMBLE.size:PREAMBLE.size + header_len])
+        self.variant: str = header['variant']
+        self.index: Dict[str, List] = header['images']
+        self.view = memoryview(self.mm)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, stadium_id: str) -> bool:
+        return stadium_id in self.index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        ## do not mask an exception raised in the block with a BufferError
+        ## from slices it left alive ##
+        if exc_type is None:
+            self.close()
+        else:
+            try:
+                self.close()
+            except BufferError:
+                pass
+
+    def stadium_ids(self) -> List[str]:
+        return list(self.index.keys())
+
+    def get(self, stadium_id: str) -> Optional[memoryview]:
+        '''
+        Zero copy view of a stadium's image, or None if it is not in the bundle
+        '''
+        record = self.index.get(stadium_id)
+        if record is None:
+            return None
+        return self.view[record[0]:record[0] + record[1]]
+
+    def format(self, stadium_id: str) -> Optional[str]:
+        '''
+        Image format of a stadium's blob, ie webp
+        '''
+        record = self.index.get(stadium_id)
+        return None if record is None else record[2]
+
+    def close(self):
+        '''
+        Release the map. Raises BufferError if slices from get are still
+        alive, and leaves the bundle open and usable
+        '''
+        if self.mm.closed:
+            return
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            ## the map is untouched, so restore the view ##
+            self.view = memoryview(self.mm)
+            raise BufferError('{0} has image slices that are still in use'.format(self.path))
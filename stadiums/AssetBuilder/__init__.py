@@ -0,0 +1,2 @@
+from .AssetBuilder import AssetBuilder, load_asset_manifest, asset_url, ASSET_URL_BASE, PILLOW_AVAILABLE
+from .ImageBundle import ImageBundle, write_bundle, bundle_path
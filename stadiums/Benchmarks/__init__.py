@@ -0,0 +1,3 @@
+from .bench_elo import bench_elo
+from .bench_pipeline import bench_pipeline, compare_results
+from .bench_hfa_query import bench_hfa_query
@@ -0,0 +1,43 @@
+## built-ins ##
+import time
+
+## internal ##
+from ..Analytics.Elo import EloModel
+
+def bench_elo(repeat: int = 3) -> dict:
+    '''
+    Benchmarks the array backed EloModel.run against the row based
+    EloModel.run_rows over the full games history, and validates that both
+    produce identical recs
+
+    Parameters:
+    * repeat: int - number of timed runs for each implementation, best is reported
+
+    Returns:
+    * results: dict
+    '''
+    timings = {'run_rows': [], 'run': []}
+    recs = {}
+    for method in ['run_rows', 'run']:
+        for _ in range(repeat):
+            model = EloModel(use_checkpoint=False)
+            start = time.perf_counter()
+            getattr(model, method)()
+            timings[method].append(time.perf_counter() - start)
+            recs[method] = model.recs
+    if recs['run'] != recs['run_rows']:
+        raise ValueError('Engine recs do not match the row based model')
+    results = {
+        'games': len(model.games),
+        'recs': len(recs['run']),
+        'run_rows_seconds': min(timings['run_rows']),
+        'run_seconds': min(timings['run']),
+        'speedup': min(timings['run_rows']) / min(timings['run'])
+    }
+    print('Elo over {0} games: rows {1:.3f}s, engine {2:.3f}s ({3:.1f}x)'.format(
+        results['games'],
+        results['run_rows_seconds'],
+        results['run_seconds'],
+        results['speedup']
+    ))
+    return results
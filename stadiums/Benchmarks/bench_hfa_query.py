@@ -0,0 +1,98 @@
+## built-ins ##
+import time
+
+## external ##
+import pandas as pd
+import numpy
+
+## internal ##
+from ..Models import HFAIndex
+from ..Outputs import SeasonStore
+from ..Models.HFAIndex import TEAM_HFA_LOC
+
+def pandas_asof(df: pd.DataFrame, team: str, stadium: str, season: int, week: int) -> float:
+    '''
+    As of lookup with a pandas filter, the approach HFAIndex replaces
+    '''
+    rows = df[
+        (df['team'] == team) &
+        (df['stadium'] == stadium) &
+        ((df['season'] < season) | ((df['season'] == season) & (df['week'] <= week)))
+    ]
+    return rows['hfa_l16'].iloc[-1] if len(rows) > 0 else numpy.nan
+
+def bench_hfa_query(
+    queries: int = 10000,
+    pandas_queries: int = 200,
+    loc: str = TEAM_HFA_LOC,
+    seed: int = 1
+) -> dict:
+    '''
+    Benchmarks HFAIndex point and batch as of lookups against filtering the
+    rolling team hfa frame with pandas, and validates that they agree
+
+    Queries are random (team, stadium) pairs from the data at random weeks,
+    so some fall before a pair's first row or after its last. The pandas
+    filter is slow, so it is only timed over the first pandas_queries
+
+    Parameters:
+    * queries: int - number of random queries
+    * pandas_queries: int - number of queries to time with pandas
+    * loc: str - rolling team hfa SeasonStore
+    * seed: int - seed for the queries
+
+    Returns:
+    * results: dict - seconds per lookup for each approach
+    '''
+    df = SeasonStore(loc, group_cols=['team', 'stadium']).read()
+    start = time.perf_counter()
+    index = HFAIndex(df)
+    build_seconds = time.perf_counter() - start
+    ## random queries ##
+    rng = numpy.random.default_rng(seed)
+    pairs = df[['team', 'stadium']].drop_duplicates().to_numpy(dtype=object)
+    picks = pairs[rng.integers(0, len(pairs), queries)]
+    teams = picks[:, 0]
+    stadiums = picks[:, 1]
+    seasons = rng.integers(df['season'].min(), df['season'].max() + 2, queries)
+    weeks = rng.integers(1, 23, queries)
+    ## pandas ##
+    start = time.perf_counter()
+    expected = numpy.array([
+        pandas_asof(df, teams[i], stadiums[i], seasons[i], weeks[i])
+        for i in range(pandas_queries)
+    ])
+    pandas_seconds = (time.perf_counter() - start) / pandas_queries
+    ## point ##
+    args = list(zip(teams.tolist(), stadiums.tolist(), seasons.tolist(), weeks.tolist()))
+    start = time.perf_counter()
+    point = [index.asof(*arg) for arg in args]
+    point_seconds = (time.perf_counter() - start) / queries
+    ## batch ##
+    start = time.perf_counter()
+    batch = index.lookup(teams, stadiums, seasons, weeks)
+    batch_seconds = (time.perf_counter() - start) / queries
+    if not (
+        numpy.array_equal(numpy.array(point), batch, equal_nan=True) and
+        numpy.array_equal(batch[:pandas_queries], expected, equal_nan=True)
+    ):
+        raise ValueError('HFAIndex lookups do not match the pandas filter')
+    results = {
+        'rows': len(index),
+        'queries': queries,
+        'build_seconds': build_seconds,
+        'pandas_seconds': pandas_seconds,
+        'point_seconds': point_seconds,
+        'batch_seconds': batch_seconds,
+        'point_speedup': pandas_seconds / point_seconds,
+        'batch_speedup': pandas_seconds / batch_seconds
+    }
+    print('HFA as of lookups over {0} rows: pandas {1:.1f}us, point {2:.2f}us ({3:.0f}x), batch {4:.3f}us ({5:.0f}x)'.format(
+        results['rows'],
+        pandas_seconds * 1e6,
+        point_seconds * 1e6,
+        results['point_speedup'],
+        batch_seconds * 1e6,
+        results['batch_speedup']
+    ))
+    return results
@@ -0,0 +1,274 @@
+## built-ins ##
+import json
+import time
+import pathlib
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+## external ##
+import pandas as pd
+import numpy
+
+## internal ##
+from ..DataLoader import data
+from ..Analytics.Elo import EloModel
+from ..Analytics.calc_analytics import gen_hfa
+from ..Analytics.gen_team_stadiums import gen_team_stadiums
+from ..Models import StadiumCollection
+from ..Models.Utilities import WikipediaScraper, add_fastr_meta
+from .fixtures import (
+    gen_fixture_frames, write_fixture_frames,
+    write_infobox_fixtures, serve_fixtures
+)
+
+def time_stage(func: Callable, repeat: int, setup: Optional[Callable] = None) -> Dict:
+    '''
+    Times func over repeat runs. If provided, setup is called before each run,
+    outside of the timing, and its result is passed to func
+
+    Returns:
+    * stage: Dict - best and all run times in seconds, and the last result
+    '''
+    runs = []
+    result = None
+    for _ in range(repeat):
+        args = setup() if setup is not None else None
+        start = time.perf_counter()
+        result = func(args) if setup is not None else func()
+        runs.append(time.perf_counter() - start)
+    return {
+        'seconds': min(runs),
+        'runs': runs,
+        'result': result
+    }
+
+def git_commit() -> Optional[str]:
+    '''
+    Commit of the working tree, if it is a git repo
+    '''
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=pathlib.Path(__file__).parent.resolve(),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_pipeline(
+    seasons: int = 25,
+    teams: int = 32,
+    stadiums: int = 40,
+    repeat: int = 3,
+    paragraphs: int = 200,
+    output_path: Optional[str] = None,
+    seed: int = 1
+) -> Dict:
+    '''
+    Benchmarks each stage of update_stadiums against synthetic fixtures. Games,
+    qbelo and wt_ratings are generated and loaded through the DataLoader cache,
+    and fixture infobox pages are served from localhost, so nothing is downloaded
+    and nothing in the package data folder or caches is written
+
+    Stages are timed separately and the best of repeat runs is reported:
+    * elo_run: EloModel.run over all played games
+    * gen_hfa: elo and rolling hfa windows
+    * add_fastr_meta: stadium meta from the games
+    * gen_team_stadiums: team <> stadium aggregation and csv write
+    * scrape_cold: WikipediaScraper.get_wikipedia_data for every stadium with an empty cache
+    * scrape_warm: the same with every page and parse result cached
+    * parse_infobox: parsing every page without the cache
+    * collection_to_csv / collection_from_csv: StadiumCollection.to_csv and populate_from_csv
+
+    Parameters:
+    * seasons: int - seasons of synthetic games
+    * teams: int - teams in the synthetic league
+    * stadiums: int - stadiums in the synthetic league, each with a fixture page
+    * repeat: int - timed runs per stage
+    * paragraphs: int - article paragraphs per fixture page
+    * output_path: Optional[str] - json file for the results, defaults to
+    Benchmarks/results/<timestamp>_<commit>.json
+    * seed: int - random seed for the fixtures
+
+    Returns:
+    * results: Dict
+    '''
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': numpy.__version__,
+            'repeat': repeat
+        },
+        'sizes': {
+            'seasons': seasons,
+            'teams': teams,
+            'stadiums': stadiums,
+            'paragraphs': paragraphs
+        },
+        'stages': {}
+    }
+    stages = results['stages']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            ## fixtures ##
+            frames = gen_fixture_frames(seasons=seasons, teams=teams, stadiums=stadiums, seed=seed)
+            write_fixture_frames(frames, '{0}/tables'.format(tmp_dir))
+            results['sizes']['games'] = len(data.db['games'])
+            ## elo ##
+            stage = time_stage(lambda: EloModel(use_checkpoint=False).run(), repeat)
+            stages['elo_run'] = {'seconds': stage['seconds'], 'runs': stage['runs']}
+            ## hfa ##
+            stage = time_stage(lambda: gen_hfa(use_checkpoint=False), repeat)
+            team_hfa, league_hfa = stage['result']
+            stages['gen_hfa'] = {
+                'seconds': stage['seconds'], 'runs': stage['runs'], 'rows': len(team_hfa)
+            }
+            ## stadium collection from the games, as in update_stadiums ##
+            games = data.db['games']
+            recs = games.groupby('stadium_id', observed=True).tail(1)[[
+                'stadium_id', 'stadium'
+            ]].rename(columns={
+                'stadium': 'stadium_name'
+            }).to_dict(orient='records')
+            collection = StadiumCollection()
+            collection.extend_from_recs(recs)
+            stage = time_stage(lambda: add_fastr_meta(collection), repeat)
+            stages['add_fastr_meta'] = {
+                'seconds': stage['seconds'], 'runs': stage['runs'], 'rows': len(collection.stadiums)
+            }
+            stage = time_stage(
+                lambda: gen_team_stadiums(collection, team_hfa, output_loc=tmp_dir),
+                repeat
+            )
+            stages['gen_team_stadiums'] = {
+                'seconds': stage['seconds'], 'runs': stage['runs'], 'rows': len(stage['result'])
+            }
+            ## scraper ##
+            page_dir = '{0}/pages'.format(tmp_dir)
+            write_infobox_fixtures(list(collection.stadiums.keys()), page_dir, seed, paragraphs)
+            with serve_fixtures(page_dir) as base_url:
+                for stadium_id, stadium in collection.stadiums.items():
+                    stadium.wikipedia_url = '{0}/{1}.html'.format(base_url, stadium_id)
+                def scrape_all(scraper: WikipediaScraper) -> Dict:
+                    scraped = {
+                        stadium_id: scraper.get_wikipedia_data(stadium_id, stadium.wikipedia_url)
+                        for stadium_id, stadium in collection.stadiums.items()
+                    }
+                    scraper.cache.flush()
+                    return scraped
+                cache_dirs = iter(range(repeat))
+                stage = time_stage(
+                    scrape_all,
+                    repeat,
+                    setup=lambda: WikipediaScraper(
+                        cache_dir='{0}/scrape_cold_{1}'.format(tmp_dir, next(cache_dirs))
+                    )
+                )
+                stages['scrape_cold'] = {
+                    'seconds': stage['seconds'], 'runs': stage['runs'], 'rows': len(stage['result'])
+                }
+                scraped = stage['result']
+                warm_scraper = WikipediaScraper(cache_dir='{0}/scrape_warm'.format(tmp_dir))
+                scrape_all(warm_scraper)
+                stage = time_stage(lambda: scrape_all(warm_scraper), repeat)
+                stages['scrape_warm'] = {
+                    'seconds': stage['seconds'], 'runs': stage['runs'], 'rows': len(stage['result'])
+                }
+                pages = [
+                    warm_scraper.request_html_text(stadium_id, stadium.wikipedia_url)
+                    for stadium_id, stadium in collection.stadiums.items()
+                ]
+                stage = time_stage(
+                    lambda: [warm_scraper.parse_infobox(html) for html in pages],
+                    repeat
+                )
+                stages['parse_infobox'] = {
+                    'seconds': stage['seconds'], 'runs': stage['runs'], 'rows': len(pages)
+                }
+            ## collection io, with the scraped data so every column is filled ##
+            for stadium_id, stadium in collection.stadiums.items():
+                stadium.apply_wikipedia_data(scraped[stadium_id])
+            collection.mark_changed()
+            csv_path = '{0}/stadiums.csv'.format(tmp_dir)
+            stage = time_stage(lambda: collection.to_csv(csv_path), repeat)
+            stages['collection_to_csv'] = {
+                'seconds': stage['seconds'], 'runs': stage['runs'], 'rows': len(collection.stadiums)
+            }
+            stage = time_stage(
+                lambda new_collection: new_collection.populate_from_csv(csv_path),
+                repeat,
+                setup=StadiumCollection
+            )
+            stages['collection_from_csv'] = {
+                'seconds': stage['seconds'], 'runs': stage['runs'], 'rows': len(collection.stadiums)
+            }
+        finally:
+            ## drop the fixture tables and return the loader to its default cache ##
+            data.configure()
+    ## save ##
+    if output_path is None:
+        output_path = '{0}/results/{1}_{2}.json'.format(
+            pathlib.Path(__file__).parent.resolve(),
+            results['meta']['timestamp'].replace(':', '').replace('-', ''),
+            results['meta']['commit'] or 'local'
+        )
+    pathlib.Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_results(results)
+    print('Saved benchmark results to {0}'.format(output_path))
+    return results
+
+def print_results(results: Dict):
+    '''
+    Print a summary table of benchmark results
+    '''
+    print('Benchmark {0} ({1} games, {2} stadiums)'.format(
+        results['meta']['commit'] or 'local',
+        results['sizes'].get('games'),
+        results['sizes']['stadiums']
+    ))
+    for name, stage in results['stages'].items():
+        print('  {0:<22}{1:>10.4f}s'.format(name, stage['seconds']))
+
+def compare_results(base_path: str, new_path: str, threshold: float = 1.1) -> Dict[str, float]:
+    '''
+    Compare two benchmark result files stage by stage. Stages where new is
+    slower than base by more than threshold are flagged as regressions
+
+    Parameters:
+    * base_path: str - results of the base commit
+    * new_path: str - results of the new commit
+    * threshold: float - ratio of new to base seconds that counts as a regression
+
+    Returns:
+    * ratios: Dict[str, float] - new / base seconds for each stage in both files
+    '''
+    with open(base_path, 'r') as f:
+        base = json.load(f)
+    with open(new_path, 'r') as f:
+        new = json.load(f)
+    if base['sizes'] != new['sizes']:
+        print('Warning: fixture sizes differ between results')
+    ratios = {}
+    print('{0:<22}{1:>10}{2:>10}{3:>8}'.format(
+        'stage', base['meta']['commit'] or 'base', new['meta']['commit'] or 'new', 'ratio'
+    ))
+    for name, stage in new['stages'].items():
+        if name not in base['stages']:
+            continue
+        ratios[name] = stage['seconds'] / base['stages'][name]['seconds']
+        print('{0:<22}{1:>10.4f}{2:>10.4f}{3:>8.2f}{4}'.format(
+            name,
+            base['stages'][name]['seconds'],
+            stage['seconds'],
+            ratios[name],
+            '  REGRESSION' if ratios[name] > threshold else ''
+        ))
+    return ratios
@@ -0,0 +1,221 @@
+## built-ins ##
+import os
+import pathlib
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from functools import partial
+from typing import Dict, Iterator, List
+
+## external ##
+import pandas as pd
+import numpy
+
+## internal ##
+from ..DataLoader import data
+
+## surfaces and roofs use the raw nflverse values so the fastr meta maps apply ##
+SURFACES = ['grass', 'fieldturf', 'sportturf', 'a_turf', 'matrixturf', 'astroturf']
+ROOFS = ['outdoors', 'dome', 'closed', 'open']
+
+def gen_fixture_frames(
+    seasons: int = 25,
+    teams: int = 32,
+    stadiums: int = 40,
+    weeks: int = 18,
+    unplayed_weeks: int = 3,
+    first_season: int = 2000,
+    seed: int = 1
+) -> Dict[str, pd.DataFrame]:
+    '''
+    Generates synthetic versions of the raw datasets loaded by the DataLoader
+
+    Each team has a home stadium. Stadiums beyond the number of teams are
+    new homes that teams move into halfway through the history, and ~2% of
+    games are played at a random neutral site. The last unplayed_weeks of the
+    final season have no result, like a schedule that is still in progress
+
+    Parameters:
+    * seasons: int - number of seasons
+    * teams: int - number of teams
+    * stadiums: int - number of stadiums
+    * weeks: int - weeks per season
+    * unplayed_weeks: int - weeks at the end of the final season with no result
+    * first_season: int - first season of the history
+    * seed: int - random seed
+
+    Returns:
+    * frames: Dict[str, pd.DataFrame] - games, qbelo, and wt_ratings
+    '''
+    rng = numpy.random.default_rng(seed)
+    team_ids = numpy.array(['T{0:02d}'.format(i) for i in range(teams)])
+    stadium_ids = numpy.array(['S{0:03d}'.format(i) for i in range(stadiums)])
+    last_season = first_season + seasons - 1
+    move_season = first_season + seasons // 2
+    ## schedule, pairing a permutation of teams every week ##
+    pairs = teams // 2
+    season_col = numpy.repeat(numpy.arange(first_season, last_season + 1), weeks * pairs)
+    week_col = numpy.tile(numpy.repeat(numpy.arange(1, weeks + 1), pairs), seasons)
+    perms = numpy.argsort(rng.random((seasons * weeks, teams)), axis=1)[:, :pairs * 2]
+    home_idx = perms[:, 0::2].ravel()
+    away_idx = perms[:, 1::2].ravel()
+    n = len(home_idx)
+    ## home stadiums ##
+    extra = max(stadiums - teams, 0)
+    stadium_idx = home_idx % stadiums
+    moved = (home_idx < extra) & (season_col >= move_season)
+    stadium_idx[moved] = teams + home_idx[moved]
+    neutral = rng.random(n) < 0.02
+    stadium_idx[neutral] = rng.integers(0, stadiums, neutral.sum())
+    ## results ##
+    result = (rng.normal(2, 13, n)).round().astype(numpy.float32)
+    unplayed = (season_col == last_season) & (week_col > weeks - unplayed_weeks)
+    result[unplayed] = numpy.nan
+    game_ids = pd.Series([
+        '{0}_{1:02d}_{2}_{3}'.format(s, w, a, h) for s, w, a, h in zip(
+            season_col, week_col, team_ids[away_idx], team_ids[home_idx]
+        )
+    ])
+    gamedays = (
+        pd.to_datetime(pd.Series(season_col).astype(str) + '-09-07') +
+        pd.to_timedelta((week_col - 1) * 7, unit='D')
+    ).dt.strftime('%Y-%m-%d')
+    games = pd.DataFrame({
+        'game_id': game_ids,
+        'season': season_col.astype(numpy.int32),
+        'game_type': 'REG',
+        'week': week_col.astype(numpy.int32),
+        'gameday': gamedays,
+        'weekday': 'Sunday',
+        'gametime': '13:00',
+        'away_team': team_ids[away_idx],
+        'away_score': numpy.float32(numpy.nan),
+        'home_team': team_ids[home_idx],
+        'home_score': numpy.float32(numpy.nan),
+        'location': numpy.where(neutral, 'Neutral', 'Home'),
+        'result': result,
+        'total': numpy.float32(numpy.nan),
+        'away_rest': numpy.int32(7),
+        'home_rest': numpy.int32(7),
+        'roof': numpy.array(ROOFS)[stadium_idx % len(ROOFS)],
+        'surface': numpy.array(SURFACES)[stadium_idx % len(SURFACES)],
+        'temp': numpy.float32(numpy.nan),
+        'wind': numpy.float32(numpy.nan),
+        'referee': 'Referee',
+        'stadium_id': stadium_ids[stadium_idx],
+        'stadium': ['Stadium {0}'.format(s) for s in stadium_ids[stadium_idx]]
+    })
+    ## qb adjustments are mostly 0, with a backup qb in ~15% of games ##
+    qbelo = pd.DataFrame({
+        'game_id': game_ids,
+        'season': season_col.astype(numpy.int32),
+        'team1': team_ids[home_idx],
+        'team2': team_ids[away_idx],
+        'qb1_adj': numpy.where(rng.random(n) < 0.15, rng.normal(0, 15, n), 0).astype(numpy.float32),
+        'qb2_adj': numpy.where(rng.random(n) < 0.15, rng.normal(0, 15, n), 0).astype(numpy.float32)
+    })
+    wt_ratings = pd.DataFrame({
+        'team': numpy.tile(team_ids, seasons),
+        'season': numpy.repeat(numpy.arange(first_season, last_season + 1), teams).astype(numpy.int32),
+        'wt_rating_elo': rng.normal(1505, 60, teams * seasons).astype(numpy.float32)
+    })
+    return {
+        'games': games,
+        'qbelo': qbelo,
+        'wt_ratings': wt_ratings
+    }
+
+def write_fixture_frames(frames: Dict[str, pd.DataFrame], fixture_dir: str):
+    '''
+    Writes fixture frames as DataLoader cache files and points the DataLoader
+    at them, so the package runs against the fixtures without any downloads
+    '''
+    pathlib.Path(fixture_dir).mkdir(parents=True, exist_ok=True)
+    data.configure(cache_dir=fixture_dir, max_age=None)
+    for name, df in frames.items():
+        data.write_cache(name, df)
+
+def gen_infobox_html(stadium_id: str, seed: int = 1, paragraphs: int = 200) -> str:
+    '''
+    Generates a Wikipedia style stadium page, with an infobox and article
+    body, that exercises each field of WikipediaScraper.parse_infobox
+
+    Parameters:
+    * stadium_id: str - stadium the page describes
+    * seed: int - random seed
+    * paragraphs: int - paragraphs of article text after the infobox. Real
+    stadium pages are mostly article text, which the parser must skip
+
+    Returns:
+    * html: str
+    '''
+    rng = numpy.random.default_rng([seed, int(stadium_id[1:]) if stadium_id[1:].isdigit() else 0])
+    opened = int(rng.integers(1960, 2020))
+    cost = int(rng.integers(50, 1500))
+    rows = [
+        '<tr><td colspan="2" class="infobox-image"><span><img src="//upload.wikimedia.org/{0}_logo.png"></span></td></tr>'.format(stadium_id),
+        '<tr><td colspan="2" class="infobox-image"><span><img src="//upload.wikimedia.org/{0}_aerial.jpg"></span></td></tr>'.format(stadium_id),
+        '<tr><th class="infobox-label">Owner</th><td class="infobox-data">City of {0}</td></tr>'.format(stadium_id),
+        '<tr><th class="infobox-label">Operator</th><td class="infobox-data"><ul><li>{0} Authority</li><li>{0} Events</li></ul></td></tr>'.format(stadium_id),
+        '<tr><th class="infobox-label">Capacity</th><td class="infobox-data">{0:,}<sup>[1]</sup></td></tr>'.format(int(rng.integers(50000, 90000))),
+        '<tr><th class="infobox-label">Broke ground</th><td class="infobox-data">March {0}, {1}</td></tr>'.format(int(rng.integers(1, 28)), opened - 2),
+        '<tr><th class="infobox-label">Opened</th><td class="infobox-data">September {0}, {1}</td></tr>'.format(int(rng.integers(1, 28)), opened),
+        '<tr><th class="infobox-label">Renovated</th><td class="infobox-data">{0}, {1}</td></tr>'.format(opened + 10, opened + 20),
+        '<tr><th class="infobox-label">Expanded</th><td class="infobox-data">{0}</td></tr>'.format(opened + 5),
+        '<tr><th class="infobox-label">Construction cost</th><td class="infobox-data">US${0} million<br>(${1} million in 2023 dollars)</td></tr>'.format(cost, cost * 2),
+        '<tr><th class="infobox-label">Architect</th><td class="infobox-data">{0} Architects</td></tr>'.format(stadium_id),
+        '<tr><th colspan="2" class="infobox-header">Website</th></tr>',
+        '<tr><td colspan="2" class="infobox-full-data"><a href="https://www.{0}.com">{0}.com</a></td></tr>'.format(stadium_id.lower())
+    ]
+    body = '\n'.join([
+        '<p>Stadium {0} is a multi-purpose stadium. Paragraph {1} of the article, '
+        'with a <a href="/wiki/Link_{1}">link</a> and a citation<sup>[{1}]</sup>.</p>'.format(stadium_id, i)
+        for i in range(paragraphs)
+    ])
+    return (
+        '<!DOCTYPE html><html><head><title>Stadium {0}</title></head><body>'
+        '<div id="content"><h1>Stadium {0}</h1>'
+        '<table class="infobox vcard"><tbody>'
+        '<tr><th colspan="2" class="infobox-above">Stadium {0}'
+        '<div class="nickname">"The {0}", "Home of the {0}"</div></th></tr>'
+        '{1}</tbody></table>{2}</div></body></html>'
+    ).format(stadium_id, ''.join(rows), body)
+
+def write_infobox_fixtures(
+    stadium_ids: List[str],
+    fixture_dir: str,
+    seed: int = 1,
+    paragraphs: int = 200
+):
+    '''
+    Writes a <stadium_id>.html fixture page for each stadium to fixture_dir
+    '''
+    pathlib.Path(fixture_dir).mkdir(parents=True, exist_ok=True)
+    for stadium_id in stadium_ids:
+        with open('{0}/{1}.html'.format(fixture_dir, stadium_id), 'w', encoding='utf-8') as f:
+            f.write(gen_infobox_html(stadium_id, seed, paragraphs))
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    '''
+    Static file handler that does not log each request
+    '''
+    def log_message(self, format, *args):
+        pass
+
+@contextlib.contextmanager
+def serve_fixtures(fixture_dir: str) -> Iterator[str]:
+    '''
+    Serves fixture_dir over http on localhost from a background thread, so
+    the scraper can be timed without reaching Wikipedia. Yields the base url
+    '''
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', 0),
+        partial(QuietHandler, directory=os.fspath(fixture_dir))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -1,75 +1,237 @@
 ## built-ins ##
+import os
+import time
+import pathlib
+from collections.abc import Mapping
+from typing import Dict, Optional
 
 ## external ##
 import pandas as pd
-import nfelodcm as dcm
+
+## internal ##
+from ..Instrumentation import instrument
+from .TeamTranslator import team_translator
+
+## parquet requires pyarrow, and pickle is used if it is not installed ##
+try:
+    import pyarrow
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'pkl'
+
+## columns of the nfelodcm games table used by the package ##
+GAMES_COLUMNS = [
+    'game_id', 'season', 'game_type', 'week', 'gameday',
+    'home_team', 'away_team', 'location', 'result',
+    'stadium_id', 'stadium', 'surface', 'roof'
+]
+## compact dtypes for the games table. Team columns share a categorical
+## dtype that is built from the data ##
+GAMES_DTYPES = {
+    'season': 'int16',
+    'week': 'int8',
+    'game_type': 'category',
+    'location': 'category',
+    'stadium_id': 'category',
+    'stadium': 'category'
+}
+
+class LazyTables(Mapping):
+    '''
+    Read only mapping of table name to dataframe that loads each table from
+    the DataLoader on first access
+    '''
+    def __init__(self, loader: 'DataLoader'):
+        self.loader = loader
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        return self.loader.get_table(name)
+
+    def __iter__(self):
+        return iter(self.loader.tables)
+
+    def __len__(self) -> int:
+        return len(self.loader.tables)
 
 class DataLoader:
     '''
     Handles the loading of external data for various package functions. Leverages
     a singleton pattern to allow for sharing of loaded data across functions without
     re-triggering data loads on each usage
+
+    Nothing is loaded on init. Each dataset is fetched on first access through
+    db, and the raw download is saved to a local cache so that later processes
+    can reuse it while it is younger than max_age. Use configure to point the
+    cache at another directory, ie fixture files for offline use
     '''
     ## state ##
     _instance = None
     _initialized = False
+    ## tables exposed through db ##
+    tables = ['games', 'qbelo', 'wt_ratings']
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
-    
+
     def __init__(self):
         ## handle singleton pattern ##
         if self._initialized:
             return
-        ## load data ##
-        self.db = dcm.load(['games', 'qbelo', 'wt_ratings'])
-        self.fastr_games = pd.read_csv(
-            'https://raw.githubusercontent.com/nflverse/nfldata/refs/heads/master/data/games.csv'
-        )
-        self.apply_fastr_abbrs()
-        self.add_qb_adjustments()
+        self.configure()
+        self.db = LazyTables(self)
         self._initialized = True
-        
-    def apply_fastr_abbrs(self):
-        '''
-        Adds fastr style team abbreviations to the nfelodcm games dataframe
-        '''
-        ## load fastr team abbreviations ##
-        ## merge ##
-        self.db['games'] = pd.merge(
-            self.db['games'],
-            self.fastr_games.groupby(['game_id']).head(1)[[
-                'game_id', 'home_team', 'away_team'
-            ]].rename(
-                columns={
-                    'home_team': 'home_team_fastr',
-                    'away_team': 'away_team_fastr'
-                }
-            ),
-            on='game_id',
-            how='left'
+
+    def configure(self,
+        cache_dir: Optional[str] = None,
+        max_age: Optional[float] = 6 * 60 * 60
+    ):
+        '''
+        Set the local cache and clear any loaded data
+
+        Parameters:
+        * cache_dir: Optional[str] - directory for cached downloads, defaults to DataLoader/cache
+        * max_age: Optional[float] - seconds a cached download is considered fresh. None
+        never refreshes a cached file, ie for offline fixture files
+        '''
+        self.cache_dir = cache_dir if cache_dir is not None else '{0}/cache'.format(
+            pathlib.Path(__file__).parent.resolve()
         )
+        self.max_age = max_age
+        self.frames: Dict[str, pd.DataFrame] = {}
 
-    def add_qb_adjustments(self):
+    def get_table(self, name: str) -> pd.DataFrame:
+        '''
+        Return a table, loading it on first access
+        '''
+        if name not in self.frames:
+            if name == 'games':
+                with instrument.stage('gen_games') as stage:
+                    self.frames['games'] = self.gen_games()
+                    stage.rows = len(self.frames['games'])
+            elif name in self.tables:
+                self.frames[name] = self.load_raw(name)
+            else:
+                raise KeyError(name)
+        return self.frames[name]
+
+    ###########
+    ## CACHE ##
+    ###########
+    def get_cache_path(self, name: str) -> str:
+        '''
+        Local cache path of a raw dataset
+        '''
+        return '{0}/{1}.{2}'.format(self.cache_dir, name, CACHE_FORMAT)
+
+    def is_fresh(self, name: str) -> bool:
+        '''
+        Returns True if the dataset is cached and younger than max_age
         '''
-        Adds qb_adjustments to the nfelodcm games dataframe so they can
+        path = self.get_cache_path(name)
+        if not os.path.exists(path):
+            return False
+        if self.max_age is None:
+            return True
+        return time.time() - os.path.getmtime(path) < self.max_age
+
+    def read_cache(self, name: str) -> pd.DataFrame:
+        '''
+        Read a raw dataset from the local cache
+        '''
+        if CACHE_FORMAT == 'parquet':
+            return pd.read_parquet(self.get_cache_path(name))
+        return pd.read_pickle(self.get_cache_path(name))
+
+    def write_cache(self, name: str, df: pd.DataFrame):
+        '''
+        Write a raw dataset to the local cache
+        '''
+        try:
+            pathlib.Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+            tmp_path = '{0}.tmp'.format(self.get_cache_path(name))
+            if CACHE_FORMAT == 'parquet':
+                df.to_parquet(tmp_path, index=False)
+            else:
+                df.to_pickle(tmp_path)
+            os.replace(tmp_path, self.get_cache_path(name))
+        except Exception as e:
+            print('Data cache write error for {0}: {1}'.format(name, e))
+
+    def download(self, name: str) -> pd.DataFrame:
+        '''
+        Download a raw dataset from its source
+        '''
+        ## nfelodcm makes requests on import, so only import it when needed ##
+        import nfelodcm as dcm
+        return dcm.load([name])[name]
+
+    def load_raw(self, name: str) -> pd.DataFrame:
+        '''
+        Load a raw dataset from the local cache if it is fresh, otherwise
+        download it and update the cache
+        '''
+        if self.is_fresh(name):
+            with instrument.stage('read_cache_{0}'.format(name)) as stage:
+                df = self.read_cache(name)
+                stage.rows = len(df)
+            return df
+        with instrument.stage('download_{0}'.format(name)) as stage:
+            df = self.download(name)
+            stage.rows = len(df)
+        with instrument.stage('write_cache_{0}'.format(name)):
+            self.write_cache(name, df)
+        return df
+
+    ###########
+    ## GAMES ##
+    ###########
+    def gen_games(self) -> pd.DataFrame:
+        '''
+        Generate the compact games table used by the package from the nfelodcm
+        games. Only used columns are kept, with small ints and categoricals,
+        fastr abbreviations are translated, and qb adjustments are joined by
+        game_id.
+
+        Consumers share this frame and should filter or select from it rather
+        than copy or modify it
+        '''
+        raw = self.load_raw('games')
+        games = raw[[col for col in GAMES_COLUMNS if col in raw.columns]].astype({
+            col: dtype for col, dtype in GAMES_DTYPES.items() if col in raw.columns
+        })
+        ## home and away share a team dtype ##
+        team_dtype = pd.CategoricalDtype(sorted(
+            set(games['home_team'].dropna()) | set(games['away_team'].dropna())
+        ))
+        games['home_team'] = games['home_team'].astype(team_dtype)
+        games['away_team'] = games['away_team'].astype(team_dtype)
+        self.apply_fastr_abbrs(games)
+        self.add_qb_adjustments(games)
+        return games
+
+    def apply_fastr_abbrs(self, games: pd.DataFrame):
+        '''
+        Adds fastr style team abbreviations to the games dataframe. These are
+        translated from the nfelo abbreviations for the season of each game,
+        so games that are not in the nflverse schedule are covered too
+        '''
+        ## home and away share a fastr dtype ##
+        home = team_translator.to_fastr(games['home_team'], games['season'])
+        away = team_translator.to_fastr(games['away_team'], games['season'])
+        fastr_dtype = pd.CategoricalDtype(sorted(
+            set(home.cat.categories) | set(away.cat.categories)
+        ))
+        games['home_team_fastr'] = home.astype(fastr_dtype)
+        games['away_team_fastr'] = away.astype(fastr_dtype)
+
+    def add_qb_adjustments(self, games: pd.DataFrame):
+        '''
+        Adds qb_adjustments to the games dataframe so they can
         be used in a simple power ranking model to calculate opponent adjusted
         home field advantage
         '''
-        self.db['games'] = pd.merge(
-            self.db['games'],
-            self.db['qbelo'].groupby(['game_id']).head(1)[[
-                'game_id', 'qb1_adj', 'qb2_adj'
-            ]].rename(
-                columns={
-                    'qb1_adj': 'home_qb_adj',
-                    'qb2_adj': 'away_qb_adj'
-                }
-            ),
-            on='game_id',
-            how='left'
-        )
-        self.db['games']['home_qb_adj'] = self.db['games']['home_qb_adj'].fillna(0)
-        self.db['games']['away_qb_adj'] = self.db['games']['away_qb_adj'].fillna(0)
+        qbelo = self.db['qbelo'].drop_duplicates('game_id').set_index('game_id')
+        games['home_qb_adj'] = games['game_id'].map(qbelo['qb1_adj']).fillna(0)
+        games['away_qb_adj'] = games['game_id'].map(qbelo['qb2_adj']).fillna(0)
@@ -0,0 +1,114 @@
+## built-ins ##
+from typing import List, Optional, Tuple
+
+## external ##
+import pandas as pd
+import numpy
+
+## nfelo abbreviations whose fastr abbreviation depends on the season, as
+## (nfelo, first season, last season, fastr). None leaves a range open, and
+## all other abbreviations are the same in both ##
+ABBR_RANGES: List[Tuple[str, Optional[int], Optional[int], str]] = [
+    ## 2015 was the last year for STL ##
+    ('LAR', None, 2015, 'STL'),
+    ('LAR', 2016, None, 'LA'),
+    ## 2016 was the last year for SD ##
+    ('LAC', None, 2016, 'SD'),
+    ## 2019 was the last year for Oakland ##
+    ('OAK', 2020, None, 'LV')
+]
+
+class TeamTranslator:
+    '''
+    Translates team abbreviations between the nfelo style used by the package
+    and the fastr style used by nflfastR, in either direction, for any season
+
+    The ranges are compiled into a table of abbreviation x season bucket,
+    where buckets are split at every season a range starts or ends. A column
+    is translated by looking up the table for its unique abbreviations (or its
+    categories, when categorical) and taking from it with the column's codes
+    and the bucket of each season. The string work is done once per
+    abbreviation rather than once per row, and the result is categorical
+
+    Parameters:
+    * ranges: List[Tuple] - (nfelo, first season, last season, fastr)
+    '''
+    def __init__(self, ranges: List[Tuple[str, Optional[int], Optional[int], str]] = ABBR_RANGES):
+        self.ranges = ranges
+        ## season buckets. Bucket i holds seasons from breaks[i - 1] to breaks[i] - 1 ##
+        self.breaks = numpy.unique(
+            [r[1] for r in ranges if r[1] is not None] +
+            [r[2] + 1 for r in ranges if r[2] is not None]
+        ).astype(numpy.int64)
+        ## a season in each bucket ##
+        self.bucket_seasons = numpy.r_[self.breaks[0] - 1, self.breaks] if len(self.breaks) > 0 else numpy.zeros(1, dtype=numpy.int64)
+        self.to_fastr_map = self.compile(ranges, 0, 3)
+        self.to_nfelo_map = self.compile(ranges, 3, 0)
+
+    def compile(self, ranges: List[Tuple], from_pos: int, to_pos: int) -> dict:
+        '''
+        Abbreviation -> translation in each season bucket, for abbreviations
+        with a range
+        '''
+        compiled = {}
+        for r in ranges:
+            translations = compiled.setdefault(r[from_pos], [r[from_pos]] * len(self.bucket_seasons))
+            for i, season in enumerate(self.bucket_seasons):
+                if (r[1] is None or season >= r[1]) and (r[2] is None or season <= r[2]):
+                    translations[i] = r[to_pos]
+        return compiled
+
+    def translate(self, teams, seasons, compiled: dict, name: Optional[str] = None) -> pd.Series:
+        '''
+        Translate a column of abbreviations in a single take
+        '''
+        index = teams.index if isinstance(teams, pd.Series) else None
+        teams = pd.Series(teams, copy=False)
+        if isinstance(teams.dtype, pd.CategoricalDtype):
+            codes = teams.cat.codes.to_numpy()
+            uniques = teams.cat.categories
+        else:
+            codes, uniques = pd.factorize(teams)
+        ## abbreviation x bucket table of output codes ##
+        table = [
+            compiled.get(team, [team] * len(self.bucket_seasons))
+            for team in uniques.tolist()
+        ]
+        categories, table_codes = numpy.unique(
+            numpy.array(table, dtype=object).reshape(len(uniques), len(self.bucket_seasons)).astype(str),
+            return_inverse=True
+        )
+        table_codes = numpy.append(
+            table_codes.reshape(len(uniques), len(self.bucket_seasons)),
+            numpy.full((1, len(self.bucket_seasons)), -1),
+            axis=0
+        )
+        buckets = numpy.searchsorted(self.breaks, numpy.asarray(seasons, dtype=numpy.int64), side='right')
+        ## missing abbreviations have code -1, which takes the trailing row of -1s ##
+        return pd.Series(
+            pd.Categorical.from_codes(table_codes[codes, buckets], categories=categories),
+            index=index,
+            name=name
+        )
+
+    def to_fastr(self, teams, seasons, name: Optional[str] = None) -> pd.Series:
+        '''
+        fastr abbreviation of each nfelo abbreviation in the season of its row
+
+        Parameters:
+        * teams: array like or pd.Series of nfelo abbreviations
+        * seasons: array like of int, aligned with teams
+
+        Returns:
+        * teams_fastr: pd.Series - categorical, with the index of teams if it is a Series
+        '''
+        return self.translate(teams, seasons, self.to_fastr_map, name)
+
+    def to_nfelo(self, teams, seasons, name: Optional[str] = None) -> pd.Series:
+        '''
+        nfelo abbreviation of each fastr abbreviation in the season of its row
+        '''
+        return self.translate(teams, seasons, self.to_nfelo_map, name)
+
+## shared instance ##
+team_translator = TeamTranslator()
@@ -1,7 +1,8 @@
 from .DataLoader import DataLoader
+from .TeamTranslator import TeamTranslator, team_translator
 
 ## init the singleton ##
 data = DataLoader()
 
-## export the singleton ##
-__all__ = ['data']
\ No newline at end of file
+## export the singletons ##
+__all__ = ['data', 'team_translator', 'TeamTranslator']
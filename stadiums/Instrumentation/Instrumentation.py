@@ -0,0 +1,244 @@
+## built-ins ##
+import os
+import sys
+import json
+import time
+import pathlib
+import cProfile
+import contextlib
+import tracemalloc
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+
+## resource is only available on unix ##
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss_mb() -> Optional[float]:
+    '''
+    Peak resident set size of the process in MB, if it can be measured
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## linux reports KB and macOS reports bytes ##
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+@dataclass
+class StageRecord:
+    '''
+    Measurements of a single stage. Memory is in MB, and traced values are
+    None unless memory tracing is enabled
+    '''
+    name: str
+    path: str
+    depth: int
+    wall_seconds: float = field(default=0.0)
+    cpu_seconds: float = field(default=0.0)
+    rows: Optional[int] = field(default=None)
+    peak_traced_mb: Optional[float] = field(default=None)
+    net_traced_mb: Optional[float] = field(default=None)
+    peak_rss_mb: Optional[float] = field(default=None)
+    profile_path: Optional[str] = field(default=None)
+    ## state while the stage runs ##
+    traced_start: int = field(default=0, repr=False)
+    traced_peak: int = field(default=0, repr=False)
+
+class NullStage:
+    '''
+    Stand in for a StageRecord while instrumentation is disabled, so stages can
+    set rows without checking
+    '''
+    rows: Optional[int] = None
+
+class Instrumentation:
+    '''
+    Opt in timing and memory instrumentation for the update pipeline
+
+    Code marks its stages with the stage context manager, which does nothing
+    until the instrumentation is enabled. When enabled, each stage records wall
+    and cpu time, traced peak and net memory (tracemalloc), the peak RSS of the
+    process at the end of the stage, and optionally a row count set by the stage.
+    Stages nest, and are reported by their path, ie calc_analytics/gen_hfa/rolling
+
+    Memory tracing slows allocation heavy code, so wall times are inflated when
+    trace_memory is on. Use it to find where memory goes, and time without it
+
+    With profile_dir set, each outermost stage is run under cProfile and its stats
+    are dumped to <profile_dir>/<path>.prof. Only one profiler can run at a time,
+    so stages nested in a profiled stage are included in its profile
+
+    Example:
+    > instrument.enable(trace_memory=True)
+    > update_stadiums()
+    > instrument.finish('run.json')
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.profile_dir: Optional[str] = None
+        self.records: List[StageRecord] = []
+        self.stack: List[StageRecord] = []
+        self.profiler: Optional[cProfile.Profile] = None
+        self.started_tracing = False
+        self.started_at: Optional[str] = None
+
+    def enable(self, trace_memory: bool = True, profile_dir: Optional[str] = None):
+        '''
+        Start recording stages, clearing any previous records
+
+        Parameters:
+        * trace_memory: bool - if True, trace python allocations with tracemalloc
+        * profile_dir: Optional[str] - if set, dump a cProfile of each outermost stage here
+        '''
+        self.disable()
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.records = []
+        self.stack = []
+        self.started_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if profile_dir is not None:
+            pathlib.Path(profile_dir).mkdir(parents=True, exist_ok=True)
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def disable(self):
+        '''
+        Stop recording stages. Records are kept for reporting
+        '''
+        self.enabled = False
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        '''
+        Measure the enclosed block as a stage. Yields the stage record so the
+        block can set rows
+        '''
+        if not self.enabled:
+            yield NullStage()
+            return
+        parent = self.stack[-1] if len(self.stack) > 0 else None
+        record = StageRecord(
+            name=name,
+            path=name if parent is None else '{0}/{1}'.format(parent.path, name),
+            depth=len(self.stack)
+        )
+        ## tracemalloc keeps one peak, so fold it into the open stages before
+        ## resetting it for this stage ##
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            for open_record in self.stack:
+                open_record.traced_peak = max(open_record.traced_peak, peak)
+            tracemalloc.reset_peak()
+            record.traced_start = current
+            record.traced_peak = current
+        profiler = None
+        if self.profile_dir is not None and self.profiler is None:
+            profiler = cProfile.Profile()
+            self.profiler = profiler
+        ## records are listed in the order stages start ##
+        self.records.append(record)
+        self.stack.append(record)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profiler = None
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            self.stack.pop()
+            if tracing and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                record.traced_peak = max(record.traced_peak, peak)
+                if len(self.stack) > 0:
+                    self.stack[-1].traced_peak = max(self.stack[-1].traced_peak, record.traced_peak)
+                record.peak_traced_mb = record.traced_peak / (1024 * 1024)
+                record.net_traced_mb = (current - record.traced_start) / (1024 * 1024)
+            record.peak_rss_mb = peak_rss_mb()
+            if profiler is not None:
+                record.profile_path = '{0}/{1}.prof'.format(
+                    self.profile_dir, record.path.replace('/', '.')
+                )
+                profiler.dump_stats(record.profile_path)
+
+    ############
+    ## REPORT ##
+    ############
+    def report(self) -> dict:
+        '''
+        Structured report of the recorded stages
+        '''
+        return {
+            'started_at': self.started_at,
+            'pid': os.getpid(),
+            'trace_memory': self.trace_memory,
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': [
+                {
+                    key: value for key, value in asdict(record).items()
+                    if key not in ['traced_start', 'traced_peak']
+                } for record in self.records
+            ]
+        }
+
+    def save_report(self, path: str):
+        '''
+        Write the report to a json file
+        '''
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def finish(self, report_path: Optional[str] = None) -> str:
+        '''
+        Stop recording, print the summary, and save the report
+
+        Parameters:
+        * report_path: Optional[str] - json report path, defaults to
+        Instrumentation/reports/<started_at>.json
+
+        Returns:
+        * report_path: str
+        '''
+        self.disable()
+        if report_path is None:
+            report_path = '{0}/reports/{1}.json'.format(
+                pathlib.Path(__file__).parent.resolve(),
+                (self.started_at or 'run').replace(':', '').replace('-', '')
+            )
+        self.save_report(report_path)
+        print(self.summary())
+        print('Saved run report to {0}'.format(report_path))
+        return report_path
+
+    def summary(self) -> str:
+        '''
+        Human readable table of the recorded stages, indented by depth
+        '''
+        lines = ['{0:<44}{1:>10}{2:>10}{3:>11}{4:>11}{5:>10}'.format(
+            'stage', 'wall s', 'cpu s', 'peak MB', 'rss MB', 'rows'
+        )]
+        for record in self.records:
+            lines.append('{0:<44}{1:>10.3f}{2:>10.3f}{3:>11}{4:>11}{5:>10}'.format(
+                ('  ' * record.depth + record.name)[:43],
+                record.wall_seconds,
+                record.cpu_seconds,
+                '-' if record.peak_traced_mb is None else '{0:.1f}'.format(record.peak_traced_mb),
+                '-' if record.peak_rss_mb is None else '{0:.1f}'.format(record.peak_rss_mb),
+                '-' if record.rows is None else record.rows
+            ))
+        return '\n'.join(lines)
@@ -0,0 +1,7 @@
+from .Instrumentation import Instrumentation, StageRecord
+
+## init the shared instance, which is disabled until enabled ##
+instrument = Instrumentation()
+
+## export the shared instance ##
+__all__ = ['instrument', 'Instrumentation', 'StageRecord']
@@ -0,0 +1,195 @@
+## built-ins ##
+from typing import Optional
+
+## external ##
+import pandas as pd
+import numpy
+
+## mean radius of the earth ##
+EARTH_RADIUS_MILES = 3958.8
+
+def haversine(lat1, lon1, lat2, lon2) -> numpy.ndarray:
+    '''
+    Great circle distance in miles between points in degrees. Inputs are
+    broadcast, so a column of points against a row of points gives a matrix
+    '''
+    lat1, lon1, lat2, lon2 = (
+        numpy.radians(numpy.asarray(value, dtype=numpy.float64))
+        for value in [lat1, lon1, lat2, lon2]
+    )
+    a = (
+        numpy.sin((lat2 - lat1) / 2) ** 2 +
+        numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0, 1)))
+
+def unit_vectors(lat, lon) -> numpy.ndarray:
+    '''
+    Points in degrees as n x 3 unit vectors. The dot product of two unit
+    vectors falls as their great circle distance grows, so nearest neighbors
+    can be ranked with a single matrix product
+    '''
+    lat = numpy.radians(numpy.asarray(lat, dtype=numpy.float64))
+    lon = numpy.radians(numpy.asarray(lon, dtype=numpy.float64))
+    return numpy.stack([
+        numpy.cos(lat) * numpy.cos(lon),
+        numpy.cos(lat) * numpy.sin(lon),
+        numpy.sin(lat)
+    ], axis=-1)
+
+class GeoIndex:
+    '''
+    Vectorized geo index over stadium locations
+
+    Stadiums without a lat and lon are left out of the index, and distances
+    to or from them are NaN. With only a few hundred stadiums, every query is
+    a brute force pass over precomputed unit vectors, which is faster than a
+    tree at this size. The full distance matrix is built on first use, after
+    which pairwise distances for any number of games are a single take
+
+    Parameters:
+    * stadium_ids: array like of str
+    * lat: array like of float
+    * lon: array like of float
+    * altitude: Optional array like of float - in feet
+    '''
+    def __init__(self, stadium_ids, lat, lon, altitude=None):
+        lat = numpy.asarray(lat, dtype=numpy.float64)
+        lon = numpy.asarray(lon, dtype=numpy.float64)
+        located = ~(numpy.isnan(lat) | numpy.isnan(lon))
+        self.stadium_ids = numpy.asarray(stadium_ids, dtype=object)[located]
+        self.lookup = pd.Index(self.stadium_ids)
+        self.lat = lat[located]
+        self.lon = lon[located]
+        self.altitude = (
+            numpy.full(len(self.lat), numpy.nan) if altitude is None else
+            numpy.asarray(altitude, dtype=numpy.float64)[located]
+        )
+        self.units = unit_vectors(self.lat, self.lon)
+        self.matrix: Optional[numpy.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.stadium_ids)
+
+    #############
+    ## LOOKUPS ##
+    #############
+    def indexer(self, stadium_ids) -> numpy.ndarray:
+        '''
+        Position of each stadium id in the index, -1 if it is not located
+        '''
+        return self.lookup.get_indexer(numpy.asarray(stadium_ids, dtype=object))
+
+    def take(self, values: numpy.ndarray, stadium_ids) -> numpy.ndarray:
+        '''
+        Values of a per stadium array for each id, NaN for unlocated ids
+        '''
+        idx = self.indexer(stadium_ids)
+        return numpy.where(idx >= 0, values[idx], numpy.nan)
+
+    def altitudes(self, stadium_ids) -> numpy.ndarray:
+        return self.take(self.altitude, stadium_ids)
+
+    ###############
+    ## DISTANCES ##
+    ###############
+    def distance_matrix(self) -> pd.DataFrame:
+        '''
+        Haversine miles between every pair of located stadiums
+        '''
+        return pd.DataFrame(
+            self.matrix_values(),
+            index=self.lookup,
+            columns=self.lookup
+        )
+
+    def matrix_values(self) -> numpy.ndarray:
+        if self.matrix is None:
+            self.matrix = haversine(
+                self.lat[:, None], self.lon[:, None],
+                self.lat[None, :], self.lon[None, :]
+            )
+        return self.matrix
+
+    def distances(self, from_ids, to_ids) -> numpy.ndarray:
+        '''
+        Miles from each from stadium to the matching to stadium, ie for every
+        game in a schedule at once. NaN where either stadium is not located
+        '''
+        i = self.indexer(from_ids)
+        j = self.indexer(to_ids)
+        valid = (i >= 0) & (j >= 0)
+        out = numpy.full(len(i), numpy.nan)
+        out[valid] = self.matrix_values()[i[valid], j[valid]]
+        return out
+
+    #############
+    ## QUERIES ##
+    #############
+    def query_point(self,
+        stadium_id: Optional[str] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None
+    ):
+        '''
+        Lat and lon of a query, given as a stadium id or a point
+        '''
+        if stadium_id is not None:
+            idx = self.indexer([stadium_id])[0]
+            if idx < 0:
+                raise ValueError('{0} is not a located stadium'.format(stadium_id))
+            return self.lat[idx], self.lon[idx]
+        if lat is None or lon is None:
+            raise ValueError('Query requires a stadium_id, or a lat and lon')
+        return lat, lon
+
+    def nearest(self,
+        stadium_id: Optional[str] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        k: int = 5
+    ) -> pd.DataFrame:
+        '''
+        The k stadiums nearest a stadium or point. A stadium is not its own
+        neighbor
+
+        Returns:
+        * nearest: pd.DataFrame - stadium_id and miles, nearest first
+        '''
+        q_lat, q_lon = self.query_point(stadium_id, lat, lon)
+        ## larger dot products are closer ##
+        dots = self.units @ unit_vectors(q_lat, q_lon)
+        if stadium_id is not None:
+            dots[self.indexer([stadium_id])[0]] = -numpy.inf
+            k = min(k, len(self) - 1)
+        k = min(k, len(self))
+        if k <= 0:
+            return pd.DataFrame({'stadium_id': [], 'miles': []})
+        idx = numpy.argpartition(-dots, k - 1)[:k]
+        idx = idx[numpy.argsort(-dots[idx], kind='stable')]
+        return pd.DataFrame({
+            'stadium_id': self.stadium_ids[idx],
+            'miles': haversine(q_lat, q_lon, self.lat[idx], self.lon[idx])
+        })
+
+    def within(self,
+        miles: float,
+        stadium_id: Optional[str] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None
+    ) -> pd.DataFrame:
+        '''
+        Stadiums within a radius of a stadium or point, including the
+        stadium itself
+
+        Returns:
+        * within: pd.DataFrame - stadium_id and miles, nearest first
+        '''
+        q_lat, q_lon = self.query_point(stadium_id, lat, lon)
+        dist = haversine(q_lat, q_lon, self.lat, self.lon)
+        idx = numpy.flatnonzero(dist <= miles)
+        idx = idx[numpy.argsort(dist[idx], kind='stable')]
+        return pd.DataFrame({
+            'stadium_id': self.stadium_ids[idx],
+            'miles': dist[idx]
+        })
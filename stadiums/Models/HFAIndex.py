@@ -0,0 +1,232 @@
+## built-ins ##
+import bisect
+import pathlib
+from typing import Dict, List, Optional, Union
+
+## external ##
+import pandas as pd
+import numpy
+
+## internal ##
+from ..Outputs import SeasonStore
+
+## keys that identify a row of the rolling team hfa output ##
+KEY_COLS = ['team', 'stadium', 'season', 'week']
+## a season and week fit in a week key of season * 100 + week, so pairs are
+## spaced far enough apart in the combined key to never overlap ##
+PAIR_STRIDE = 10 ** 7
+TEAM_HFA_LOC = '{0}/data/rolling_team_hfa'.format(
+    pathlib.Path(__file__).parent.parent.parent.resolve()
+)
+
+class HFAIndex:
+    '''
+    In memory index over the rolling team HFA output of gen_hfa for fast
+    point, as of, and batch lookups
+
+    Rows are sorted by team, stadium, season, and week, so each (team, stadium)
+    pair is a contiguous block. Every value column is kept as its own numpy
+    array. A dict maps each pair to the bounds of its block, and week keys
+    (season * 100 + week) are binary searched within them. Single lookups
+    work on python lists with bisect to avoid numpy call overhead, so they
+    take around a microsecond. Batch lookups find pairs through a teams x
+    stadiums table of pair codes, encode each key as pair * PAIR_STRIDE +
+    week key, and resolve every key with one numpy.searchsorted over the
+    whole table
+
+    Lookups are exact, or as of the latest row at or before a week. With
+    strict=True, as of lookups only see rows before the week, ie the HFA a
+    model would have known going into a game. Since gen_hfa pads the weeks
+    between a pair's games, as of lookups within a pair's history land on
+    that week's row, and lookups past its last row return the last row
+
+    Parameters:
+    * df: pd.DataFrame - rolling team hfa, ie from gen_hfa or SeasonStore.read
+    * value_cols: Optional[List[str]] - columns to index, defaults to every
+    numeric column other than the keys
+    '''
+    def __init__(self, df: pd.DataFrame, value_cols: Optional[List[str]] = None):
+        df = df.sort_values(by=KEY_COLS, kind='stable').reset_index(drop=True)
+        if value_cols is None:
+            value_cols = [
+                col for col in df.columns
+                if col not in KEY_COLS and pd.api.types.is_numeric_dtype(df[col])
+            ]
+        self.value_cols = value_cols
+        self.values: Dict[str, numpy.ndarray] = {
+            col: df[col].to_numpy(dtype=numpy.float64) for col in value_cols
+        }
+        ## pair blocks ##
+        pair_codes, pairs = pd.MultiIndex.from_frame(df[['team', 'stadium']]).factorize()
+        self.pairs: pd.MultiIndex = pairs
+        self.starts = numpy.flatnonzero(numpy.r_[True, pair_codes[1:] != pair_codes[:-1]])
+        self.ends = numpy.r_[self.starts[1:], len(df)]
+        self.bounds = {
+            pair: (int(start), int(end))
+            for pair, start, end in zip(pairs.tolist(), self.starts, self.ends)
+        }
+        ## teams x stadiums table of pair codes, -1 for pairs with no rows ##
+        self.team_lookup = pd.Index(pairs.levels[0])
+        self.stadium_lookup = pd.Index(pairs.levels[1])
+        self.pair_table = numpy.full((len(self.team_lookup), len(self.stadium_lookup)), -1)
+        self.pair_table[pairs.codes[0], pairs.codes[1]] = numpy.arange(len(pairs))
+        ## week keys, within pairs and combined ##
+        self.week_keys = (
+            df['season'].to_numpy(dtype=numpy.int64) * 100 +
+            df['week'].to_numpy(dtype=numpy.int64)
+        )
+        self.pair_keys = pair_codes.astype(numpy.int64) * PAIR_STRIDE + self.week_keys
+        self.week_list: List[int] = self.week_keys.tolist()
+        self.value_lists: Dict[str, List[float]] = {
+            col: values.tolist() for col, values in self.values.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.week_keys)
+
+    @classmethod
+    def from_store(cls,
+        loc: str = TEAM_HFA_LOC,
+        fmt: str = 'csv',
+        seasons: Optional[List[int]] = None,
+        value_cols: Optional[List[str]] = None
+    ) -> 'HFAIndex':
+        '''
+        Build an index from the persisted rolling team hfa seasons
+        '''
+        return cls(
+            SeasonStore(loc, group_cols=['team', 'stadium'], fmt=fmt).read(seasons),
+            value_cols
+        )
+
+    ############
+    ## SINGLE ##
+    ############
+    def row(self,
+        team: str,
+        stadium: str,
+        season: int,
+        week: int,
+        exact: bool = False,
+        strict: bool = False
+    ) -> int:
+        '''
+        Position of the row for a key, or -1 if there is none
+
+        Parameters:
+        * exact: bool - only match the key's own week
+        * strict: bool - for as of lookups, only match weeks before the key's
+        '''
+        bounds = self.bounds.get((team, stadium))
+        if bounds is None:
+            return -1
+        week_key = season * 100 + week
+        if exact:
+            pos = bisect.bisect_left(self.week_list, week_key, bounds[0], bounds[1])
+            return pos if pos < bounds[1] and self.week_list[pos] == week_key else -1
+        if strict:
+            pos = bisect.bisect_left(self.week_list, week_key, bounds[0], bounds[1]) - 1
+        else:
+            pos = bisect.bisect_right(self.week_list, week_key, bounds[0], bounds[1]) - 1
+        return pos if pos >= bounds[0] else -1
+
+    def get(self,
+        team: str,
+        stadium: str,
+        season: int,
+        week: int,
+        col: str = 'hfa_l16'
+    ) -> float:
+        '''
+        Value for the exact week, NaN if the pair has no row for it
+        '''
+        pos = self.row(team, stadium, season, week, exact=True)
+        return self.value_lists[col][pos] if pos >= 0 else numpy.nan
+
+    def asof(self,
+        team: str,
+        stadium: str,
+        season: int,
+        week: int,
+        col: str = 'hfa_l16',
+        strict: bool = False
+    ) -> float:
+        '''
+        Value as of a week, NaN if the pair has no row at or before it
+        '''
+        pos = self.row(team, stadium, season, week, strict=strict)
+        return self.value_lists[col][pos] if pos >= 0 else numpy.nan
+
+    ###########
+    ## BATCH ##
+    ###########
+    def indexer(self, lookup: pd.Index, values) -> numpy.ndarray:
+        '''
+        Position of each value in lookup, -1 if missing. Keys repeat heavily
+        in a batch, so only the unique values are looked up
+        '''
+        codes, uniques = pd.factorize(numpy.asarray(values, dtype=object))
+        positions = numpy.r_[lookup.get_indexer(uniques), -1]
+        return positions[codes]
+
+    def rows(self,
+        teams,
+        stadiums,
+        seasons,
+        weeks,
+        exact: bool = False,
+        strict: bool = False
+    ) -> numpy.ndarray:
+        '''
+        Vectorized row, for arrays of keys. Positions are -1 where there is
+        no row
+        '''
+        team_idx = self.indexer(self.team_lookup, teams)
+        stadium_idx = self.indexer(self.stadium_lookup, stadiums)
+        pair = numpy.where(
+            (team_idx >= 0) & (stadium_idx >= 0),
+            self.pair_table[team_idx, stadium_idx],
+            -1
+        )
+        found = pair >= 0
+        week_keys = (
+            numpy.asarray(seasons, dtype=numpy.int64) * 100 +
+            numpy.asarray(weeks, dtype=numpy.int64)
+        )
+        keys = numpy.where(found, pair, 0).astype(numpy.int64) * PAIR_STRIDE + week_keys
+        side = 'left' if exact or strict else 'right'
+        pos = numpy.searchsorted(self.pair_keys, keys, side=side)
+        if exact:
+            in_range = pos < len(self.pair_keys)
+            found &= in_range
+            found[in_range] &= self.pair_keys[pos[in_range]] == keys[in_range]
+        else:
+            pos = pos - 1
+            found &= pos >= self.starts[numpy.where(found, pair, 0)]
+        return numpy.where(found, pos, -1)
+
+    def lookup(self,
+        teams,
+        stadiums,
+        seasons,
+        weeks,
+        cols: Union[str, List[str]] = 'hfa_l16',
+        exact: bool = False,
+        strict: bool = False
+    ) -> Union[numpy.ndarray, pd.DataFrame]:
+        '''
+        Values for arrays of keys, as of each week unless exact. NaN where
+        there is no row
+
+        Returns:
+        * values: numpy.ndarray for a single col, or a pd.DataFrame of cols
+        '''
+        pos = self.rows(teams, stadiums, seasons, weeks, exact=exact, strict=strict)
+        found = pos >= 0
+        safe = numpy.where(found, pos, 0)
+        if isinstance(cols, str):
+            return numpy.where(found, self.values[cols][safe], numpy.nan)
+        return pd.DataFrame({
+            col: numpy.where(found, self.values[col][safe], numpy.nan)
+            for col in cols
+        })
@@ -1,15 +1,22 @@
 ## built-ins ##
-from dataclasses import dataclass, field, asdict
-from typing import Optional
-import pathlib
+from dataclasses import dataclass, field, asdict, InitVar
+from typing import Dict, Optional
 
 ## external imports ##
 import pandas as pd
 
 ## internal imports ##
 from .Utilities import WikipediaScraper
+from ..AssetBuilder import load_asset_manifest, asset_url, ASSET_URL_BASE
 
-@dataclass
+## url fields and the asset manifest variant they point to ##
+SAT_IMG_FIELDS = {
+    'img_sat_url': 'png',
+    'img_sat_webp_url': 'webp',
+    'img_sat_thumb_url': 'thumb'
+}
+
+@dataclass(slots=True)
 class Stadium:
     stadium_id: str
     stadium_name: str
@@ -46,25 +53,25 @@ class Stadium:
     renovation_years: Optional[str] = field(default=None)
     expansion_years: Optional[str] = field(default=None)
     architects: Optional[str] = field(default=None)
+    img_sat_webp_url: Optional[str] = field(default=None)
+    img_sat_thumb_url: Optional[str] = field(default=None)
+    ## asset manifest entries, from load_asset_manifest. Collections load the
+    ## manifest once and pass it to each Stadium. If not provided, the
+    ## stadium loads it ##
+    assets: InitVar[Optional[Dict[str, Dict]]] = None
 
-    def __post_init__(self):
+    def __post_init__(self, assets: Optional[Dict[str, Dict]]):
         '''
         Various post initialization logic
         '''
-        ## get an asset URL if it exists in the pacakge and was not
-        ## not provided in the constructor
-        if pd.isnull(self.img_sat_url):
-            asset_loc = '{0}/Assets/SatelliteImg/{1}.png'.format(
-                pathlib.Path(__file__).parent.parent.resolve(),
-                self.stadium_id
-            )
-            pathlib.Path(asset_loc)
-            if pathlib.Path(asset_loc).exists():
-                ## assume that if the asset exists in the package at run time,
-                ## it is in the repo
-                self.img_sat_url = 'https://raw.githubusercontent.com/greerrenfl/Stadiums/main/stadiums/Assets/SatelliteImg/{0}.png'.format(
-                    self.stadium_id
-                )
+        ## set satellite image URLs from the asset manifest, unless a URL
+        ## outside the package assets was provided in the constructor ##
+        entry = (assets if assets is not None else load_asset_manifest()).get(self.stadium_id)
+        if entry is not None:
+            for url_field, variant in SAT_IMG_FIELDS.items():
+                current = getattr(self, url_field)
+                if pd.isnull(current) or str(current).startswith(ASSET_URL_BASE):
+                    setattr(self, url_field, asset_url(entry, variant))
         
     def as_record(self) -> dict:
         return asdict(self)
@@ -84,11 +91,28 @@ class Stadium:
             ]
         )
     
+    def needs_wikipedia_data(self,
+        force_rescrape: bool = False,
+        force_reparse: bool = False
+    ) -> bool:
+        '''
+        Returns True if the stadium has a wikipedia url and its data should
+        be (re)scraped or (re)parsed
+        '''
+        ## if there is no wikipedia url, do nothing ##
+        if pd.isnull(self.wikipedia_url):
+            return False
+        ## if wikipedia data exists, and there is no force rescrape, do nothing ##
+        if self.has_wikipedia_data() and not force_rescrape and not force_reparse:
+            return False
+        return True
+
     def add_wikipedia_data(self,
         update_existing: bool = True,
         override_existing: bool = False,
         force_rescrape: bool = False,
-        force_reparse: bool = False
+        force_reparse: bool = False,
+        scraper: Optional[WikipediaScraper] = None
     ):
         '''
         Updates the stadium data from wikipedia
@@ -98,20 +122,39 @@ class Stadium:
         * override_existing: bool - if True, will update existing data regardless of whether new data exists
         * force_rescrape: bool - if True, will rescrape wikipedia data and reparse it even if there is a cache
         * force_reparse: bool - if True, will reparse wikipedia data from cache or scrape it if there is no cache
+        * scraper: Optional[WikipediaScraper] - scraper to use, a new one is created if not provided
         '''
-        ## if there is no wikipedia url, do nothing ##
-        if self.wikipedia_url is None:
-            return
-        ## if wikipedia data exists, and there is no force rescrape, do nothing ##
-        if self.has_wikipedia_data() and not force_rescrape and not force_reparse:
+        if not self.needs_wikipedia_data(force_rescrape, force_reparse):
             return
         ## else scrape and update ##
-        scraper = WikipediaScraper()
+        own_scraper = scraper is None
+        scraper = scraper if scraper is not None else WikipediaScraper()
         wikipedia_data = scraper.get_wikipedia_data(
             stadium_id=self.stadium_id,
             wikipedia_url=self.wikipedia_url,
             force_rescrape=force_rescrape
         )
+        ## a shared scraper is flushed by its owner after the batch ##
+        if own_scraper:
+            scraper.cache.flush()
+        self.apply_wikipedia_data(
+            wikipedia_data,
+            update_existing=update_existing,
+            override_existing=override_existing
+        )
+
+    def apply_wikipedia_data(self,
+        wikipedia_data: Optional[dict],
+        update_existing: bool = True,
+        override_existing: bool = False
+    ):
+        '''
+        Applies parsed wikipedia data to the stadium. See add_wikipedia_data
+        for parameters
+        '''
+        ## nothing was scraped or parsed ##
+        if wikipedia_data is None:
+            return
         for key, value in wikipedia_data.items():
             ## if override_existing is True, then update regardless of whether the value exists
             if override_existing:
@@ -127,7 +170,3 @@ class Stadium:
             if update_existing or getattr(self, key) is None:
                 setattr(self, key, value)
                 continue
-
-        
-
-
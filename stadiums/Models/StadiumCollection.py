@@ -1,21 +1,37 @@
 ## built-ins ##
+import dataclasses
 from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 ## external ##
 import pandas as pd
 
 ## local ##
 from .Stadium import Stadium
-from .Utilities import add_fastr_meta
+from ..AssetBuilder import load_asset_manifest
+from .GeoIndex import GeoIndex
+from .Utilities import add_fastr_meta, WikipediaScraper, RateLimiter
+from ..Outputs import write_parquet, parquet_path
 
 class StadiumCollection:
     '''
     A collection of Stadium objects that comes with utility functions
     for generating dataframes, updating 
+
+    stadium_df is cached by update_df and only rebuilt after the collection
+    has changed, so it should be treated as read only. The collection's own
+    methods mark it changed. Call mark_changed after editing its stadiums
+    directly, ie setting a field or calling Stadium.add_wikipedia_data
     '''
     def __init__(self):
         self.stadiums: Dict[Stadium] = {}
         self.stadium_df: Optional[pd.DataFrame] = None
+        ## changes to the collection, and the change stadium_df was built at ##
+        self.changes: int = 0
+        self.df_state: Optional[int] = None
+        ## geo index, and the change it was built at ##
+        self.geo: Optional[GeoIndex] = None
+        self.geo_state: Optional[int] = None
         self.stadium_properties: List[str] = [
             'stadium_id', 'stadium_name',
             'lat', 'lon', 'altitude', 'heading',
@@ -26,7 +42,7 @@ class StadiumCollection:
             'owner', 'operator', 'capacity', 'broke_ground',
             'opened', 'closed', 'demolished', 'construction_cost',
             'construction_cost_2023', 'renovation_years', 'expansion_years',
-            'architects'
+            'architects', 'img_sat_webp_url', 'img_sat_thumb_url'
         ]
     
     def add_stadium(self, stadium: Stadium):
@@ -34,15 +50,32 @@ class StadiumCollection:
         Add a stadium to the collection
         '''
         self.stadiums[stadium.stadium_id] = stadium
+        self.mark_changed()
+
+    def mark_changed(self):
+        '''
+        Mark the collection as changed, so stadium_df and the geo index are
+        rebuilt on their next use
+        '''
+        self.changes += 1
     
     def update_df(self):
         '''
-        Update the stadium dataframe based on the current collection
+        Update the stadium dataframe based on the current collection, unless
+        nothing has changed since it was last built
         '''
         if len(self.stadiums) == 0:
             raise ValueError('Add stadiums in the collection before updating the dataframe')
-        ## create the df ##
-        self.stadium_df = pd.DataFrame(list(self.stadiums.values()))
+        state = self.changes
+        if self.stadium_df is not None and self.df_state == state:
+            return
+        ## create the df column by column ##
+        stadiums = list(self.stadiums.values())
+        self.stadium_df = pd.DataFrame({
+            field.name: [getattr(stadium, field.name) for stadium in stadiums]
+            for field in dataclasses.fields(Stadium)
+        })
+        self.df_state = state
     
     def populate_from_csv(self, csv_path: str):
         '''
@@ -59,11 +92,12 @@ class StadiumCollection:
         ## validate that df has an id and name column ##
         if 'stadium_id' not in df.columns or 'stadium_name' not in df.columns:
             raise ValueError('CSV must have an stadium_id and stadium_name column')
-        ## populate the collection ##
-        for index, row in df.iterrows():
-            record = {prop: row.get(prop) for prop in self.stadium_properties}
-            stadium = Stadium(**record)
-            self.add_stadium(stadium)
+        ## populate the collection, with properties missing from the csv left
+        ## as their defaults ##
+        assets = load_asset_manifest()
+        props = [prop for prop in self.stadium_properties if prop in df.columns]
+        for values in zip(*[df[prop].tolist() for prop in props]):
+            self.add_stadium(Stadium(**dict(zip(props, values)), assets=assets))
 
     def extend_from_recs(self, recs: List[Dict]):
         '''
@@ -76,6 +110,7 @@ class StadiumCollection:
         Returns:
         * None
         '''
+        assets = None
         for rec in recs:
             ## validate the keys ##
             if 'stadium_id' not in rec or 'stadium_name' not in rec:
@@ -83,11 +118,15 @@ class StadiumCollection:
             ## if the stadium exists in the collection, update the name ##
             if rec['stadium_id'] in self.stadiums:
                 self.stadiums[rec['stadium_id']].stadium_name = rec['stadium_name']
+                self.mark_changed()
             else:
                 ## if the stadium does not exist in the collection, add it ##
+                if assets is None:
+                    assets = load_asset_manifest()
                 self.add_stadium(Stadium(
                     stadium_id=rec['stadium_id'],
-                    stadium_name=rec['stadium_name']
+                    stadium_name=rec['stadium_name'],
+                    assets=assets
                 ))
     
     def add_fastr_meta(self):
@@ -96,27 +135,191 @@ class StadiumCollection:
         '''
         add_fastr_meta(self)
 
-    def update_stadium_data(self, force_rescrape: bool = False, force_reparse: bool = False):
+    def update_stadium_data(self,
+        force_rescrape: bool = False,
+        force_reparse: bool = False,
+        max_workers: int = 4,
+        requests_per_second: Optional[float] = 2.0,
+        timeout: float = 10.0,
+        refresh_stale: bool = True
+    ):
         '''
         Updates the stadium data for all stadiums in the collection.
-        To force rescraping, set force_rescrape to True. See Stadium.update_data
+        To force rescraping, set force_rescrape to True. See Stadium.add_wikipedia_data
         for more information.
+
+        Pages are fetched from a thread pool and parsed as they arrive, so
+        parsing overlaps with fetching. Rescraped pages that the server reports
+        as unchanged are not reparsed unless force_reparse is set. Stadiums whose
+        cached page has outlived its ttl are refreshed even without a force flag
+
+        Parameters:
+        * force_rescrape: bool - if True, will rescrape wikipedia data even if it is cached
+        * force_reparse: bool - if True, will reparse wikipedia data even if it exists
+        * max_workers: int - max number of concurrent fetches, 1 fetches serially
+        * requests_per_second: Optional[float] - global cap on requests started per second
+        across all workers. None for no limit
+        * timeout: float - seconds to wait on each request before giving up
+        * refresh_stale: bool - if True, revalidate stadiums with stale cached pages
         '''
-        for stadium in self.stadiums.values():
-            stadium.add_wikipedia_data(
-                force_rescrape=force_rescrape,
-                force_reparse=force_reparse
+        ## a single scraper shares the rate limit across all workers ##
+        scraper = WikipediaScraper(
+            timeout=timeout,
+            rate_limiter=RateLimiter(requests_per_second),
+            pool_size=max(1, max_workers)
+        )
+        stadiums = [
+            stadium for stadium in self.stadiums.values()
+            if stadium.needs_wikipedia_data(force_rescrape, force_reparse) or (
+                refresh_stale and
+                not pd.isnull(stadium.wikipedia_url) and
+                scraper.cache.is_stale(stadium.wikipedia_url)
             )
+        ]
+        if len(stadiums) == 0:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                executor.submit(
+                    scraper.request_html,
+                    stadium.stadium_id,
+                    stadium.wikipedia_url,
+                    force_rescrape
+                ): stadium
+                for stadium in stadiums
+            }
+            ## parse in the order the pages arrive ##
+            for future in as_completed(futures):
+                stadium = futures[future]
+                try:
+                    html_text, modified = future.result()
+                except Exception as e:
+                    print('Wikipedia fetch error for {0}: {1}'.format(stadium.stadium_id, e))
+                    continue
+                ## skip pages that are unchanged since they were last parsed ##
+                if not modified and stadium.has_wikipedia_data() and not force_reparse:
+                    continue
+                stadium.apply_wikipedia_data(scraper.parse_wikipedia_data(html_text))
+                self.mark_changed()
+        ## save cache access times once for the batch ##
+        scraper.cache.flush()
     
-    def to_csv(self, csv_path: str):
+    #########
+    ## GEO ##
+    #########
+    def geo_index(self) -> GeoIndex:
+        '''
+        Geo index of the located stadiums, rebuilt only when the collection
+        has changed
+        '''
+        self.update_df()
+        if self.geo is None or self.geo_state != self.df_state:
+            self.geo = GeoIndex(
+                self.stadium_df['stadium_id'],
+                self.stadium_df['lat'],
+                self.stadium_df['lon'],
+                self.stadium_df['altitude']
+            )
+            self.geo_state = self.df_state
+        return self.geo
+
+    def team_home_stadiums(self, games: pd.DataFrame) -> pd.DataFrame:
+        '''
+        The home stadium of each team in each season, ie the stadium it hosted
+        the most home games at, excluding neutral sites
+
+        Parameters:
+        * games: pd.DataFrame - games with season, home_team, location, and stadium_id
+
+        Returns:
+        * home_stadiums: pd.DataFrame - team, season, and stadium_id
+        '''
+        home_games = games[games['location'] == 'Home']
+        counts = pd.DataFrame({
+            'team': home_games['home_team'].to_numpy(dtype=object),
+            'season': home_games['season'].to_numpy(),
+            'stadium_id': home_games['stadium_id'].to_numpy(dtype=object)
+        }).value_counts(sort=False).reset_index(name='games')
+        ## most games first, ties to the lowest id ##
+        return counts.sort_values(
+            by=['team', 'season', 'games', 'stadium_id'],
+            ascending=[True, True, False, True]
+        ).drop_duplicates(subset=['team', 'season'])[[
+            'team', 'season', 'stadium_id'
+        ]].reset_index(drop=True)
+
+    def travel_origins(self, games: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Stadium each team travelled from for every game, ie its home stadium
+        for the season (see team_home_stadiums). Missing where a team hosted
+        no home games that season
+
+        Parameters:
+        * games: pd.DataFrame - games with season, home_team, away_team,
+        location, and stadium_id
+
+        Returns:
+        * origins: pd.DataFrame - home_origin and away_origin, indexed like games
+        '''
+        home_stadiums = self.team_home_stadiums(games).set_index(['team', 'season'])['stadium_id']
+        seasons = games['season'].to_numpy()
+        return pd.DataFrame({
+            '{0}_origin'.format(side): home_stadiums.reindex(pd.MultiIndex.from_arrays([
+                games['{0}_team'.format(side)].to_numpy(dtype=object), seasons
+            ])).to_numpy(dtype=object)
+            for side in ['home', 'away']
+        }, index=games.index)
+
+    def travel_distances(self, games: pd.DataFrame, origins: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        '''
+        Miles each team travelled from its home stadium to the game stadium,
+        for every game in a single batched lookup. Home teams at their own
+        stadium travel 0, and home teams at neutral sites travel like the away
+        team. Distances are NaN where a stadium is not located
+
+        Parameters:
+        * games: pd.DataFrame - games with season, home_team, away_team,
+        location, and stadium_id
+        * origins: Optional[pd.DataFrame] - travel_origins of games, if already computed
+
+        Returns:
+        * travel: pd.DataFrame - home_travel_miles and away_travel_miles,
+        indexed like games
+        '''
+        geo = self.geo_index()
+        if origins is None:
+            origins = self.travel_origins(games)
+        stadium_ids = games['stadium_id'].to_numpy(dtype=object)
+        return pd.DataFrame({
+            'home_travel_miles': geo.distances(origins['home_origin'].to_numpy(dtype=object), stadium_ids),
+            'away_travel_miles': geo.distances(origins['away_origin'].to_numpy(dtype=object), stadium_ids)
+        }, index=games.index)
+
+    def to_csv(self, csv_path: str, parquet: bool = False):
         '''
         Write the stadium dataframe to a csv file
 
         Parameters:
         * csv_path: str
+        * parquet: bool - if True, also write a typed parquet file alongside the csv
 
         Returns:
         * None
         '''
         self.update_df()
         self.stadium_df.to_csv(csv_path, index=False)
+        if parquet:
+            self.to_parquet(parquet_path(csv_path))
+
+    def to_parquet(self, path: str):
+        '''
+        Write the stadium dataframe to a typed parquet file
+
+        Parameters:
+        * path: str
+
+        Returns:
+        * None
+        '''
+        self.update_df()
+        write_parquet(self.stadium_df, path)
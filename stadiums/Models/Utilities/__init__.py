@@ -1,2 +1,2 @@
-from .wikipedia import WikipediaScraper
+from .wikipedia import WikipediaScraper, RateLimiter
 from .add_fastr_meta import add_fastr_meta
\ No newline at end of file
@@ -49,12 +49,14 @@ def add_fastr_meta(stadium_collection):
     * None
     '''
     ## load the games ##
-    games = data.db['games'].copy()
+    games = data.db['games']
     ## map types ##
-    games['surface_type'] = games['surface'].map(field_map).fillna('Turf')
-    games['roof_type'] = games['roof'].map(roof_map).fillna('Outdoors')
+    games = games[['stadium_id', 'gameday']].assign(
+        surface_type=games['surface'].map(field_map).fillna('Turf'),
+        roof_type=games['roof'].map(roof_map).fillna('Outdoors')
+    )
     ## calculate general meta data ##
-    general_meta = games.groupby(['stadium_id']).agg(
+    general_meta = games.groupby(['stadium_id'], observed=True).agg(
         first_game_date=('gameday', 'min'),
         last_game_date=('gameday', 'max'),
         surface_type=('surface_type', 'last'),
@@ -66,4 +68,6 @@ def add_fastr_meta(stadium_collection):
     for stadium_id, stadium in stadium_collection.stadiums.items():
         ## add the meta ##
         for field in ['first_game_date', 'last_game_date', 'surface_type', 'roof_type']:
-            setattr(stadium, field, meta_map[stadium_id][field])
\ No newline at end of file
+            setattr(stadium, field, meta_map[stadium_id][field])
+    ## stadiums were edited directly, so the cached dataframe is stale ##
+    stadium_collection.mark_changed()
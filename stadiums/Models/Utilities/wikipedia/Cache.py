@@ -1,57 +1,360 @@
 import os
+import gzip
+import json
 import time
+import hashlib
 import pathlib
+import threading
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from typing import Optional, Tuple
+
+from .RateLimiter import RateLimiter
+
+## zstd is optional, gzip is used if it is not installed ##
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def compress(content: bytes) -> Tuple[bytes, str]:
+    '''
+    Compress bytes with zstd if available, otherwise gzip. Returns the
+    compressed bytes and the compression used
+    '''
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(content), 'zst'
+    return gzip.compress(content, compresslevel=9), 'gz'
+
+def decompress(content: bytes, compression: str) -> bytes:
+    '''
+    Decompress bytes written by compress
+    '''
+    if compression == 'zst':
+        if zstandard is None:
+            raise ValueError('zstandard is required to read zst cache entries')
+        return zstandard.ZstdDecompressor().decompress(content)
+    return gzip.decompress(content)
 
 class WikipediaCache:
     '''
     A cache utility for handling io of wikipedia html text
+
+    Pages are stored compressed and keyed by a hash of their url. A manifest
+    records the fetch time, last access, size, content hash, and response
+    validators (ETag / Last-Modified) of each entry:
+    * entries older than their ttl are stale, and are revalidated with a
+    conditional request the next time they are read
+    * reads verify the content hash, and corrupt entries are treated as misses
+    * when the cache exceeds max_bytes, the least recently used entries are evicted
+    * writes and hits only change the manifest and parse results in memory,
+    and flush saves them once, ie after a batch of pages. Page files are
+    written immediately, and a page written without a flush is simply
+    refetched by the next run
+    * if a stale entry can not be revalidated, ie the request fails, the
+    cached page is served rather than nothing
+
+    Requests go through a pooled session so connections are reused across
+    pages
+
+    Parameters:
+    * timeout: float -- seconds to wait on each request before giving up
+    * rate_limiter: Optional[RateLimiter] -- limiter shared by all requests made
+    through this cache, ie when fetching from multiple threads
+    * pool_size: int -- max number of pooled connections per host
+    * ttl: Optional[float] -- seconds before a new entry is stale. None never expires
+    * max_bytes: Optional[int] -- byte budget for compressed entries. None is unbounded
+    * cache_dir: Optional[str] -- directory of the cache, defaults to wikipedia/cache
     '''
-    def __init__(self):
-        self.cache_dir = '{0}/cache'.format(pathlib.Path(__file__).parent.resolve())
+    def __init__(self,
+        timeout: float = 10.0,
+        rate_limiter: Optional[RateLimiter] = None,
+        pool_size: int = 10,
+        ttl: Optional[float] = 30 * 24 * 60 * 60,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        cache_dir: Optional[str] = None
+    ):
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir if cache_dir is not None else '{0}/cache'.format(
+            pathlib.Path(__file__).parent.resolve()
+        )
         # Ensure cache directory exists
         if not pathlib.Path(self.cache_dir).exists():
             pathlib.Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+        ## manifest ##
+        self.manifest_path = '{0}/manifest.json'.format(self.cache_dir)
+        self.lock = threading.RLock()
+        self.manifest = self.load_manifest()
+        ## True when the manifest has changes that are not saved ##
+        self.dirty = False
+        ## parse results, keyed by content hash and parser version ##
+        self.parsed_path = '{0}/parsed.json'.format(self.cache_dir)
+        self.parsed = self.load_json(self.parsed_path)
+        self.parsed_dirty = False
+        ## pooled session ##
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': 'Stadium Data Research Bot/1.0'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    ##############
+    ## MANIFEST ##
+    ##############
+    def load_json(self, path: str) -> dict:
+        '''
+        Load a json file from the cache directory, or an empty dict
+        '''
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print('Cache read error: {0}'.format(e))
+        return {}
+
+    def save_json(self, path: str, content: dict):
+        '''
+        Write a json file to the cache directory atomically
+        '''
+        with self.lock:
+            tmp_path = '{0}.tmp'.format(path)
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(content, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print('Cache write error: {0}'.format(e))
+
+    def load_manifest(self) -> dict:
+        '''
+        Load the manifest of cache entries, keyed by url hash
+        '''
+        return self.load_json(self.manifest_path)
 
-    def get_cache_path(self, stadium_id: str) -> pathlib.Path:
+    def save_manifest(self):
         '''
-        Get the full path for a cached page based on stadium id
+        Write the manifest atomically
+        '''
+        with self.lock:
+            self.save_json(self.manifest_path, self.manifest)
+            self.dirty = False
+
+    def flush(self):
+        '''
+        Save the manifest and parse results if they have unsaved changes.
+        Reads and writes only update them in memory, so call this once after
+        a batch of pages. Parse results for content that is no longer cached
+        are dropped here
+        '''
+        with self.lock:
+            if self.dirty:
+                self.save_manifest()
+            if self.parsed_dirty:
+                live = set(entry['content_hash'] for entry in self.manifest.values())
+                self.parsed = {
+                    key: value for key, value in self.parsed.items()
+                    if key.split(':', 1)[0] in live
+                }
+                self.save_json(self.parsed_path, self.parsed)
+                self.parsed_dirty = False
+
+    def read_parsed(self, content_hash: str, parser_version: str) -> Tuple[bool, Optional[dict]]:
+        '''
+        Look up the parse result of a page by its content hash and the parser
+        version. Returns whether it was found, and the result
+        '''
+        key = '{0}:{1}'.format(content_hash, parser_version)
+        if key not in self.parsed:
+            return False, None
+        return True, self.parsed[key]
+
+    def write_parsed(self, content_hash: str, parser_version: str, data: Optional[dict]):
+        '''
+        Store the parse result of a page, until the next flush. Results from
+        other parser versions are dropped
+        '''
+        with self.lock:
+            self.parsed = {
+                key: value for key, value in self.parsed.items()
+                if key.split(':', 1)[1] == parser_version
+            }
+            self.parsed[
+                '{0}:{1}'.format(content_hash, parser_version)
+            ] = data
+            self.parsed_dirty = True
+
+    def url_key(self, wikipedia_url: str) -> str:
+        '''
+        Cache key for a url
+        '''
+        return hashlib.sha256(wikipedia_url.encode('utf-8')).hexdigest()
+
+    def get_cache_path(self, wikipedia_url: str) -> str:
         '''
-        return '{0}/{1}.txt'.format(
+        Get the full path for a cached page based on its url
+        '''
+        entry = self.manifest.get(self.url_key(wikipedia_url), {})
+        return '{0}/{1}.html.{2}'.format(
             self.cache_dir,
-            stadium_id
+            self.url_key(wikipedia_url),
+            entry.get('compression', 'gz')
         )
 
-    def read_cache(self, stadium_id: str) -> Optional[str]:
+    def is_stale(self, wikipedia_url: str) -> bool:
+        '''
+        Returns True if the url is cached and the entry is older than its ttl
         '''
-        Read HTML content from cache if it exists
+        entry = self.manifest.get(self.url_key(wikipedia_url))
+        if entry is None or entry.get('ttl') is None:
+            return False
+        return time.time() - entry['fetched_at'] > entry['ttl']
+
+    ######################
+    ## ENTRY READ/WRITE ##
+    ######################
+    def read_cache(self, wikipedia_url: str) -> Optional[str]:
         '''
-        cache_path = self.get_cache_path(stadium_id)
+        Read HTML content from cache if it exists and is intact
+        '''
+        key = self.url_key(wikipedia_url)
+        entry = self.manifest.get(key)
+        if entry is None:
+            return None
+        cache_path = self.get_cache_path(wikipedia_url)
         try:
-            if os.path.exists(cache_path):
-                with open(cache_path, 'r', encoding='utf-8') as f:
-                    return f.read()
+            with open(cache_path, 'rb') as f:
+                content = decompress(f.read(), entry['compression'])
+            if hashlib.sha256(content).hexdigest() != entry['content_hash']:
+                raise ValueError('content hash mismatch for {0}'.format(wikipedia_url))
         except Exception as e:
             print('Cache read error: {0}'.format(e))
-            pass
-            ## log in the future ##
-        return None
+            self.remove_entry(key, save=False)
+            return None
+        with self.lock:
+            entry['accessed_at'] = time.time()
+            self.dirty = True
+        return content.decode('utf-8')
 
-    def write_cache(self, stadium_id: str, content: str) -> bool:
+    def write_cache(self,
+        stadium_id: str,
+        wikipedia_url: str,
+        content: str,
+        response: Optional[requests.Response] = None
+    ) -> bool:
         '''
-        Write HTML content to cache
+        Write HTML content to cache, recording it and the response validators
+        in the manifest until the next flush, and evict entries if the cache
+        is over budget
         '''
-        cache_path = self.get_cache_path(stadium_id)
-        try:
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            return True
-        except Exception as e:
-            pass
-            ## log in the future ##
-        return False
+        key = self.url_key(wikipedia_url)
+        raw = content.encode('utf-8')
+        data, compression = compress(raw)
+        now = time.time()
+        with self.lock:
+            ## drop the old file if the compression changed ##
+            old = self.manifest.get(key)
+            if old is not None and old.get('compression') != compression:
+                self.remove_entry(key, save=False)
+            path = '{0}/{1}.html.{2}'.format(self.cache_dir, key, compression)
+            tmp_path = '{0}.tmp'.format(path)
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print('Cache write error: {0}'.format(e))
+                return False
+            self.manifest[key] = {
+                'url': wikipedia_url,
+                'stadium_id': stadium_id,
+                'fetched_at': now,
+                'accessed_at': now,
+                'ttl': self.ttl,
+                'content_hash': hashlib.sha256(raw).hexdigest(),
+                'raw_bytes': len(raw),
+                'bytes': len(data),
+                'compression': compression,
+                'etag': response.headers.get('ETag') if response is not None else None,
+                'last_modified': response.headers.get('Last-Modified') if response is not None else None
+            }
+            self.evict(keep=key, save=False)
+            self.dirty = True
+        return True
 
+    def touch_entry(self, wikipedia_url: str, response: requests.Response):
+        '''
+        Mark a cached page as freshly validated after a 304
+        '''
+        with self.lock:
+            entry = self.manifest.get(self.url_key(wikipedia_url))
+            if entry is None:
+                return
+            entry['fetched_at'] = time.time()
+            entry['ttl'] = self.ttl
+            entry['etag'] = response.headers.get('ETag', entry.get('etag'))
+            entry['last_modified'] = response.headers.get('Last-Modified', entry.get('last_modified'))
+            self.dirty = True
+
+    def remove_entry(self, key: str, save: bool = True):
+        '''
+        Remove an entry and its file from the cache. With save=False, the
+        manifest is only marked dirty so the caller can save once
+        '''
+        with self.lock:
+            entry = self.manifest.pop(key, None)
+            if entry is None:
+                return
+            try:
+                os.remove('{0}/{1}.html.{2}'.format(self.cache_dir, key, entry['compression']))
+            except OSError:
+                pass
+            if save:
+                self.save_manifest()
+            else:
+                self.dirty = True
+
+    def evict(self, keep: Optional[str] = None, save: bool = True):
+        '''
+        Evict least recently used entries until the cache is within max_bytes.
+        The manifest is saved once at the end, or left dirty if save is False
+        '''
+        if self.max_bytes is None:
+            return
+        with self.lock:
+            total = sum(entry['bytes'] for entry in self.manifest.values())
+            evicted = 0
+            for key in sorted(self.manifest, key=lambda k: self.manifest[k]['accessed_at']):
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                total -= self.manifest[key]['bytes']
+                self.remove_entry(key, save=False)
+                evicted += 1
+            if save and evicted > 0:
+                self.save_manifest()
+
+    def conditional_headers(self, wikipedia_url: str) -> dict:
+        '''
+        Headers to revalidate a cached page. Empty if the page is not cached
+        '''
+        entry = self.manifest.get(self.url_key(wikipedia_url))
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    ##############
+    ## REQUESTS ##
+    ##############
     def request_html_text(self,
         stadium_id: str,
         wikipedia_url: str,
@@ -61,22 +364,52 @@ class WikipediaCache:
     ) -> Optional[str]:
         '''
         Request HTML for a Wikipedia URL with caching and exponential backoff.
-        
+        See request_html for parameters
+
+        Returns:
+        * html: Optional[str]
+        '''
+        html_text, _ = self.request_html(
+            stadium_id,
+            wikipedia_url,
+            force_rescrape,
+            retry_count,
+            initial_delay
+        )
+        return html_text
+
+    def request_html(self,
+        stadium_id: str,
+        wikipedia_url: str,
+        force_rescrape: bool = False,
+        retry_count: int = 3,
+        initial_delay: float = 0.5
+    ) -> Tuple[Optional[str], bool]:
+        '''
+        Request HTML for a Wikipedia URL with caching and exponential backoff.
+        Fresh cached pages are returned without a request. Stale or rescraped
+        pages are revalidated with a conditional request, and the cached page
+        is returned if the server reports it as unchanged, or if the request
+        fails
+
         Parameters:
-        * stadium_id: str -- id for cache lookup
+        * stadium_id: str -- id recorded with the cache entry
         * wikipedia_url: str -- url to scrape
         * force_rescrape: bool -- if True, force rescrape the url
         * retry_count: int -- number of retries on failure
         * initial_delay: float -- initial delay between retries in seconds
-        
+
         Returns:
         * html: Optional[str]
+        * modified: bool -- True if the html was downloaded, False if it came
+        from the cache or was revalidated as unchanged
         '''
-        ## Check cache first unless force_rescrape is True
-        if not force_rescrape:
-            cached_content = self.read_cache(stadium_id)
+        ## Check cache first unless force_rescrape is True or the entry is stale
+        if not force_rescrape and not self.is_stale(wikipedia_url):
+            cached_content = self.read_cache(wikipedia_url)
             if cached_content is not None:
-                return cached_content
+                return cached_content, False
+        headers = self.conditional_headers(wikipedia_url)
         ## attempt to get html, with exponential backoff
         delay = initial_delay
         for attempt in range(retry_count):
@@ -85,22 +418,42 @@ class WikipediaCache:
                 time.sleep(delay)
                 delay *= 2  # Exponential backoff
             ## request the html ##
-            response = requests.get(
-                wikipedia_url,
-                headers={'User-Agent': 'Stadium Data Research Bot/1.0'}
-            )
+            self.rate_limiter.wait()
+            try:
+                response = self.session.get(
+                    wikipedia_url,
+                    headers=headers,
+                    timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                ## timeouts and connection errors are retried ##
+                print('Request error for {0}: {1}'.format(wikipedia_url, e))
+                continue
             ## handle response ##
+            if response.status_code == 304:
+                ## unchanged, serve the cached page ##
+                cached_content = self.read_cache(wikipedia_url)
+                if cached_content is not None:
+                    self.touch_entry(wikipedia_url, response)
+                    return cached_content, False
+                ## entry was unreadable, so refetch without validators ##
+                headers = {}
+                continue
             if response.status_code == 200:
                 # Success - write to cache and return
-                self.write_cache(stadium_id, response.text)
-                return response.text
+                self.write_cache(stadium_id, wikipedia_url, response.text, response)
+                return response.text, True
             if response.status_code == 404:
                 ## if not found, no need to retry
-                return None
+                return None, False
             ## otherwise retry ##
             if attempt < retry_count - 1:
                 continue
             ## unless we are out of retries, in which break ##
             break
-        ## and then return None post break ##
-        return None
+        ## serve a stale page rather than nothing if it could not be refreshed ##
+        cached_content = self.read_cache(wikipedia_url)
+        if cached_content is not None:
+            print('Could not refresh {0}, using the cached page'.format(wikipedia_url))
+            return cached_content, False
+        return None, False
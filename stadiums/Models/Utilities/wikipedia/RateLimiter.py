@@ -0,0 +1,26 @@
+import time
+import threading
+from typing import Optional
+
+class RateLimiter:
+    '''
+    A thread safe rate limiter that spaces out requests so that no more than
+    requests_per_second are started across all threads sharing the limiter
+    '''
+    def __init__(self, requests_per_second: Optional[float] = None):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        '''
+        Block until the caller is allowed to make a request
+        '''
+        if self.interval <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
@@ -1,17 +1,39 @@
 ## built-in ##
 import time
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 import re
 import pathlib
 import os
+import hashlib
 
 ## external ##
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+## lxml is optional, and is used to parse the infobox when available ##
+try:
+    import lxml
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+## bump when parsing logic changes to invalidate cached parse results ##
+PARSER_VERSION = '1-{0}'.format(PARSER)
+
+def is_infobox_class(value) -> bool:
+    '''
+    Strainer filter for infobox tables. While parsing, the class attribute
+    is not yet split, so multi-class values like "infobox vcard" are checked here
+    '''
+    if value is None:
+        return False
+    classes = value.split() if isinstance(value, str) else value
+    return 'infobox' in classes
 
 ## internal ##
 from .Cache import WikipediaCache
+from .RateLimiter import RateLimiter
 
 class WikipediaScraper:
     '''
@@ -19,10 +41,35 @@ class WikipediaScraper:
     for faster/smarter retrieval
 
     To use, create an instance, and then call get_wikipedia_data with the
-    stadium id and wikipedia url
+    stadium id and wikipedia url. Fetching (request_html_text) and parsing
+    (parse_wikipedia_data) can also be called separately, ie to fetch from a
+    thread pool while parsing completed pages. A single instance can be
+    shared across threads
+
+    Parameters:
+    * timeout: float -- seconds to wait on each request before giving up
+    * rate_limiter: Optional[RateLimiter] -- limiter shared by all requests
+    * pool_size: int -- max number of pooled connections per host
+    * ttl: Optional[float] -- seconds before a cached page is stale, see WikipediaCache
+    * max_bytes: Optional[int] -- byte budget of the cache, see WikipediaCache
+    * cache_dir: Optional[str] -- directory of the cache, see WikipediaCache
     '''
-    def __init__(self):
-        self.cache = WikipediaCache()
+    def __init__(self,
+        timeout: float = 10.0,
+        rate_limiter: Optional[RateLimiter] = None,
+        pool_size: int = 10,
+        ttl: Optional[float] = 30 * 24 * 60 * 60,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        cache_dir: Optional[str] = None
+    ):
+        self.cache = WikipediaCache(
+            timeout=timeout,
+            rate_limiter=rate_limiter,
+            pool_size=pool_size,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            cache_dir=cache_dir
+        )
 
     #####################
     ## PARSING HELPERS ##
@@ -215,17 +262,81 @@ class WikipediaScraper:
         Returns:
         * data: Dict
         '''
-        ## request the html text ##
-        html_text = self.cache.request_html_text(
+        html_text = self.request_html_text(
             stadium_id,
             wikipedia_url,
             force_rescrape
         )
+        return self.parse_wikipedia_data(html_text)
+
+    def request_html_text(self,
+        stadium_id: str,
+        wikipedia_url: str,
+        force_rescrape: bool = False
+    ) -> Optional[str]:
+        '''
+        Get the html text for a Wikipedia url from the cache, or by requesting it
+        '''
+        return self.cache.request_html_text(
+            stadium_id,
+            wikipedia_url,
+            force_rescrape
+        )
+
+    def request_html(self,
+        stadium_id: str,
+        wikipedia_url: str,
+        force_rescrape: bool = False
+    ) -> Tuple[Optional[str], bool]:
+        '''
+        Get the html text for a Wikipedia url along with whether it was
+        downloaded (True) or came from the cache / was unchanged (False)
+        '''
+        return self.cache.request_html(
+            stadium_id,
+            wikipedia_url,
+            force_rescrape
+        )
+
+    def parse_wikipedia_data(self, html_text: Optional[str]) -> Optional[Dict]:
+        '''
+        Parse the infobox of Wikipedia HTML into a structured dictionary
+
+        Parameters:
+        * html_text: Optional[str] -- html of the page
+
+        Returns:
+        * data: Dict
+        '''
         ## handle response ##
         if html_text is None:
             return None
+        ## unchanged pages are served from the parse cache ##
+        content_hash = hashlib.sha256(html_text.encode('utf-8')).hexdigest()
+        found, data = self.cache.read_parsed(content_hash, PARSER_VERSION)
+        if found:
+            return data
+        data = self.parse_infobox(html_text)
+        self.cache.write_parsed(content_hash, PARSER_VERSION, data)
+        return data
+
+    def parse_infobox(self, html_text: str) -> Optional[Dict]:
+        '''
+        Parse the infobox of Wikipedia HTML into a structured dictionary. Only
+        infobox tables are built into the soup, rather than the whole article
+
+        Parameters:
+        * html_text: str -- html of the page
+
+        Returns:
+        * data: Dict
+        '''
         ## parse the html ##
-        soup = BeautifulSoup(html_text, 'html.parser')
+        soup = BeautifulSoup(
+            html_text,
+            PARSER,
+            parse_only=SoupStrainer('table', class_=is_infobox_class)
+        )
         infobox = soup.find('table', class_='infobox')
         if not infobox:
             ## add future logging ##
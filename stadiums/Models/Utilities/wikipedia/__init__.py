@@ -1 +1,2 @@
-from .Scraper import WikipediaScraper
\ No newline at end of file
+from .Scraper import WikipediaScraper
+from .RateLimiter import RateLimiter
\ No newline at end of file
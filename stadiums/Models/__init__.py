@@ -1,2 +1,4 @@
 from .Stadium import Stadium
 from .StadiumCollection import StadiumCollection
+from .GeoIndex import GeoIndex, haversine
+from .HFAIndex import HFAIndex
@@ -0,0 +1,220 @@
+## built-ins ##
+import os
+import json
+import pathlib
+from typing import Dict, List, Optional
+
+## external ##
+import pandas as pd
+import numpy
+
+## internal ##
+from ..Pipeline import hash_frame
+from .parquet import write_parquet, PARQUET_AVAILABLE
+
+## bump when the layout changes so existing stores are rewritten ##
+SEASON_STORE_VERSION = 1
+## leading underscore so parquet readers skip it ##
+MANIFEST_NAME = '_manifest.json'
+
+class SeasonStore:
+    '''
+    Persists a frame keyed by season and week as one file per season,
+    appending only the rows that are new since the last write
+
+    Rows are ordered by season, week, then group_cols. Once written, a row is
+    assumed never to change unless the model that produced it does. A manifest
+    records the fingerprint of that model, a hash of every persisted row, and
+    the last persisted week of each group. On write:
+    * if the fingerprint, the columns, or any persisted row changed, every
+    season is rewritten
+    * otherwise rows after each group's last persisted week are new. Note that
+    for padded frames these can fall in weeks that were already persisted, ie
+    the gap between a group's last record and its newest one
+    * new rows are appended to their season's csv when they all come after its
+    last week, and the season is rewritten otherwise. Parquet files can not be
+    appended to, so touched seasons are rewritten
+
+    Seasons are written from the frame in memory, so nothing is read back.
+    Season files whose size no longer matches the manifest are rewritten
+
+    Parameters:
+    * loc: str - directory of the season files
+    * group_cols: Optional[List[str]] - columns that identify a series, ie
+    team and stadium. None for a single series, ie the league
+    * fmt: str - csv or parquet
+    '''
+    def __init__(self, loc: str, group_cols: Optional[List[str]] = None, fmt: str = 'csv'):
+        if fmt not in ['csv', 'parquet']:
+            raise ValueError('SeasonStore fmt must be csv or parquet')
+        self.loc = loc
+        self.group_cols = group_cols if group_cols is not None else []
+        self.fmt = fmt
+        self.sort_cols = ['season', 'week'] + self.group_cols
+        self.manifest_path = '{0}/{1}'.format(loc, MANIFEST_NAME)
+
+    ###########
+    ## PATHS ##
+    ###########
+    def season_path(self, season: int) -> str:
+        return '{0}/{1}.{2}'.format(self.loc, season, self.fmt)
+
+    def season_files(self) -> List[pathlib.Path]:
+        '''
+        Season files in the store, in season order
+        '''
+        if not os.path.isdir(self.loc):
+            return []
+        return sorted(
+            pathlib.Path(self.loc).glob('*.{0}'.format(self.fmt)),
+            key=lambda path: int(path.stem) if path.stem.isdigit() else 0
+        )
+
+    ##############
+    ## MANIFEST ##
+    ##############
+    def load_manifest(self) -> Optional[dict]:
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != SEASON_STORE_VERSION or manifest.get('fmt') != self.fmt:
+            return None
+        return manifest
+
+    def save_manifest(self, manifest: dict):
+        tmp_path = '{0}.tmp'.format(self.manifest_path)
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(manifest, indent=2, sort_keys=True))
+        os.replace(tmp_path, self.manifest_path)
+
+    def group_keys(self, df: pd.DataFrame) -> numpy.ndarray:
+        '''
+        Single string key for the group of each row, ie KC|KAN00
+        '''
+        if len(self.group_cols) == 0:
+            return numpy.full(len(df), '', dtype=object)
+        return df[self.group_cols].astype(str).agg('|'.join, axis=1).to_numpy(dtype=object)
+
+    ###########
+    ## WRITE ##
+    ###########
+    def write_season(self, df: pd.DataFrame, season: int, append: bool = False):
+        path = self.season_path(season)
+        if self.fmt == 'parquet':
+            write_parquet(df, path)
+        elif append:
+            df.to_csv(path, index=False, header=False, mode='a')
+        else:
+            tmp_path = '{0}.tmp'.format(path)
+            df.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+    def write(self, df: pd.DataFrame, fingerprint: str) -> Dict:
+        '''
+        Persist df, appending new rows where possible
+
+        Parameters:
+        * df: pd.DataFrame - the full frame, with season and week columns
+        * fingerprint: str - hash of the conf and code that produced df
+
+        Returns:
+        * summary: Dict - mode (rewrite, append, unchanged, or skipped), the seasons
+        written, and the number of new rows
+        '''
+        if self.fmt == 'parquet' and not PARQUET_AVAILABLE:
+            print('Parquet output requires pyarrow. Skipping {0}'.format(self.loc))
+            return {'mode': 'skipped', 'seasons': [], 'new_rows': 0}
+        df = df.sort_values(by=self.sort_cols, kind='stable').reset_index(drop=True)
+        seasons = df['season'].to_numpy(dtype=numpy.int64)
+        week_keys = seasons * 100 + df['week'].to_numpy(dtype=numpy.int64)
+        keys = self.group_keys(df)
+        manifest = self.load_manifest()
+        ## rows already persisted, or None if the store must be rewritten ##
+        persisted = None
+        if (
+            manifest is not None and
+            manifest['fingerprint'] == fingerprint and
+            manifest['columns'] == [str(col) for col in df.columns]
+        ):
+            group_last = pd.Series(keys).map(manifest['group_last']).fillna(-1).to_numpy()
+            persisted = week_keys <= group_last
+            if hash_frame(df[persisted]) != manifest['hash']:
+                print('Persisted rows in {0} changed. Rewriting all seasons'.format(self.loc))
+                persisted = None
+        pathlib.Path(self.loc).mkdir(parents=True, exist_ok=True)
+        unique_seasons = numpy.unique(seasons)
+        if persisted is None:
+            mode = 'rewrite'
+            for path in self.season_files():
+                path.unlink()
+            written = unique_seasons.tolist()
+            for season in written:
+                self.write_season(df[seasons == season], season)
+            new_rows = len(df)
+        else:
+            new = ~persisted
+            new_rows = int(new.sum())
+            written = []
+            for season in unique_seasons.tolist():
+                path = self.season_path(season)
+                info = manifest['seasons'].get(str(season))
+                intact = (
+                    info is not None and
+                    os.path.exists(path) and
+                    os.path.getsize(path) == info['bytes']
+                )
+                season_new = new & (seasons == season)
+                if intact and not season_new.any():
+                    continue
+                if (
+                    self.fmt == 'csv' and intact and
+                    week_keys[season_new].min() > season * 100 + info['last_week']
+                ):
+                    self.write_season(df[season_new], season, append=True)
+                else:
+                    self.write_season(df[seasons == season], season)
+                written.append(season)
+            mode = 'append' if len(written) > 0 else 'unchanged'
+        if mode != 'unchanged':
+            group_last = pd.Series(week_keys).groupby(keys).max()
+            self.save_manifest({
+                'version': SEASON_STORE_VERSION,
+                'fmt': self.fmt,
+                'fingerprint': fingerprint,
+                'columns': [str(col) for col in df.columns],
+                'hash': hash_frame(df),
+                'group_last': {str(key): int(value) for key, value in group_last.items()},
+                'seasons': {
+                    str(season): {
+                        'rows': int((seasons == season).sum()),
+                        'last_week': int(week_keys[seasons == season].max() % 100),
+                        'bytes': os.path.getsize(self.season_path(season))
+                    } for season in unique_seasons.tolist()
+                }
+            })
+        return {'mode': mode, 'seasons': written, 'new_rows': new_rows}
+
+    ##########
+    ## READ ##
+    ##########
+    def read(self, seasons: Optional[List[int]] = None) -> pd.DataFrame:
+        '''
+        Read the store back as a single frame in season, week, group order
+
+        Parameters:
+        * seasons: Optional[List[int]] - only read these seasons
+
+        Returns:
+        * df: pd.DataFrame
+        '''
+        paths = [
+            path for path in self.season_files()
+            if seasons is None or int(path.stem) in seasons
+        ]
+        if len(paths) == 0:
+            return pd.DataFrame()
+        if self.fmt == 'parquet':
+            return pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+        return pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)
@@ -0,0 +1,2 @@
+from .parquet import write_parquet, typed_output, parquet_path, PARQUET_AVAILABLE
+from .SeasonStore import SeasonStore
@@ -0,0 +1,85 @@
+## built-ins ##
+import os
+import pathlib
+
+## external ##
+import pandas as pd
+
+## parquet requires pyarrow, which is optional ##
+try:
+    import pyarrow
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+## id columns written as categoricals ##
+CATEGORICAL_COLUMNS = [
+    'team', 'team_fastr', 'stadium', 'stadium_id',
+    'surface_type', 'roof_type', 'home_team', 'away_team',
+    'home_home_stadium', 'away_home_stadium'
+]
+## whole number columns, which are float in the csvs when they contain NaN ##
+INT_COLUMNS = {
+    'season': 'Int16',
+    'week': 'Int8',
+    'games_played': 'Int32',
+    'win': 'Int32',
+    'loss': 'Int32',
+    'tie': 'Int32',
+    'heading': 'Int16',
+    'tz_offset': 'Int8',
+    'capacity': 'Int32',
+    'broke_ground': 'Int16',
+    'opened': 'Int16',
+    'closed': 'Int16',
+    'demolished': 'Int16',
+    'construction_cost': 'Int64',
+    'construction_cost_2023': 'Int64',
+    'home_rest_days': 'Int16',
+    'away_rest_days': 'Int16',
+    'home_tz_shift': 'Int8',
+    'away_tz_shift': 'Int8'
+}
+## rolling counts, ie wins_l16 or ties_all_time ##
+COUNT_PREFIXES = ['wins_', 'losses_', 'ties_']
+
+def typed_output(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Copy of an output frame with compact dtypes for parquet. Ids are
+    categorical, and counts and other whole numbers are nullable ints so
+    missing values stay missing. Other columns are unchanged
+    '''
+    dtypes = {}
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS:
+            dtypes[col] = 'category'
+        elif col in INT_COLUMNS:
+            dtypes[col] = INT_COLUMNS[col]
+        elif any(col.startswith(prefix) for prefix in COUNT_PREFIXES):
+            dtypes[col] = 'Int32'
+    return df.astype(dtypes)
+
+def write_parquet(df: pd.DataFrame, path: str) -> bool:
+    '''
+    Write an output frame to parquet with typed_output dtypes, atomically
+
+    Parameters:
+    * df: pd.DataFrame - frame to write
+    * path: str - file to write
+
+    Returns:
+    * written: bool - False if pyarrow is not installed
+    '''
+    if not PARQUET_AVAILABLE:
+        print('Parquet output requires pyarrow. Skipping {0}'.format(path))
+        return False
+    tmp_path = '{0}.tmp'.format(path)
+    typed_output(df).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return True
+
+def parquet_path(csv_path: str) -> str:
+    '''
+    Parquet path that sits alongside a csv output
+    '''
+    return str(pathlib.Path(csv_path).with_suffix('.parquet'))
@@ -0,0 +1,224 @@
+## built-ins ##
+import os
+import json
+import inspect
+import hashlib
+import pathlib
+from typing import Callable, Dict, List, Optional
+
+## external ##
+import pandas as pd
+
+## bump to invalidate every recorded stage ##
+PIPELINE_VERSION = 1
+## outputs are recorded relative to the repo root so state is portable ##
+ROOT = pathlib.Path(__file__).parent.parent.parent.resolve()
+
+def hash_frame(df: pd.DataFrame) -> str:
+    '''
+    Content hash of a dataframe's columns and values, ignoring the index
+    '''
+    h = hashlib.sha256()
+    h.update(json.dumps([str(col) for col in df.columns]).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def hash_file(path: str) -> Optional[str]:
+    '''
+    Content hash of a file, or None if it does not exist. A directory, ie a
+    season store, hashes the relative path and content of every file in it
+    '''
+    if not os.path.exists(path):
+        return None
+    if os.path.isdir(path):
+        h = hashlib.sha256()
+        for file_path in sorted(pathlib.Path(path).rglob('*')):
+            if file_path.is_file():
+                h.update(file_path.relative_to(path).as_posix().encode('utf-8'))
+                h.update(hash_file(str(file_path)).encode('utf-8'))
+        return h.hexdigest()
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def hash_code(*objs) -> str:
+    '''
+    Combined hash of the source files that define each module, class, or
+    function, so stages rerun when their code changes
+    '''
+    h = hashlib.sha256()
+    for path in sorted(set(inspect.getsourcefile(obj) for obj in objs)):
+        h.update(hash_file(path).encode('utf-8'))
+    return h.hexdigest()
+
+def hash_source(*objs) -> str:
+    '''
+    Combined hash of the source of each function or class itself, so edits
+    elsewhere in their files do not change it
+    '''
+    h = hashlib.sha256()
+    for obj in objs:
+        h.update(inspect.getsource(obj).encode('utf-8'))
+    return h.hexdigest()
+
+class Pipeline:
+    '''
+    Tracks the inputs and outputs of pipeline stages so that stages whose
+    inputs are unchanged can be skipped
+
+    Each stage declares its inputs as a dict of name to content hash (source
+    frames, conf, code) and the files it writes. After a stage runs, its
+    input fingerprint and the hash of each output file are recorded in the
+    state file. A later run skips the stage when the fingerprint matches and
+    every output still exists with its recorded hash, so deleted or edited
+    outputs are regenerated
+
+    The state file holds no timestamps, so a run where nothing changes
+    leaves it untouched
+
+    Parameters:
+    * state_path: Optional[str] - json state file, defaults to Pipeline/state.json
+    * force: bool - if True, run every stage regardless of recorded state
+    '''
+    def __init__(self, state_path: Optional[str] = None, force: bool = False):
+        self.state_path = state_path if state_path is not None else '{0}/state.json'.format(
+            pathlib.Path(__file__).parent.resolve()
+        )
+        self.force = force
+        self.state = self.load_state()
+        ## names of stages run and skipped in this run ##
+        self.ran: List[str] = []
+        self.skipped: List[str] = []
+
+    ###########
+    ## STATE ##
+    ###########
+    def load_state(self) -> dict:
+        '''
+        Load the recorded state, discarding it if it is unreadable or from
+        another pipeline version
+        '''
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if state.get('version') == PIPELINE_VERSION:
+                return state
+        except (OSError, ValueError):
+            pass
+        return {'version': PIPELINE_VERSION, 'stages': {}}
+
+    def save_state(self):
+        '''
+        Write the state atomically, only if it changed
+        '''
+        content = json.dumps(self.state, indent=2, sort_keys=True)
+        try:
+            with open(self.state_path, 'r') as f:
+                if f.read() == content:
+                    return
+        except OSError:
+            pass
+        tmp_path = '{0}.tmp'.format(self.state_path)
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, self.state_path)
+
+    def rel_path(self, path: str) -> str:
+        '''
+        Path relative to the repo root if it is inside the repo
+        '''
+        resolved = pathlib.Path(path).resolve()
+        try:
+            return resolved.relative_to(ROOT).as_posix()
+        except ValueError:
+            return resolved.as_posix()
+
+    def fingerprint(self, inputs: Dict[str, Optional[str]]) -> str:
+        '''
+        Single hash of a stage's named input hashes
+        '''
+        return hashlib.sha256(
+            json.dumps(inputs, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    ############
+    ## STAGES ##
+    ############
+    def is_current(self, name: str, inputs: Dict[str, Optional[str]], outputs: List[str]) -> bool:
+        '''
+        Returns True if the stage was recorded with the same inputs and its
+        outputs are unchanged
+        '''
+        if self.force:
+            return False
+        recorded = self.state['stages'].get(name)
+        if recorded is None or recorded['fingerprint'] != self.fingerprint(inputs):
+            return False
+        if sorted(recorded['outputs'].keys()) != sorted(self.rel_path(path) for path in outputs):
+            return False
+        return all(
+            hash_file(path) == recorded['outputs'][self.rel_path(path)]
+            for path in outputs
+        )
+
+    def record(self, name: str, inputs: Dict[str, Optional[str]], outputs: List[str]):
+        '''
+        Record a completed stage and the hashes of its outputs
+        '''
+        self.state['stages'][name] = {
+            'fingerprint': self.fingerprint(inputs),
+            'outputs': {self.rel_path(path): hash_file(path) for path in outputs}
+        }
+        self.save_state()
+
+    def output_hash(self, name: str) -> Optional[str]:
+        '''
+        Combined hash of a recorded stage's outputs, for use as an input
+        of downstream stages
+        '''
+        recorded = self.state['stages'].get(name)
+        if recorded is None:
+            return None
+        return self.fingerprint(recorded['outputs'])
+
+    def run_stage(self,
+        name: str,
+        inputs: Dict[str, Optional[str]],
+        outputs: List[str],
+        func: Callable
+    ) -> bool:
+        '''
+        Run func unless the stage is current, then record it
+
+        Parameters:
+        * name: str - stage name
+        * inputs: Dict[str, Optional[str]] - hashes of everything the stage reads
+        * outputs: List[str] - files the stage writes
+        * func: Callable - runs the stage
+
+        Returns:
+        * ran: bool - True if the stage ran, False if it was skipped
+        '''
+        if self.is_current(name, inputs, outputs):
+            self.skipped.append(name)
+            return False
+        func()
+        self.record(name, inputs, outputs)
+        self.ran.append(name)
+        return True
+
+    def write_if_changed(self, name: str, path: str, content: str) -> bool:
+        '''
+        Write text to path only if it differs from the file's current content.
+        The write is recorded as a stage whose input is the content itself
+
+        Returns:
+        * written: bool
+        '''
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        def write():
+            with open(path, 'w', newline='') as f:
+                f.write(content)
+        return self.run_stage(name, {'content': content_hash}, [path], write)
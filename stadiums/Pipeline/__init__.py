@@ -0,0 +1 @@
+from .Pipeline import Pipeline, hash_frame, hash_file, hash_code, hash_source
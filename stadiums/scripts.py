@@ -2,41 +2,57 @@
 import pathlib
 from typing import Optional
 
-## external ##
-import pandas as pd
-
 ## local ##
 from .DataLoader import data
-from .Models import StadiumCollection
-from .Analytics import calc_analytics, gen_team_stadiums
+from .Instrumentation import instrument
+from .Models import StadiumCollection, GeoIndex
+from .Analytics import calc_analytics, gen_team_stadiums, gen_game_travel
+from .Analytics.Elo import EloModel
+from .Analytics.Elo.EloEngine import EloEngine
+from .Pipeline import Pipeline, hash_frame, hash_file, hash_code
+from .Outputs import SeasonStore, write_parquet, parquet_path
 
 def update_stadiums(
     force_rescrape: bool = False,
-    force_reparse: bool = False
+    force_reparse: bool = False,
+    force_rerun: bool = False,
+    parquet: bool = False
 ) -> None:
     '''
     Primary script for updating stadium meta data
 
+    The stadium collection is always refreshed, but outputs are only rewritten
+    when their inputs change. The analytics, team stadiums, and game travel are
+    pipeline stages fingerprinted by the games, ratings, conf, and code they depend
+    on, and are skipped when the fingerprint matches the last run and their outputs
+    are intact
+
     Parameters:
     * force_rescrape: bool - if True, will rescrape wikipedia data even if it already exists
-    * games: pd.DataFrame - optionally pass a preloaded games dataframe
+    * force_reparse: bool - if True, will reparse wikipedia data even if it exists
+    * force_rerun: bool - if True, will rerun every stage even if its inputs are unchanged
+    * parquet: bool - if True, also write typed parquet copies of the outputs
 
     Returns:
     * None
     '''
+    pipeline = Pipeline(force=force_rerun)
+    data_loc = '{0}/data'.format(pathlib.Path(__file__).parent.parent.resolve())
     ## initialize the stadium collection ##
     stadium_collection = StadiumCollection()
     ## if a local stadiums file exists, load it ##
-    stadium_loc = '{0}/data/stadiums.csv'.format(
-        pathlib.Path(__file__).parent.parent.resolve()
-    )
+    stadium_loc = '{0}/stadiums.csv'.format(data_loc)
     ## if a file exists, pre-load the stadium collection
-    if pathlib.Path(stadium_loc).exists():
-        stadium_collection.populate_from_csv(stadium_loc)
+    with instrument.stage('load_stadiums') as stage:
+        if pathlib.Path(stadium_loc).exists():
+            stadium_collection.populate_from_csv(stadium_loc)
+        stage.rows = len(stadium_collection.stadiums)
     ## retrieve the games dataframe ##
-    games = data.db['games'].copy()
+    with instrument.stage('load_games') as stage:
+        games = data.db['games']
+        stage.rows = len(games)
     ## isolate the stadiums from the games ##
-    stadiums = games.groupby('stadium_id').tail(1).copy()[[
+    stadiums = games.groupby('stadium_id', observed=True).tail(1)[[
         'stadium_id', 'stadium'
     ]].rename(columns={
         'stadium': 'stadium_name'
@@ -44,16 +60,97 @@ def update_stadiums(
     ## update the stadium collection ##
     stadium_collection.extend_from_recs(stadiums)
     ## add fastr meta data ##
-    stadium_collection.add_fastr_meta()
+    with instrument.stage('add_fastr_meta') as stage:
+        stadium_collection.add_fastr_meta()
+        stage.rows = len(stadium_collection.stadiums)
     ## update the stadium data ##
-    stadium_collection.update_stadium_data(
-        force_reparse=force_reparse,
-        force_rescrape=force_rescrape
-    )
-    ## save the stadium collection ##
-    stadium_collection.to_csv(stadium_loc)
+    with instrument.stage('update_stadium_data') as stage:
+        stadium_collection.update_stadium_data(
+            force_reparse=force_reparse,
+            force_rescrape=force_rescrape
+        )
+        stage.rows = len(stadium_collection.stadiums)
+    ## save the stadium collection, if it changed ##
+    with instrument.stage('save_stadiums'):
+        stadium_collection.update_df()
+        stadium_csv = stadium_collection.stadium_df.to_csv(index=False)
+        pipeline.write_if_changed('save_stadiums', stadium_loc, stadium_csv)
+        if parquet:
+            pipeline.run_stage(
+                'save_stadiums_parquet',
+                {
+                    'stadiums': hash_file(stadium_loc),
+                    'code': hash_code(write_parquet)
+                },
+                [parquet_path(stadium_loc)],
+                lambda: stadium_collection.to_parquet(parquet_path(stadium_loc))
+            )
     ## calculate analytics ##
-    team_hfa, league_hfa = calc_analytics()
+    games_hash = hash_frame(games)
+    team_hfa_loc = '{0}/rolling_team_hfa'.format(data_loc)
+    analytics = {}
+    def run_analytics():
+        analytics['team_hfa'], analytics['league_hfa'] = calc_analytics(parquet=parquet)
+    analytics_outputs = [
+        team_hfa_loc, '{0}/rolling_league_hfa'.format(data_loc),
+        '{0}.csv'.format(team_hfa_loc), '{0}/rolling_league_hfa.csv'.format(data_loc)
+    ]
+    if parquet:
+        analytics_outputs += [
+            '{0}/rolling_team_hfa_parquet'.format(data_loc),
+            '{0}/rolling_league_hfa_parquet'.format(data_loc)
+        ]
+    with instrument.stage('calc_analytics'):
+        pipeline.run_stage(
+            'calc_analytics',
+            {
+                'games': games_hash,
+                'wt_ratings': hash_frame(data.db['wt_ratings']),
+                'elo_conf': hash_file('{0}/Analytics/Elo/conf.json'.format(
+                    pathlib.Path(__file__).parent.resolve()
+                )),
+                'code': hash_code(calc_analytics, EloModel, EloEngine, SeasonStore, write_parquet),
+                'parquet': str(parquet)
+            },
+            analytics_outputs,
+            run_analytics
+        )
     ## generate team stadiums ##
-    combos = gen_team_stadiums(stadium_collection, team_hfa)
-    
+    def run_team_stadiums():
+        ## analytics are read back from the last run if they were skipped ##
+        team_hfa = analytics['team_hfa'] if 'team_hfa' in analytics else SeasonStore(team_hfa_loc).read()
+        gen_team_stadiums(stadium_collection, team_hfa, output_loc=data_loc, parquet=parquet)
+    team_stadiums_outputs = ['{0}/team_stadiums.csv'.format(data_loc)]
+    if parquet:
+        team_stadiums_outputs.append('{0}/team_stadiums.parquet'.format(data_loc))
+    with instrument.stage('gen_team_stadiums'):
+        pipeline.run_stage(
+            'gen_team_stadiums',
+            {
+                'games': games_hash,
+                'stadiums': hash_file(stadium_loc),
+                'analytics': pipeline.output_hash('calc_analytics'),
+                'code': hash_code(gen_team_stadiums, write_parquet),
+                'parquet': str(parquet)
+            },
+            team_stadiums_outputs,
+            run_team_stadiums
+        )
+    ## generate game travel and rest features ##
+    game_travel_outputs = ['{0}/game_travel.csv'.format(data_loc)]
+    if parquet:
+        game_travel_outputs.append('{0}/game_travel.parquet'.format(data_loc))
+    with instrument.stage('gen_game_travel'):
+        pipeline.run_stage(
+            'gen_game_travel',
+            {
+                'games': games_hash,
+                'stadiums': hash_file(stadium_loc),
+                'code': hash_code(gen_game_travel, GeoIndex, StadiumCollection, write_parquet),
+                'parquet': str(parquet)
+            },
+            game_travel_outputs,
+            lambda: gen_game_travel(stadium_collection, games, output_loc=data_loc, parquet=parquet)
+        )
+    if len(pipeline.skipped) > 0:
+        print('Skipped unchanged stages: {0}'.format(', '.join(pipeline.skipped)))
@@ -2,4 +2,48 @@ import sys
 from stadiums import update_stadiums
 
 if sys.argv[1] == 'run':
-    update_stadiums()
+    ## --force reruns every stage and --parquet adds parquet outputs. Opt in
+    ## instrumentation with run --instrument [--profile <dir>] [--report <path>] ##
+    instrumented = '--instrument' in sys.argv
+    if instrumented:
+        from stadiums.Instrumentation import instrument
+        instrument.enable(
+            trace_memory='--no-memory' not in sys.argv,
+            profile_dir=sys.argv[sys.argv.index('--profile') + 1] if '--profile' in sys.argv else None
+        )
+    update_stadiums(
+        force_rerun='--force' in sys.argv,
+        parquet='--parquet' in sys.argv
+    )
+    if instrumented:
+        instrument.finish(
+            sys.argv[sys.argv.index('--report') + 1] if '--report' in sys.argv else None
+        )
+elif sys.argv[1] == 'bench':
+    from stadiums.Benchmarks import bench_elo
+    bench_elo()
+elif sys.argv[1] == 'bench_pipeline':
+    from stadiums.Benchmarks import bench_pipeline
+    bench_pipeline(output_path=sys.argv[2] if len(sys.argv) > 2 else None)
+elif sys.argv[1] == 'bench_compare':
+    from stadiums.Benchmarks import compare_results
+    compare_results(sys.argv[2], sys.argv[3])
+elif sys.argv[1] == 'bench_hfa':
+    from stadiums.Benchmarks import bench_hfa_query
+    bench_hfa_query()
+elif sys.argv[1] == 'sweep':
+    ## ie sweep k=10,20,30 b=1.8,2.2 or sweep k=10:40 z=350:450 --random 50 ##
+    from stadiums.Analytics.Elo import sweep_cli
+    sweep_cli(sys.argv[2:])
+elif sys.argv[1] == 'build_assets':
+    ## rebuild image variants and the asset manifest. --optimize-sources
+    ## losslessly recompresses the source pngs in place ##
+    from stadiums.AssetBuilder import AssetBuilder
+    AssetBuilder().build(
+        force='--force' in sys.argv,
+        optimize_sources='--optimize-sources' in sys.argv
+    )
+elif sys.argv[1] == 'build_bundle':
+    ## pack an image variant into a memory mappable bundle, ie build_bundle thumb ##
+    from stadiums.AssetBuilder import write_bundle
+    print('Wrote {0}'.format(write_bundle(sys.argv[2] if len(sys.argv) > 2 else 'webp')))